@@ -0,0 +1,260 @@
+"""
+Пакетное формирование отчётов вне очереди БД (например, выгрузки за квартал).
+
+Запуск:
+    python backfill.py specs.json --jobs 4 --output-dir ./reports
+    python backfill.py specs.csv --s3-path yandexapp_report_generator/backfill
+
+Формат JSON - список отчётов:
+    [{"name": "...", "app_id": "1234567", "app_name": "...", "yd_login": "...",
+      "date1": "2025-01-01", "date2": "2025-03-31", "output_formats": "xlsx,csv",
+      "campaigns": [["703986845", "Имя кампании", "Имя группы"], ...]}, ...]
+вместо "campaigns" можно указать "global_campaign_id" - кампании будут загружены из БД.
+
+Формат CSV - по строке на кампанию, строки с одинаковым name образуют один отчёт:
+    name,app_id,app_name,yd_login,date1,date2,output_formats,campaign_id,campaign_name,campaign_group
+(для отчёта по глобальной кампании вместо campaign_* заполняется колонка global_campaign_id).
+
+Необязательные поля: name (по-умолчанию порядковый номер), app_name (по-умолчанию app_id),
+output_formats (по-умолчанию xlsx), launch_event_label (метка события запуска приложения,
+по-умолчанию LAUNCH_EVENT_LABEL)
+"""
+import argparse
+import csv
+import json
+import logging
+import shutil
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from typing import BinaryIO
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from database.db import session_maker
+from database.models import GlobalCampaign, CampaignGroup
+from get_utm_tag.test_part2 import get_campaign_params
+from integrations.fact_store import FactStore, fact_store as default_fact_store
+from main import S3_PATH, create_report, get_report_filename, get_report_header, upload_report_to_s3
+from utils.data_export import OUTPUT_EXTENSIONS, parse_output_formats
+
+logging.basicConfig(level=logging.INFO, format='[{asctime}] #{levelname:4} {name}:{lineno} - {message}', style='{')
+logger = logging.getLogger('backfill.py')
+
+
+@dataclass
+class ReportSpec:
+    """
+    Параметры одного отчёта пакета
+    """
+    name: str
+    app_id: str
+    app_name: str
+    yd_login: str
+    date1: date
+    date2: date
+    output_formats: list[str]
+    # список кортежей: (campaign_id, campaign_name, campaign_group), ...
+    campaigns_data: list[tuple] = field(default_factory=list)
+    global_campaign_id: int | None = None
+    launch_event_label: str | None = None
+
+
+def _make_spec(index: int, data: dict, campaigns_data: list[tuple]) -> ReportSpec:
+    """
+    Проверка и приведение полей отчёта из файла спецификации
+    :param index: порядковый номер отчёта в файле
+    :param data: поля отчёта
+    :param campaigns_data: кампании ЯД отчёта
+    :return:
+    """
+    for key in ('app_id', 'yd_login', 'date1', 'date2'):
+        if not data.get(key):
+            raise ValueError(f'Отчёт {data.get("name") or index}: не заполнено поле {key}')
+
+    global_campaign_id = data.get('global_campaign_id')
+    if not campaigns_data and not global_campaign_id:
+        raise ValueError(f'Отчёт {data.get("name") or index}: не указаны кампании или global_campaign_id')
+
+    return ReportSpec(
+        name=str(data.get('name') or index),
+        app_id=str(data['app_id']),
+        app_name=str(data.get('app_name') or data['app_id']),
+        yd_login=str(data['yd_login']),
+        date1=date.fromisoformat(str(data['date1'])),
+        date2=date.fromisoformat(str(data['date2'])),
+        output_formats=parse_output_formats(data.get('output_formats')),
+        campaigns_data=campaigns_data,
+        global_campaign_id=int(global_campaign_id) if global_campaign_id else None,
+        launch_event_label=data.get('launch_event_label') or None,
+    )
+
+
+def load_specs(path: str) -> list[ReportSpec]:
+    """
+    Чтение файла спецификации пакета (JSON или CSV, по расширению файла)
+    :param path:
+    :return:
+    """
+    if path.lower().endswith('.csv'):
+        with open(path, encoding='utf-8-sig', newline='') as file:
+            rows = list(csv.DictReader(file))
+
+        # строки одного отчёта объединяются по имени (без имени - отчёт на строку)
+        reports: dict[str, tuple[dict, list[tuple]]] = {}
+        for index, row in enumerate(rows, start=1):
+            name = row.get('name') or str(index)
+            report, campaigns_data = reports.setdefault(name, (row, []))
+            if row.get('campaign_id'):
+                campaigns_data.append((row['campaign_id'].strip(), row.get('campaign_name') or row['campaign_id'],
+                                       row.get('campaign_group') or ''))
+        return [_make_spec(index, dict(report, name=name), campaigns_data)
+                for index, (name, (report, campaigns_data)) in enumerate(reports.items(), start=1)]
+
+    with open(path, encoding='utf-8') as file:
+        data = json.load(file)
+    return [_make_spec(index, report, [tuple(map(str, campaign)) for campaign in report.get('campaigns', [])])
+            for index, report in enumerate(data, start=1)]
+
+
+def load_global_campaigns(specs: list[ReportSpec]):
+    """
+    Загрузка кампаний ЯД из БД для отчётов, заданных глобальной кампанией
+    :param specs:
+    :return:
+    """
+    ids = {spec.global_campaign_id for spec in specs if spec.global_campaign_id and not spec.campaigns_data}
+    if not ids:
+        return
+
+    stmt = (
+        select(GlobalCampaign)
+        .where(GlobalCampaign.id.in_(ids))
+        .options(selectinload(GlobalCampaign.groups).selectinload(CampaignGroup.yd_campaigns))
+    )
+    with session_maker() as session:
+        campaigns_data = {global_campaign.id: global_campaign.get_campaigns_data()
+                          for global_campaign in session.execute(stmt).scalars()}
+
+    for spec in specs:
+        if spec.global_campaign_id and not spec.campaigns_data:
+            if spec.global_campaign_id not in campaigns_data:
+                raise ValueError(f'Отчёт {spec.name}: глобальная кампания {spec.global_campaign_id} не найдена')
+            spec.campaigns_data = campaigns_data[spec.global_campaign_id]
+
+
+def resolve_url_params(specs: list[ReportSpec], fact_store: FactStore | None) -> dict[str, dict[str, str | None]]:
+    """
+    Однократное получение параметров отслеживания всех кампаний пакета (по логину ЯД),
+    чтобы отчёты с общими кампаниями не запрашивали их повторно
+    :param specs:
+    :param fact_store: хранилище фактов с кэшем параметров отслеживания
+    :return: словарь {yd_login: {campaign_id: параметры отслеживания}}
+    """
+    campaign_ids_by_login: dict[str, list[str]] = {}
+    for spec in specs:
+        login_ids = campaign_ids_by_login.setdefault(spec.yd_login, [])
+        login_ids.extend(campaign_id for campaign_id, _, _ in spec.campaigns_data if campaign_id not in login_ids)
+
+    result = {}
+    for yd_login, campaign_ids in campaign_ids_by_login.items():
+        url_params = fact_store.load_url_params(yd_login, campaign_ids) if fact_store else {}
+        missing_campaign_ids = [campaign_id for campaign_id in campaign_ids if campaign_id not in url_params]
+        if missing_campaign_ids:
+            logger.info(f'Получаю параметры отслеживания {len(missing_campaign_ids)} кампаний ({yd_login})...')
+            missing_url_params = get_campaign_params(missing_campaign_ids, yd_login)
+            if fact_store:
+                fact_store.save_url_params(yd_login, missing_url_params)
+            url_params.update(missing_url_params)
+        result[yd_login] = url_params
+    return result
+
+
+def save_report_locally(files: dict[str, BinaryIO], report_name: str, output_dir: Path) -> str:
+    """
+    Сохранение файлов отчёта в локальный каталог (аналог upload_report_to_s3)
+    :param files: словарь {формат: файл}, первый формат - основной
+    :param report_name:
+    :param output_dir:
+    :return: путь к файлу основного формата
+    """
+    filename = get_report_filename(report_name)
+
+    filepaths = []
+    for output_format, file in files.items():
+        filepath = output_dir / (filename + OUTPUT_EXTENSIONS[output_format])
+        with open(filepath, 'wb') as output_file:
+            shutil.copyfileobj(file, output_file)
+        filepaths.append(str(filepath))
+    return filepaths[0]
+
+
+def run_report(spec: ReportSpec, url_params: dict[str, str | None], fact_store: FactStore | None,
+               output_dir: Path | None, s3_path: str) -> str:
+    """
+    Формирование и сохранение одного отчёта пакета
+    :param spec:
+    :param url_params: параметры отслеживания кампаний логина ЯД отчёта
+    :param fact_store:
+    :param output_dir: локальный каталог (None - загрузка в S3)
+    :param s3_path: каталог в S3-хранилище
+    :return: путь к файлу основного формата
+    """
+    header = get_report_header(spec.app_name, spec.date1, spec.date2)
+    logger.info(f'Отчёт {spec.name}: формирование...')
+    files = create_report(spec.app_id, str(spec.date1), str(spec.date2), spec.campaigns_data, spec.yd_login,
+                          header, spec.output_formats, fact_store=fact_store, url_params=url_params,
+                          launch_event_label=spec.launch_event_label)
+    try:
+        if output_dir:
+            return save_report_locally(files, header, output_dir)
+        return upload_report_to_s3(files, header, s3_path)
+    finally:
+        for file in files.values():
+            file.close()
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Пакетное формирование отчётов по файлу спецификации')
+    parser.add_argument('spec', help='файл спецификации отчётов (.json или .csv)')
+    parser.add_argument('-j', '--jobs', type=int, default=4, help='количество параллельно формируемых отчётов')
+    parser.add_argument('-o', '--output-dir', help='локальный каталог для отчётов (по-умолчанию - загрузка в S3)')
+    parser.add_argument('--s3-path', default=S3_PATH, help='каталог в S3-хранилище')
+    parser.add_argument('--fact-store', help='каталог хранилища фактов (по-умолчанию FACT_STORE_DIR)')
+    args = parser.parse_args(argv)
+
+    specs = load_specs(args.spec)
+    load_global_campaigns(specs)
+    logger.info(f'Отчётов в пакете: {len(specs)}.')
+
+    # хранилище фактов и параметры отслеживания кампаний общие для всех отчётов пакета
+    fact_store = FactStore(args.fact_store) if args.fact_store else default_fact_store
+    url_params = resolve_url_params(specs, fact_store)
+
+    output_dir = None
+    if args.output_dir:
+        output_dir = Path(args.output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {executor.submit(run_report, spec, url_params[spec.yd_login], fact_store, output_dir,
+                                   args.s3_path): spec for spec in specs}
+        for future in as_completed(futures):
+            spec = futures[future]
+            try:
+                logger.info(f'Отчёт {spec.name}: готов - {future.result()}')
+            except Exception:
+                failed += 1
+                logger.error(f'Отчёт {spec.name}: ошибка формирования\n{traceback.format_exc()}')
+
+    logger.info(f'Пакет обработан: успешно - {len(specs) - failed}, с ошибкой - {failed}.')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""
+Микро-бенчмарк обработки данных AppMetrica (integrations/aggregations.py) без запросов к API.
+Входные данные - синтетические ответы API (benchmarks/synthetic.py), прочитанные так же, как в YandexAppAPI
+(get_data - целиком, iter_data - частями). Для каждого шага замеряется лучшее время из --repeat запусков,
+результат сравнивается с эталоном из benchmarks/golden/aggregations/<размер>/<шаг>.csv
+
+Запуск (из корня проекта):
+    python -m benchmarks.aggregations                       # все размеры
+    python -m benchmarks.aggregations -c xs s m --repeat 5 --json results.json
+    python -m benchmarks.aggregations --update-golden       # перезапись эталонов (только при намеренном
+                                                            # изменении результатов обработки)
+
+Код завершения 1 - результат хотя бы одного шага отличается от эталона или эталон отсутствует
+"""
+import argparse
+import io
+import json
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+from benchmarks.synthetic import SyntheticConfig, appmetrica_csv, date_range
+from integrations.aggregations import (
+    LAUNCH_EVENT_LABEL,
+    summarize_sessions,
+    build_events_stats,
+    build_all_campaigns,
+    build_campaign_groups,
+    build_week_distribution,
+    build_installs_breakdown,
+)
+from integrations.frame_utils import TOTAL_LABEL
+
+GOLDEN_DIR = Path(__file__).resolve().parent / 'golden' / 'aggregations'
+URL_PARAMETER = 'utm_campaign'
+CAMPAIGN_FILTER = 'ym:ts:urlParameter'
+
+
+@dataclass
+class Case:
+    # строк в ответе с сессиями (строк с событиями устройств - вдвое больше)
+    sessions: int
+    campaigns: int
+    days: int
+    # количество городов и моделей устройств
+    cities: int
+
+
+CASES = {
+    'xs': Case(sessions=10, campaigns=1, days=7, cities=5),
+    's': Case(sessions=1_000, campaigns=10, days=30, cities=50),
+    'm': Case(sessions=100_000, campaigns=100, days=90, cities=1000),
+    'l': Case(sessions=1_000_000, campaigns=1000, days=90, cities=5000),
+}
+
+
+class Inputs:
+    """
+    Синтетические ответы API для одного размера в том виде, в котором их получает обработка
+    """
+
+    def __init__(self, case: Case, chunk_rows: int):
+        self.config = SyntheticConfig(sessions=case.sessions, events=case.sessions * 2, cities=case.cities)
+        self.chunk_rows = chunk_rows
+        start_date, end_date = date_range(case.days)
+        self.campaign_ids = [str(700000000 + i) for i in range(case.campaigns)]
+        groups = max(1, case.campaigns // 10)
+        self.campaigns_data = pd.DataFrame(
+            [(campaign_id, f'Кампания {i}', f'Группа {i % groups}') for i, campaign_id in enumerate(self.campaign_ids)],
+            columns=['campaign_id', 'campaign_name', 'campaign_group'])
+        self.query = {
+            'date1': str(start_date),
+            'date2': str(end_date),
+            'filters': ' OR '.join(f"{CAMPAIGN_FILTER}{{'{URL_PARAMETER}'}}=={campaign_id}"
+                                   for campaign_id in self.campaign_ids),
+        }
+
+        self.general = self.get_data('ym:ts:userClicks,ym:ts:advInstallDevices,ym:ts:clickToInstallConversion',
+                                     f"ym:ts:urlParameter{{'{URL_PARAMETER}'}}")
+        self.sessions_chunks = self.iter_data('ym:s:sessions,ym:s:totalSessionDurationPerUser',
+                                              f"ym:s:profileUrlParameter{{'{URL_PARAMETER}'}},ym:s:session")
+        self.events, self.active_users = self.get_events_data()
+        self.installs_by_time = self.get_data('ym:i:advInstallDevices', 'ym:i:dateTime')
+        self.sessions_by_time = self.get_data('ym:s:sessions', 'ym:s:dateTime')
+        self.installs_by_region = self.get_data('ym:i:advInstallDevices', 'ym:i:regionCity')
+        self.installs_by_oc = self.get_data('ym:i:advInstallDevices', 'ym:i:operatingSystem')
+        self.installs_by_brand = self.get_data('ym:i:advInstallDevices', 'ym:i:mobileDeviceModel')
+
+    def _csv(self, metrics: str, dimensions: str) -> io.BytesIO:
+        return io.BytesIO(appmetrica_csv(dict(self.query, metrics=metrics, dimensions=dimensions), self.config))
+
+    def get_data(self, metrics: str, dimensions: str) -> pd.DataFrame:
+        """
+        Ответ целиком (как YandexAppAPI.get_data)
+        """
+        return pd.read_csv(self._csv(metrics, dimensions)).fillna(0)
+
+    def get_events_data(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Ответы с количеством событий и устройств с событием запуска по кампаниям, полученные из одного ответа
+        по событиям устройств (кампания, устройство, метка события): результаты build_events_stats можно
+        сравнивать с прежним расчётом на стороне клиента по тем же данным
+        """
+        dimensions = f"ym:ce2:profileUrlParameter{{'{URL_PARAMETER}'}},ym:ce2:device,ym:ce2:eventLabel"
+        events = pd.read_csv(self._csv('ym:ce2:allEvents', dimensions), dtype={i: str for i in range(3)}).fillna(0)
+        events.columns = ['campaign_id', 'device', 'event', 'events_count']
+
+        # ответ с группировкой только по кампании, строка итогов - первая
+        events_df = events.groupby('campaign_id', sort=False)['events_count'].sum().reset_index()
+        launches = events[(events['event'] == LAUNCH_EVENT_LABEL) & (events['events_count'] > 0)]
+        active_users_df = launches.groupby('campaign_id', sort=False).size().reset_index(name='devices')
+        active_users_df = pd.concat([pd.DataFrame({'campaign_id': [TOTAL_LABEL],
+                                                   'devices': [active_users_df['devices'].sum()]}),
+                                     active_users_df], ignore_index=True)
+        return events_df, active_users_df
+
+    def iter_data(self, metrics: str, dimensions: str) -> list[pd.DataFrame]:
+        """
+        Ответ частями по chunk_rows строк без второй группировки (как AsyncYandexAppAPI.aggregate_chunks)
+        """
+        dimensions_count = len(dimensions.split(','))
+        chunks = pd.read_csv(self._csv(metrics, dimensions), usecols=[0, 2, 3], chunksize=self.chunk_rows,
+                             dtype={i: str for i in range(dimensions_count)})
+        return [chunk.fillna(0) for chunk in chunks]
+
+
+def get_steps(inputs: Inputs) -> dict[str, tuple[int, Callable[[], pd.DataFrame]]]:
+    """
+    Шаги обработки: {имя: (количество входных строк, функция)}. Шаги, которым нужны результаты
+    предыдущих шагов, получают их заранее вычисленными (время предыдущих шагов не учитывается)
+    """
+    sessions_stats = summarize_sessions(inputs.sessions_chunks)
+    total_events, active_users = build_events_stats(inputs.events, inputs.active_users)
+    general = build_all_campaigns(inputs.campaigns_data, inputs.general, sessions_stats, total_events, active_users)
+
+    def rows(*frames: pd.DataFrame) -> int:
+        return sum(len(frame) for frame in frames)
+
+    return {
+        'sessions_stats': (rows(*inputs.sessions_chunks), lambda: summarize_sessions(inputs.sessions_chunks)),
+        'events_count': (rows(inputs.events), lambda: build_events_stats(inputs.events, inputs.active_users)[0]),
+        'active_users': (rows(inputs.active_users),
+                         lambda: build_events_stats(inputs.events, inputs.active_users)[1]),
+        'all_campaigns': (rows(inputs.general, sessions_stats, total_events, active_users),
+                          lambda: build_all_campaigns(inputs.campaigns_data, inputs.general, sessions_stats,
+                                                      total_events, active_users)),
+        'campaign_groups': (rows(general), lambda: build_campaign_groups(inputs.campaigns_data, general)),
+        'week_distribution': (rows(inputs.installs_by_time, inputs.sessions_by_time),
+                              lambda: build_week_distribution(inputs.installs_by_time, inputs.sessions_by_time)),
+        'installs_by_regions': (rows(inputs.installs_by_region),
+                                lambda: build_installs_breakdown(inputs.installs_by_region, 'city', 100)),
+        'installs_by_oc': (rows(inputs.installs_by_oc),
+                           lambda: build_installs_breakdown(inputs.installs_by_oc, 'oc', 0)),
+        'installs_by_brand': (rows(inputs.installs_by_brand),
+                              lambda: build_installs_breakdown(inputs.installs_by_brand, 'device_type', 100)),
+    }
+
+
+def _normalize(data: str) -> pd.DataFrame:
+    """
+    DataFrame после записи в csv и чтения: эталон и результат сравниваются в одинаковом представлении
+    """
+    try:
+        return pd.read_csv(io.StringIO(data))
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+
+
+def check_golden(case_name: str, step: str, result: pd.DataFrame, rtol: float, update: bool) -> str:
+    """
+    Сравнение результата шага с эталоном (или запись эталона)
+    :return: ok, updated, missing или mismatch
+    """
+    path = GOLDEN_DIR / case_name / f'{step}.csv'
+    data = result.to_csv(index=False)
+    if update:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(data, encoding='utf-8')
+        return 'updated'
+    if not path.exists():
+        return 'missing'
+    try:
+        pd.testing.assert_frame_equal(_normalize(data), _normalize(path.read_text(encoding='utf-8')),
+                                      check_dtype=False, check_exact=False, rtol=rtol)
+    except AssertionError as e:
+        print(f'{case_name}/{step}: результат отличается от эталона\n{e}', file=sys.stderr)
+        return 'mismatch'
+    return 'ok'
+
+
+def run_case(case_name: str, repeat: int, chunk_rows: int, rtol: float, update_golden: bool) -> list[dict]:
+    inputs = Inputs(CASES[case_name], chunk_rows)
+    results = []
+    for step, (rows, func) in get_steps(inputs).items():
+        timings = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start_time)
+        seconds = min(timings)
+        results.append({
+            'case': case_name,
+            'step': step,
+            'rows': rows,
+            'seconds': round(seconds, 6),
+            'rows_per_second': round(rows / seconds) if seconds else None,
+            'golden': check_golden(case_name, step, result, rtol, update_golden),
+        })
+    return results
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Микро-бенчмарк обработки данных AppMetrica')
+    parser.add_argument('-c', '--case', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=3, help='количество запусков каждого шага (лучшее время)')
+    parser.add_argument('--chunk-rows', type=int, default=500000, help='размер части ответа (SPILL_CHUNK_ROWS)')
+    parser.add_argument('--rtol', type=float, default=1e-9, help='допустимое относительное отличие от эталона')
+    parser.add_argument('--update-golden', action='store_true', help='перезаписать эталоны')
+    parser.add_argument('--json', help='файл для сохранения результатов')
+    args = parser.parse_args(argv)
+
+    results = []
+    for case_name in args.case:
+        for result in run_case(case_name, args.repeat, args.chunk_rows, args.rtol, args.update_golden):
+            results.append(result)
+            print(f"{result['case']:>3} {result['step']:<20} {result['rows']:>9} строк "
+                  f"{result['seconds']:>10.4f} с {result['rows_per_second'] or '-':>12} строк/с  {result['golden']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+
+    return 0 if all(result['golden'] in ('ok', 'updated') for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Локальные HTTP-серверы, заменяющие внешние сервисы в бенчмарках:
+- API AppMetrica (stat/v1/data.csv и v2/user/acquisition.csv) с синтетическими ответами заданного размера
+- API Яндекс.Директ (campaigns, ads, web-api)
+- S3-совместимое хранилище (приёмник загрузок, в том числе multipart, и чтение объектов)
+Каждый сервер работает в фоновом потоке и считает количество запросов и переданных байт
+"""
+import json
+import re
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from benchmarks.synthetic import SyntheticConfig, appmetrica_csv, direct_ads, direct_campaigns
+
+S3_NAMESPACE = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+class FakeServer:
+    """
+    HTTP-сервер в фоновом потоке на свободном порту localhost
+    """
+
+    def __init__(self, handler_class: type[BaseHTTPRequestHandler]):
+        self.requests_count = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+
+        # обработчику доступен сервер (счётчики и состояние) через self.server.fake
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+        self.httpd.fake = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def address(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'{host}:{port}'
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.address}'
+
+    def count(self, received: int = 0, sent: int = 0):
+        with self._lock:
+            self.requests_count += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests_count = self.bytes_sent = self.bytes_received = 0
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class BaseHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def respond(self, status: int, body: bytes = b'', content_type: str = 'application/octet-stream',
+                headers: dict = None, received: int = 0):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+        self.fake.count(received, len(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AppMetricaHandler(BaseHandler):
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if not parsed.path.endswith(('/stat/v1/data.csv', '/v2/user/acquisition.csv')):
+            self.respond(404)
+            return
+
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        self.respond(200, appmetrica_csv(query, self.fake.config), 'text/csv; charset=utf-8')
+
+
+class DirectHandler(BaseHandler):
+    def do_POST(self):
+        body = self.read_body()
+        request_data = json.loads(body or b'{}')
+        if self.path.endswith('/campaigns'):
+            response = direct_campaigns(request_data)
+        elif self.path.endswith('/ads'):
+            response = direct_ads(request_data)
+        else:
+            self.respond(404, received=len(body))
+            return
+        self.respond(200, json.dumps(response).encode('utf-8'), 'application/json', received=len(body))
+
+    def do_GET(self):
+        # web-api мастера кампаний: параметры отслеживания уже получены через API
+        self.respond(200, b'{}', 'application/json')
+
+
+class S3Handler(BaseHandler):
+    """
+    Минимальная реализация S3 API для клиента minio: регион корзины, чтение объекта,
+    загрузка одним запросом и multipart-загрузка
+    """
+
+    def _split_path(self) -> tuple[str, str, dict]:
+        parsed = urlparse(self.path)
+        bucket, _, key = parsed.path.lstrip('/').partition('/')
+        return bucket, key, parse_qs(parsed.query, keep_blank_values=True)
+
+    def _xml(self, status: int, root: str, content: str = '', received: int = 0):
+        body = f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns="{S3_NAMESPACE}">{content}</{root}>'
+        self.respond(status, body.encode('utf-8'), 'application/xml', received=received)
+
+    def do_GET(self):
+        bucket, key, query = self._split_path()
+        if 'location' in query:
+            self._xml(200, 'LocationConstraint')
+        elif key in self.fake.objects:
+            self.respond(200, self.fake.objects[key], headers={'ETag': '"0"'})
+        else:
+            self._xml(404, 'Error', f'<Code>NoSuchKey</Code><Key>{key}</Key><BucketName>{bucket}</BucketName>')
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_PUT(self):
+        bucket, key, query = self._split_path()
+        body = self.read_body()
+        etag = f'"{uuid.uuid4().hex}"'
+        if 'uploadId' in query:
+            self.fake.uploads[query['uploadId'][0]][int(query['partNumber'][0])] = body
+        else:
+            self.fake.objects[key] = body
+        self.respond(200, headers={'ETag': etag}, received=len(body))
+
+    def do_POST(self):
+        bucket, key, query = self._split_path()
+        body = self.read_body()
+        if 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            self.fake.uploads[upload_id] = {}
+            self._xml(200, 'InitiateMultipartUploadResult',
+                      f'<Bucket>{bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>',
+                      received=len(body))
+        elif 'uploadId' in query:
+            parts = self.fake.uploads.pop(query['uploadId'][0])
+            self.fake.objects[key] = b''.join(parts[number] for number in sorted(parts))
+            self._xml(200, 'CompleteMultipartUploadResult',
+                      f'<Location>{self.fake.url}/{bucket}/{key}</Location><Bucket>{bucket}</Bucket>'
+                      f'<Key>{key}</Key><ETag>"{uuid.uuid4().hex}"</ETag>', received=len(body))
+        else:
+            self.respond(400, received=len(body))
+
+    def do_DELETE(self):
+        bucket, key, query = self._split_path()
+        if 'uploadId' in query:
+            self.fake.uploads.pop(query['uploadId'][0], None)
+        else:
+            self.fake.objects.pop(key, None)
+        self.respond(204)
+
+
+def start_appmetrica(config: SyntheticConfig) -> FakeServer:
+    server = FakeServer(AppMetricaHandler)
+    server.config = config
+    return server
+
+
+def start_direct() -> FakeServer:
+    return FakeServer(DirectHandler)
+
+
+def start_s3(objects: dict[str, bytes] = None) -> FakeServer:
+    """
+    :param objects: начальные объекты {ключ: содержимое} (например, cookies для get_utm_tag)
+    :return:
+    """
+    server = FakeServer(S3Handler)
+    server.objects = dict(objects or {})
+    server.uploads = {}
+    return server
+
+
+def uploaded_size(server: FakeServer, prefix: str = '', pattern: str = None) -> int:
+    """
+    Суммарный размер объектов в хранилище с ключами, начинающимися с prefix
+    :param server: сервер S3
+    :param prefix:
+    :param pattern: дополнительное регулярное выражение для ключей
+    :return:
+    """
+    return sum(len(data) for key, data in server.objects.items()
+               if key.startswith(prefix) and (pattern is None or re.search(pattern, key)))
@@ -0,0 +1,119 @@
+"""
+Проверка планировщика запросов (integrations/query_planner.py) на локальной замене AppMetrica: наборы данных,
+полученные из общего запроса (установки) и из ответа с сессиями листа "Все кампании" (сессии по времени),
+сравниваются с запрошенными по отдельности (plan_queries=False).
+Проверяется без хранилища фактов и с ним (повторный запуск - из сохранённых дней), а также с ограничением
+количества строк ответа, которого достигает общий ответ (наборы должны быть запрошены по отдельности)
+
+Запуск (из корня проекта):
+    python -m benchmarks.query_planner
+    python -m benchmarks.query_planner --days 60 --cities 300 --sessions 5000 --limit 500
+
+Код завершения 1 - хотя бы один набор данных отличается от запрошенного отдельно
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+from benchmarks.fake_servers import start_appmetrica
+from benchmarks.synthetic import SyntheticConfig, date_range
+
+CAMPAIGNS = 10
+
+
+def normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Ответ без учёта порядка строк и типов колонок группировок (для сравнения)
+    """
+    df = df.copy()
+    dimensions = list(df.columns[:-1])
+    df[dimensions] = df[dimensions].astype(str)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+async def fetch_datasets(server_url: str, days: int, plan_queries: bool, row_limit: int | None,
+                         fact_store_dir: str | None) -> tuple[list[pd.DataFrame], int]:
+    """
+    Наборы данных планировщика (INSTALLS_DATASETS, SESSIONS_BY_TIME_DATASET) за период
+    :return: наборы данных и количество запросов к API
+    """
+    # настройки читаются при импорте, поэтому модули клиента импортируются после подготовки окружения
+    from integrations.fact_store import FactStore
+    from integrations.yapp_async_api import AsyncYandexAppAPI, INSTALLS_DATASETS, SESSIONS_BY_TIME_DATASET
+
+    date1, date2 = date_range(days)
+    campaign_ids = [str(700000000 + i) for i in range(CAMPAIGNS)]
+    campaigns_data = [(campaign_id, f'Кампания {i}', '') for i, campaign_id in enumerate(campaign_ids)]
+    # два url-параметра: ответ содержит по строке итогов на каждый
+    url_params = {campaign_id: None if i % 2 else 'utm_content={campaign_id}'
+                  for i, campaign_id in enumerate(campaign_ids)}
+    fact_store = FactStore(fact_store_dir) if fact_store_dir else None
+
+    async with AsyncYandexAppAPI('token', '1', str(date1), str(date2), campaigns_data, 'login', fact_store=fact_store,
+                                 url_params=url_params, plan_queries=plan_queries, row_limit=row_limit) as api:
+        api.api_url = f'{server_url}/stat/v1/data.csv'
+        # сессии листа "Все кампании" запрашиваются в обоих случаях, как при формировании отчёта
+        await api._get_sessions_stats()
+        frames = await asyncio.gather(*(
+            api.get_data(dataset.metrics, dataset.dimensions, dataset.filter_label, dataset.url,
+                         dataset.date_dimension, dataset.extra_filters)
+            for dataset in [*INSTALLS_DATASETS, SESSIONS_BY_TIME_DATASET]
+        ))
+        return list(frames), api.requests_count
+
+
+def run_check(config: SyntheticConfig, days: int, row_limit: int | None, use_fact_store: bool) -> bool:
+    """
+    Сравнение наборов данных из общего запроса с запрошенными по отдельности
+    :return: True, если все наборы совпадают
+    """
+    server = start_appmetrica(config)
+    name = f"limit={row_limit or '-'}, хранилище фактов={'да' if use_fact_store else 'нет'}"
+    try:
+        with tempfile.TemporaryDirectory() as planned_dir, tempfile.TemporaryDirectory() as separate_dir:
+            ok = True
+            # с хранилищем фактов второй проход собирается из сохранённых дней
+            for attempt in range(2 if use_fact_store else 1):
+                planned, planned_requests = asyncio.run(fetch_datasets(
+                    server.url, days, True, row_limit, planned_dir if use_fact_store else None))
+                separate, separate_requests = asyncio.run(fetch_datasets(
+                    server.url, days, False, row_limit, separate_dir if use_fact_store else None))
+
+                mismatches = []
+                for planned_df, separate_df in zip(planned, separate):
+                    try:
+                        pd.testing.assert_frame_equal(normalize(planned_df), normalize(separate_df),
+                                                      check_dtype=False)
+                    except AssertionError:
+                        mismatches.append(separate_df.columns[0])
+                ok = ok and not mismatches
+                print(f'{name}, проход {attempt + 1}: запросов {planned_requests} (по отдельности - '
+                      f'{separate_requests}), {"отличаются: " + ", ".join(mismatches) if mismatches else "ok"}')
+            return ok
+    finally:
+        server.stop()
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Проверка планировщика запросов AppMetrica')
+    parser.add_argument('--days', type=int, default=30, help='длина периода отчёта в днях')
+    parser.add_argument('--cities', type=int, default=100, help='количество городов и моделей устройств')
+    parser.add_argument('--installs-per-day', type=int, default=1000)
+    parser.add_argument('--sessions', type=int, default=1000, help='количество сессий в ответе')
+    parser.add_argument('--limit', type=int, default=200,
+                        help='ограничение количества строк ответа, которого достигает общий ответ')
+    args = parser.parse_args(argv)
+
+    os.environ['APPMETRICA_RATE_LIMIT'] = '0'
+    config = SyntheticConfig(sessions=args.sessions, cities=args.cities, installs_per_day=args.installs_per_day)
+    results = [run_check(config, args.days, row_limit, use_fact_store)
+               for row_limit in (None, args.limit) for use_fact_store in (False, True)]
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+Генераторы синтетических данных для бенчмарков: ответы API AppMetrica (csv) и Яндекс.Директ (json)
+заданного размера. Данные детерминированы (зависят только от параметров и seed)
+"""
+import re
+import zlib
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from integrations.frame_utils import TOTAL_LABEL
+
+# метки событий; первая - событие запуска приложения, по которому считаются активные пользователи
+EVENT_LABELS = ['Запуск приложения и отображение экрана заставки.'] + [f'Событие {i}' for i in range(1, 50)]
+OPERATING_SYSTEMS = ['android', 'iOS', 'Windows']
+# группировки установок (см. _installs_frame)
+INSTALLS_DIMENSIONS = ('ym:i:regionCity', 'ym:i:operatingSystem', 'ym:i:mobileDeviceModel', 'ym:i:dateTime',
+                       'ym:i:date')
+# группировки сессий по времени (ответы - количества строк с сессиями, см. appmetrica_frame)
+SESSIONS_TIME_DIMENSIONS = ('ym:s:dateTime', 'ym:s:date')
+
+
+@dataclass
+class SyntheticConfig:
+    """
+    Размер синтетических ответов AppMetrica (на один запрос)
+    """
+    # количество строк с сессиями (группировка ym:s:session)
+    sessions: int = 10000
+    # количество строк с событиями (группировка по устройству и событию)
+    events: int = 20000
+    # количество городов и моделей устройств
+    cities: int = 100
+    # количество установок в день (ответы с группировками ym:i - суммы по одним и тем же установкам)
+    installs_per_day: int = 1000
+    seed: int = 0
+
+
+def get_filter_campaign_ids(filters: str) -> list[str]:
+    """
+    Id кампаний из фильтра запроса (вида ym:ts:urlParameter{'utm_campaign'}==123 OR ..., возможно в скобках
+    и с дополнительным условием через AND)
+    :param filters:
+    :return:
+    """
+    return re.findall(r"==([^\s')]+)", filters or '') or ['0']
+
+
+def _rows_count(names: list[str], campaigns_count: int, days: int, config: SyntheticConfig) -> int:
+    if 'ym:s:session' in names:
+        return config.sessions
+    if 'ym:ce2:device' in names:
+        return config.events
+    if any(name.endswith('dateTime') for name in names):
+        return days * 24
+    if names[0] in ('ym:i:regionCity', 'ym:i:mobileDeviceModel'):
+        return config.cities
+    if names[0] == 'ym:i:operatingSystem':
+        return len(OPERATING_SYSTEMS)
+    if names[0] == 'ym:ce2:eventLabel':
+        return len(EVENT_LABELS)
+    # группировка только по кампаниям
+    return campaigns_count
+
+
+def _dimension_column(name: str, index: np.ndarray, campaign_ids: list[str], date1: date,
+                      days: int, datetimes: pd.Series | None) -> np.ndarray | pd.Series:
+    if 'rlParameter' in name:
+        return np.array(campaign_ids, dtype=object)[index % len(campaign_ids)]
+    if name == 'ym:s:session':
+        return index.astype(str)
+    if name == 'ym:ce2:device':
+        return (index // 3).astype(str)
+    if name == 'ym:ce2:eventLabel':
+        return np.array(EVENT_LABELS, dtype=object)[index % len(EVENT_LABELS)]
+    if name.endswith('dateTime'):
+        return datetimes.dt.strftime('%Y-%m-%d %H:%M:%S')
+    if name.endswith(':date'):
+        if datetimes is not None:
+            return datetimes.dt.strftime('%Y-%m-%d')
+        return (pd.Timestamp(date1) + pd.to_timedelta(index % days, unit='D')).strftime('%Y-%m-%d')
+    if name == 'ym:i:regionCity':
+        return np.char.add('Город ', index.astype(str))
+    if name == 'ym:i:operatingSystem':
+        return np.array(OPERATING_SYSTEMS, dtype=object)[index % len(OPERATING_SYSTEMS)]
+    if name == 'ym:i:mobileDeviceModel':
+        return np.char.add('Модель ', index.astype(str))
+    return np.char.add('v', index.astype(str))
+
+
+def _metric_column(metric: str, names: list[str], rows: int, rng: np.random.Generator) -> np.ndarray:
+    if metric == 'ym:s:sessions' and 'ym:s:session' in names:
+        return np.ones(rows, dtype=int)
+    if metric == 'ym:s:totalSessionDurationPerUser':
+        return rng.integers(0, 120, rows)
+    if metric.endswith('Percentage') or metric.endswith('Percent') or metric.endswith('Conversion'):
+        return rng.uniform(0, 100, rows).round(2)
+    if metric == 'ym:ce2:eventsPerDevice':
+        return rng.uniform(1, 10, rows).round(2)
+    return rng.integers(0, 1000, rows)
+
+
+def _installs_frame(names: list[str], date1: date, days: int, config: SyntheticConfig) -> pd.DataFrame:
+    """
+    Установки за период (по строке на установку): данные дня зависят только от даты и seed, поэтому
+    ответы с разными группировками ym:i (и за разные периоды) согласованы между собой
+    :param names: группировки ym:i
+    :return: DataFrame с колонками names
+    """
+    parts = []
+    for day in (date1 + timedelta(days=i) for i in range(days)):
+        rng = np.random.default_rng(zlib.crc32(f'installs|{day.isoformat()}|{config.seed}'.encode('utf-8')))
+        rows = config.installs_per_day
+        systems = np.array(OPERATING_SYSTEMS, dtype=object)
+        values = {
+            'ym:i:regionCity': np.char.add('Город ', rng.integers(0, config.cities, rows).astype(str)),
+            'ym:i:operatingSystem': systems[rng.integers(0, len(systems), rows)],
+            'ym:i:mobileDeviceModel': np.char.add('Модель ', rng.integers(0, config.cities, rows).astype(str)),
+            'ym:i:dateTime': (pd.Timestamp(day) + pd.to_timedelta(rng.integers(0, 86400, rows), unit='s')).strftime(
+                '%Y-%m-%d %H:%M:%S'),
+            'ym:i:date': np.full(rows, day.isoformat(), dtype=object),
+        }
+        parts.append(pd.DataFrame({name: values[name] for name in names}))
+    return pd.concat(parts, ignore_index=True)
+
+
+def appmetrica_frame(query: dict, config: SyntheticConfig) -> pd.DataFrame:
+    """
+    Синтетический ответ API AppMetrica (stat/v1/data и v2/user/acquisition) для параметров запроса
+    :param query: параметры запроса (metrics, dimensions, filters, date1, date2, limit)
+    :param config: размер ответа
+    :return: DataFrame в формате csv-ответа (со строкой итогов по всем строкам, строк данных - не больше limit)
+    """
+    dimensions = query['dimensions'].split(',')
+    names = [dimension.split('{')[0] for dimension in dimensions]
+    metrics = query['metrics'].split(',')
+    campaign_ids = get_filter_campaign_ids(query.get('filters'))
+
+    date1 = date.fromisoformat(query['date1'])
+    days = (date.fromisoformat(query['date2']) - date1).days + 1
+
+    if all(name in INSTALLS_DIMENSIONS for name in names):
+        # установки: метрики - количество установок по группировкам
+        counts = _installs_frame(names, date1, days, config).groupby(names).size()
+        df = counts.index.to_frame(index=False)
+        df.columns = dimensions
+        for metric in metrics:
+            df[metric] = counts.to_numpy()
+        return _with_totals(df, dimensions, metrics, query)
+
+    if all(name in SESSIONS_TIME_DIMENSIONS for name in names) and metrics == ['ym:s:sessions']:
+        # сессии по времени: количества строк ответа с группировкой ym:s:session (время сессии зависит
+        # только от её номера), поэтому ответы согласованы с ответами по сессиям
+        index = np.arange(config.sessions)
+        sessions = pd.DataFrame({dimension: _dimension_column(name, index, campaign_ids, date1, days,
+                                                              _hourly_datetimes(index, date1, days))
+                                 for dimension, name in zip(dimensions, names)})
+        counts = sessions.groupby(dimensions, sort=False).size()
+        df = counts.index.to_frame(index=False)
+        df.columns = dimensions
+        df[metrics[0]] = counts.to_numpy()
+        return _with_totals(df, dimensions, metrics, query)
+
+    rows = _rows_count(names, len(campaign_ids), days, config)
+    index = np.arange(rows)
+    datetimes = None
+    if any(name.endswith('dateTime') for name in names):
+        datetimes = _hourly_datetimes(index, date1, days)
+
+    seed = zlib.crc32(f"{query['dimensions']}|{query['metrics']}|{config.seed}".encode('utf-8'))
+    rng = np.random.default_rng(seed)
+
+    data = {dimension: _dimension_column(name, index, campaign_ids, date1, days, datetimes)
+            for dimension, name in zip(dimensions, names)}
+    data.update({metric: _metric_column(metric, names, rows, rng) for metric in metrics})
+    return _with_totals(pd.DataFrame(data), dimensions, metrics, query)
+
+
+def _hourly_datetimes(index: np.ndarray, date1: date, days: int) -> pd.Series:
+    """
+    Время строк ответа с группировкой по времени: строки по очереди распределяются по часам периода
+    """
+    return pd.Series(pd.Timestamp(date1) + pd.to_timedelta(index % (days * 24), unit='h'))
+
+
+def _with_totals(df: pd.DataFrame, dimensions: list[str], metrics: list[str], query: dict) -> pd.DataFrame:
+    """
+    Строка итогов (по всем строкам) и ограничение количества строк ответа (limit)
+    """
+    totals_row = [TOTAL_LABEL] + [''] * (len(dimensions) - 1) + [df[metric].sum() for metric in metrics]
+    if query.get('limit'):
+        df = df.head(int(query['limit']))
+    return pd.concat([pd.DataFrame([totals_row], columns=df.columns), df], ignore_index=True)
+
+
+def appmetrica_csv(query: dict, config: SyntheticConfig) -> bytes:
+    return appmetrica_frame(query, config).to_csv(index=False).encode('utf-8')
+
+
+def direct_campaigns(request_data: dict) -> dict:
+    """
+    Ответ метода campaigns API Яндекс.Директ: параметры отслеживания с campaign_id для всех кампаний
+    :param request_data:
+    :return:
+    """
+    ids = request_data.get('params', {}).get('SelectionCriteria', {}).get('Ids', [])
+    return {'result': {'Campaigns': [
+        {'Id': campaign_id, 'Name': f'Кампания {campaign_id}',
+         'TextCampaign': {'TrackingParams': 'utm_source=yandex&utm_campaign={campaign_id}'}}
+        for campaign_id in ids
+    ]}}
+
+
+def direct_ads(request_data: dict) -> dict:
+    """
+    Ответ метода ads API Яндекс.Директ
+    :param request_data:
+    :return:
+    """
+    ids = request_data.get('params', {}).get('SelectionCriteria', {}).get('CampaignIds', [])
+    return {'result': {'Ads': [
+        {'Id': campaign_id * 10, 'CampaignId': campaign_id, 'Type': 'CPM_BANNER_AD',
+         'CpmBannerAdBuilderAd': {'Href': f'https://example.com/?utm_campaign={campaign_id}'}}
+        for campaign_id in ids
+    ]}}
+
+
+def date_range(days: int, end: date = date(2025, 6, 30)) -> tuple[date, date]:
+    """
+    Период отчёта из days дней, заканчивающийся end
+    :param days:
+    :param end:
+    :return:
+    """
+    return end - timedelta(days=days - 1), end
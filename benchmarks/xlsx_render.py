@@ -0,0 +1,238 @@
+"""
+Бенчмарк формирования xlsx-файла отчёта (utils/xlsx_formatter.py) на синтетических таблицах.
+Для каждого размера замеряется время записи каждого листа (методы write_* класса CreateXlsx),
+время workbook.close() (сборка и сжатие документа) и размер файла.
+
+Запуск (из корня проекта):
+    python -m benchmarks.xlsx_render                             # все размеры
+    python -m benchmarks.xlsx_render -c s m --repeat 3 --json results.json
+    python -m benchmarks.xlsx_render --min-rows-per-second 20000 \\
+        --sheet-floor write_general=5000 --sheet-floor write_events=50000
+
+Пороги производительности (строк в секунду):
+- --min-rows-per-second - для всего документа (все строки всех листов / время записи листов и close)
+- --sheet-floor <метод>=<строк/с> - для отдельного листа, проверяется для листов от --floor-min-rows строк
+  (на маленьких листах время определяется постоянными затратами)
+Код завершения 1 - хотя бы один порог не достигнут
+"""
+import argparse
+import io
+import json
+import sys
+import time
+import warnings
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from integrations.frame_utils import TOTAL_LABEL
+from settings import XLSX_CONSTANT_MEMORY_ROWS
+from utils.xlsx_formatter import CreateXlsx
+
+CAMPAIGNS_METRICS = ['clicks', 'installs', 'conversion_clicks', 'active_users', 'sessions', 'session_per_install',
+                     'events_count', 'events_per_session', 'mean_timespent', 'median_timespent', 'sessions_lt_10',
+                     'sessions_10_30', 'sessions_gt_30']
+# листы в порядке create_xlsx_file (имена - для порогов --sheet-floor)
+SHEETS = ['write_general', 'write_general_groups', 'write_week_distribution', 'write_retention_by_weeks',
+          'write_events', 'write_installs_by_regions', 'write_installs_by_oc', 'write_installs_by_brand']
+
+
+@dataclass
+class Case:
+    # строк на листах "Все кампании" и "Retention-анализ" (одна серия графика retention на кампанию)
+    campaigns: int
+    # строк на листах "События", "Регионы (Установки)" и "Марка (Установки)"
+    rows: int
+    # недель в периоде отчёта (колонок retention)
+    weeks: int = 13
+
+
+CASES = {
+    'xs': Case(campaigns=10, rows=100),
+    's': Case(campaigns=100, rows=1_000),
+    'm': Case(campaigns=1_000, rows=10_000),
+    'l': Case(campaigns=5_000, rows=100_000),
+}
+
+
+def _campaigns_frame(rng: np.random.Generator, count: int, name_column: str, name_prefix: str) -> pd.DataFrame:
+    df = pd.DataFrame({
+        'campaign_id': [TOTAL_LABEL] + [str(700000000 + i) for i in range(count)],
+        name_column: [TOTAL_LABEL] + [f'{name_prefix} {i}' for i in range(count)],
+    })
+    for metric in CAMPAIGNS_METRICS:
+        df[metric] = rng.integers(0, 100000, count + 1) if metric in ('clicks', 'installs', 'active_users',
+                                                                      'sessions', 'events_count') \
+            else rng.uniform(0, 1, count + 1)
+    return df
+
+
+def _installs_frame(rng: np.random.Generator, label: str, values: list[str]) -> pd.DataFrame:
+    installs = np.sort(rng.integers(0, 100000, len(values)))[::-1]
+    return pd.DataFrame({label: values, 'installs': installs})
+
+
+def get_report_data(case: Case, seed: int = 0) -> dict[str, pd.DataFrame]:
+    """
+    Синтетические таблицы отчёта в формате create_report (колонки и типы - как после обработки данных AppMetrica)
+    :param case: размер
+    :param seed:
+    :return:
+    """
+    rng = np.random.default_rng(seed)
+    general = _campaigns_frame(rng, case.campaigns, 'campaign_name', 'Кампания')
+    general_groups = _campaigns_frame(rng, max(1, case.campaigns // 10), 'group_name', 'Группа')
+
+    week_distribution = pd.DataFrame({
+        'week_number': pd.array(range(1, case.weeks + 1), dtype='UInt32'),
+        'installs': rng.integers(0, 100000, case.weeks),
+        'sessions': rng.integers(0, 100000, case.weeks),
+    })
+
+    retention = pd.DataFrame({'campaign_id': general['campaign_id'].iloc[1:].to_numpy()})
+    for week in range(1, case.weeks + 1):
+        retention[f'ym:u2:retentionWeek{week}Percentage'] = rng.uniform(0, 100, case.campaigns).round(2)
+
+    events = pd.DataFrame({
+        'event': [TOTAL_LABEL] + [f'Событие {i}' for i in range(case.rows)],
+        'count_event': np.concatenate([[case.rows * 100000], rng.integers(0, 100000, case.rows)]),
+        'users': rng.integers(0, 10000, case.rows + 1),
+        'event_per_user': rng.uniform(1, 10, case.rows + 1).round(2),
+        'perc_all_users': rng.uniform(0, 1, case.rows + 1),
+    })
+
+    return {
+        'general': general,
+        'general_groups': general_groups,
+        'week_distribution': week_distribution,
+        'retention': retention,
+        'events': events,
+        'installs_by_regions': _installs_frame(rng, 'city', [f'Город {i}' for i in range(case.rows)]),
+        'installs_by_oc': _installs_frame(rng, 'oc', ['android', 'iOS', 'Windows']),
+        'installs_by_brand': _installs_frame(rng, 'device_type', [f'Модель {i}' for i in range(case.rows)]),
+    }
+
+
+def render(report_data: dict[str, pd.DataFrame], constant_memory: bool) -> dict:
+    """
+    Формирование xlsx-файла (листы в том же порядке, что и в create_xlsx_file) с замером этапов
+    :return: время по листам, время close, размер файла, предупреждения xlsxwriter
+    (например, о превышении допустимого в Excel количества серий графика)
+    """
+    xlsx_file = io.BytesIO()
+    workbook = xlsxwriter.Workbook(xlsx_file, options={'constant_memory': constant_memory})
+    xlsx_form = CreateXlsx(workbook, 'Бенчмарк')
+    sheets = [
+        ('write_general', xlsx_form.write_general, (report_data['general'], 'Все кампании')),
+        ('write_general_groups', xlsx_form.write_general, (report_data['general_groups'], 'Группы кампаний')),
+        ('write_week_distribution', xlsx_form.write_week_distribution, (report_data['week_distribution'],)),
+        ('write_retention_by_weeks', xlsx_form.write_retention_by_weeks,
+         (report_data['retention'], report_data['general'])),
+        ('write_events', xlsx_form.write_events, (report_data['events'],)),
+        ('write_installs_by_regions', xlsx_form.write_installs_by_regions, (report_data['installs_by_regions'],)),
+        ('write_installs_by_oc', xlsx_form.write_installs_by_oc, (report_data['installs_by_oc'],)),
+        ('write_installs_by_brand', xlsx_form.write_installs_by_brand, (report_data['installs_by_brand'],)),
+    ]
+
+    result = {'sheets': {}}
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        for name, write_sheet, args in sheets:
+            start_time = time.perf_counter()
+            write_sheet(*args)
+            result['sheets'][name] = {'rows': len(args[0]), 'seconds': time.perf_counter() - start_time}
+
+        start_time = time.perf_counter()
+        workbook.close()
+        result['close_seconds'] = time.perf_counter() - start_time
+
+    result['warnings'] = sorted({str(warning.message) for warning in caught})
+    result['bytes'] = xlsx_file.getbuffer().nbytes
+    result['rows'] = sum(sheet['rows'] for sheet in result['sheets'].values())
+    result['seconds'] = sum(sheet['seconds'] for sheet in result['sheets'].values()) + result['close_seconds']
+    return result
+
+
+def rows_per_second(rows: int, seconds: float) -> float:
+    return round(rows / seconds) if seconds else float('inf')
+
+
+def check_floors(case_name: str, result: dict, min_rows_per_second: float, sheet_floors: dict[str, float],
+                 floor_min_rows: int) -> list[str]:
+    """
+    Проверка порогов производительности
+    :return: описания недостигнутых порогов
+    """
+    failures = []
+    total_speed = rows_per_second(result['rows'], result['seconds'])
+    if min_rows_per_second and total_speed < min_rows_per_second:
+        failures.append(f'{case_name}: документ - {total_speed} строк/с (порог {min_rows_per_second})')
+    for name, floor in sheet_floors.items():
+        sheet = result['sheets'][name]
+        speed = rows_per_second(sheet['rows'], sheet['seconds'])
+        if sheet['rows'] >= floor_min_rows and speed < floor:
+            failures.append(f'{case_name}: {name} - {speed} строк/с (порог {floor})')
+    return failures
+
+
+def parse_sheet_floor(value: str) -> tuple[str, float]:
+    name, _, floor = value.partition('=')
+    if not name.startswith('write_') or not floor:
+        raise argparse.ArgumentTypeError(f'ожидается <метод>=<строк/с>, получено {value!r}')
+    return name, float(floor)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Бенчмарк формирования xlsx-файла отчёта')
+    parser.add_argument('-c', '--case', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=1, help='количество запусков (берётся самый быстрый)')
+    parser.add_argument('--constant-memory', choices=['auto', 'on', 'off'], default='auto',
+                        help='режим constant_memory (auto - как в create_xlsx_file, по XLSX_CONSTANT_MEMORY_ROWS)')
+    parser.add_argument('--min-rows-per-second', type=float, default=0, help='порог для всего документа')
+    parser.add_argument('--sheet-floor', type=parse_sheet_floor, action='append', default=[],
+                        help='порог для листа: <метод>=<строк/с>, например write_general=5000')
+    parser.add_argument('--floor-min-rows', type=int, default=1000,
+                        help='минимальное количество строк листа для проверки порога листа')
+    parser.add_argument('--json', help='файл для сохранения результатов')
+    args = parser.parse_args(argv)
+    sheet_floors = dict(args.sheet_floor)
+    unknown_sheets = set(sheet_floors) - set(SHEETS)
+    if unknown_sheets:
+        parser.error(f"неизвестные листы в --sheet-floor: {', '.join(sorted(unknown_sheets))} "
+                     f"(допустимые: {', '.join(SHEETS)})")
+
+    results, failures = [], []
+    for case_name in args.case:
+        report_data = get_report_data(CASES[case_name])
+        max_rows = max(len(df) for df in report_data.values())
+        constant_memory = {'on': True, 'off': False}.get(args.constant_memory, max_rows >= XLSX_CONSTANT_MEMORY_ROWS)
+
+        result = min((render(report_data, constant_memory) for _ in range(args.repeat)),
+                     key=lambda run: run['seconds'])
+        result.update(case=case_name, constant_memory=constant_memory)
+        results.append(result)
+
+        print(f"{case_name}: {result['rows']} строк, {round(result['seconds'], 3)} с "
+              f"({rows_per_second(result['rows'], result['seconds'])} строк/с), close {round(result['close_seconds'], 3)} с, "
+              f"{round(result['bytes'] / 1024 / 1024, 2)} МБ, constant_memory={constant_memory}")
+        for name, sheet in result['sheets'].items():
+            print(f"    {name:<28} {sheet['rows']:>8} строк {sheet['seconds']:>9.4f} с "
+                  f"{rows_per_second(sheet['rows'], sheet['seconds']):>10} строк/с")
+        for warning in result['warnings']:
+            print(f'    предупреждение: {warning}')
+        failures.extend(check_floors(case_name, result, args.min_rows_per_second, sheet_floors, args.floor_min_rows))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+
+    sys.stdout.flush()
+    for failure in failures:
+        print(f'Порог не достигнут: {failure}', file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
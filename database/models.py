@@ -1,8 +1,12 @@
-from sqlalchemy import Column, Integer, TEXT, ForeignKey, DATE, VARCHAR, DATETIME, Boolean
+from sqlalchemy import Column, Integer, TEXT, ForeignKey, DATE, VARCHAR, DATETIME, Boolean, DateTime, Index, false, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
 from .db import Base, scheme_name
 
+# статусы отчёта: 1 - в очереди, 2 - в обработке, 3 - сформирован, 4 - ошибка
+FINISHED_STATUSES = (3, 4)
+
 class Report(Base):
     __tablename__ = 'report'
 
@@ -17,10 +21,52 @@ class Report(Base):
     to_delete = Column(Boolean)
     status_id = Column(Integer)
     error_msg = Column(TEXT)
+    # форматы выгрузки через запятую (xlsx, parquet, arrow, csv), первый - основной; пустое значение - xlsx
+    output_formats = Column(VARCHAR(100), nullable=True)
+    # сначала сформировать предварительный отчёт по семплированным данным, затем - точный
+    preview = Column(Boolean, nullable=True)
+    # показатели этапов формирования отчёта: время, объём загруженных данных, строки, пиковая память
+    stats = Column(JSONB, nullable=True)
+    # профилировать формирование отчёта (профиль загружается в S3 рядом с отчётом)
+    profile = Column(Boolean, nullable=True)
 
     global_campaign = relationship('GlobalCampaign', backref='reports', uselist=False)
     application = relationship('Application', backref='reports', uselist=False)
 
+    __table_args__ = (
+        # частичный индекс очереди: условие и порядок выбора нового отчёта (main.get_request),
+        # в индекс попадают только ожидающие обработки отчёты, поэтому его размер не растёт с историей
+        Index('ix_report_queue', created_at, postgresql_where=(status_id == 1) & (to_delete == false())),
+        {'schema': scheme_name},
+    )
+
+
+class ReportArchive(Base):
+    """
+    Архив сформированных и завершившихся ошибкой отчётов (переносятся из report заданием maintenance.py).
+    Колонки - как в Report, без внешних ключей
+    """
+    __tablename__ = 'report_archive'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer)
+    application_id = Column(Integer)
+    global_campaign_id = Column(Integer)
+    start_date = Column(DATE, nullable=False)
+    end_date = Column(DATE, nullable=False)
+    s3_filepath = Column(VARCHAR(1000), nullable=True)
+    created_at = Column(DateTime)
+    to_delete = Column(Boolean)
+    status_id = Column(Integer)
+    error_msg = Column(TEXT)
+    output_formats = Column(VARCHAR(100), nullable=True)
+    preview = Column(Boolean, nullable=True)
+    stats = Column(JSONB, nullable=True)
+    profile = Column(Boolean, nullable=True)
+    # время переноса в архив
+    archived_at = Column(DateTime, server_default=func.now())
+
+
 class Application(Base):
     __tablename__ = 'application'
 
@@ -28,6 +74,8 @@ class Application(Base):
     name = Column(TEXT)
     yandex_app_id = Column(TEXT)
     yd_login = Column(TEXT)
+    # метка события запуска приложения в AppMetrica (None - LAUNCH_EVENT_LABEL)
+    launch_event_label = Column(TEXT)
     created_at = Column(DATETIME)
     updated_at = Column(DATETIME)
     user_id = Column(Integer)
@@ -44,6 +92,14 @@ class GlobalCampaign(Base):
 
     groups = relationship('CampaignGroup', backref='global_campaign')
 
+    def get_campaigns_data(self) -> list[tuple]:
+        """
+        Данные кампаний ЯД глобальной кампании
+        :return: список кортежей: (campaign_id, campaign_name, campaign_group), ...
+        """
+        return [(yd_camp.yd_campaign_id, yd_camp.name, yd_camp.group.name) for campaign_group in self.groups
+                for yd_camp in campaign_group.yd_campaigns]
+
 
 class CampaignGroup(Base):
     __tablename__ = 'campaign_group'
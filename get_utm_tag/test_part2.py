@@ -2,35 +2,45 @@ import requests
 import json
 import os
 import logging
+from functools import lru_cache
 from typing import List, Dict, Optional, Iterable
 from pathlib import Path
 from urllib.parse import urlparse, parse_qs
 
 from minio import Minio
 
-from settings import ENDPOINT_URL, ACCESS_KEY, SECRET_KEY, BUCKET_NAME, YANDEX_DIRECT_TOKEN
+from settings import (ENDPOINT_URL, ACCESS_KEY, SECRET_KEY, BUCKET_NAME, YANDEX_DIRECT_TOKEN, YANDEX_DIRECT_API_URL,
+                      YANDEX_DIRECT_WEBAPI_URL)
+from utils.metrics import TRACKING_PARAMS_DURATION, TRACKING_PARAMS_ERRORS, observe
+from utils.rate_limiter import get_rate_limiter
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-YANDEX_DIRECT_BASE_URL = "https://api.direct.yandex.com/json/v5"
-YANDEX_WEBAPI_URL = "https://direct.yandex.ru/wizard/web-api/aggregate"
+YANDEX_DIRECT_BASE_URL = YANDEX_DIRECT_API_URL
+YANDEX_WEBAPI_URL = YANDEX_DIRECT_WEBAPI_URL
 
 S3_ENDPOINT_URL = ENDPOINT_URL
 S3_ACCESS_KEY = ACCESS_KEY
 S3_SECRET_KEY = SECRET_KEY
 S3_BUCKET_NAME = BUCKET_NAME
 
-client = Minio(
-    endpoint=S3_ENDPOINT_URL,
-    access_key=S3_ACCESS_KEY,
-    secret_key=S3_SECRET_KEY,
-    secure=False
-)
+
+@lru_cache(maxsize=None)
+def get_minio_client() -> Minio:
+    """
+    Клиент S3 (создаётся при первом обращении, чтобы импорт модуля не требовал настроек S3)
+    """
+    return Minio(
+        endpoint=S3_ENDPOINT_URL,
+        access_key=S3_ACCESS_KEY,
+        secret_key=S3_SECRET_KEY,
+        secure=False
+    )
 
 
 def load_cookies_from_minio(bucket_name=S3_BUCKET_NAME, object_name="cookies_for_campaigns/cookies.json"):
-    response = client.get_object(bucket_name, object_name)
+    response = get_minio_client().get_object(bucket_name, object_name)
     data = response.read().decode("utf-8")
     response.close()
     response.release_conn()
@@ -96,6 +106,12 @@ def collect_campaigns_with_tracking(data) -> Dict[str, str]:
     return found
 
 
+def _wait_direct_rate_limit():
+    rate_limiter = get_rate_limiter("direct", YANDEX_DIRECT_TOKEN)
+    if rate_limiter:
+        rate_limiter.acquire()
+
+
 def direct_api_get_tracking_params(campaign_ids: List[str], yd_login) -> Dict[str, str]:
     token = _ensure_bearer(YANDEX_DIRECT_TOKEN)
     headers = {
@@ -114,6 +130,7 @@ def direct_api_get_tracking_params(campaign_ids: List[str], yd_login) -> Dict[st
                 "TextCampaignFieldNames": ["TrackingParams"]
             }
         }
+        _wait_direct_rate_limit()
         r = requests.post(f"{YANDEX_DIRECT_BASE_URL}/campaigns", json=req, headers=headers)
         if r.status_code != 200:
             logger.warning("API error %s", r.text[:300])
@@ -130,6 +147,7 @@ def get_tracking_params_web(campaign_id: str, cookies, headers):
         "route": "campaign",
         "ulogin": "e-20035215"
     }
+    _wait_direct_rate_limit()
     r = requests.get(YANDEX_WEBAPI_URL, headers=headers, cookies=cookies, params=params)
     data = r.json()
     Path(f"campaign_{campaign_id}_raw.json").write_text(json.dumps(data, ensure_ascii=False, indent=2),
@@ -155,6 +173,7 @@ def get_tracking_from_banner(campaign_id: str, yd_login) -> Optional[str]:
         }
     }
 
+    _wait_direct_rate_limit()
     r = requests.post(f"{YANDEX_DIRECT_BASE_URL}/ads", json=req, headers=headers)
     if r.status_code != 200:
         logger.warning("Banner API error %s", r.text[:300])
@@ -192,6 +211,7 @@ def cleanup_temp_json_files():
         logger.info("Временные JSON-файлы отсутствуют — нечего удалять.")
 
 
+@observe(TRACKING_PARAMS_DURATION, TRACKING_PARAMS_ERRORS)
 def get_campaign_params(campaign_ids: List[str], yd_login: str) -> Dict[str, Optional[str]]:
     cur_dir_path = os.path.dirname(__file__)
     cookies = load_cookies_from_minio()
@@ -0,0 +1,327 @@
+"""
+Обработка данных AppMetrica для листов отчёта. Функции не выполняют запросов к API и работают
+с уже полученными DataFrame-ами в формате ответов AppMetrica (или частями ответов,
+см. AsyncYandexAppAPI.aggregate_chunks), поэтому могут выполняться и проверяться отдельно от загрузки данных
+(см. benchmarks/aggregations.py)
+"""
+from typing import Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from integrations.frame_utils import TOTAL_LABEL, aggregate_with_totals, drop_totals_rows, fillna_decorator
+
+pd.set_option('future.no_silent_downcasting', True)
+
+# метка события запуска приложения по-умолчанию (по нему считаются активные пользователи),
+# для приложения может быть задана в Application.launch_event_label
+LAUNCH_EVENT_LABEL = 'Запуск приложения и отображение экрана заставки.'
+
+SESSIONS_STATS_COLUMNS = ['campaign_id', 'sessions', 'mean_timespent', 'median_timespent',
+                          'sessions_lt_10', 'sessions_10_30', 'sessions_gt_30']
+
+
+def summarize_sessions(chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Показатели сессий по кампаниям. Ответ API (по строке на сессию) обрабатывается частями:
+    для каждой части считаются суммы и количества, для медианы сохраняется только проекция
+    (кампания, продолжительность сессии)
+    :param chunks: части ответа с колонками (кампания, количество сессий, продолжительность сессии)
+    :return: DataFrame с колонками campaign_id, sessions, mean_timespent, median_timespent,
+    sessions_lt_10, sessions_10_30, sessions_gt_30
+    """
+    counters = []
+    campaign_parts, timespent_parts = [], []
+    for chunk in chunks:
+        chunk.columns = ['campaign_id', 'sessions', 'timespent']
+        timespent = chunk['timespent']
+        counters.append(pd.DataFrame({
+            'campaign_id': chunk['campaign_id'],
+            'sessions': chunk['sessions'],
+            'rows': 1,
+            'timespent': timespent,
+            'sessions_lt_10': timespent < 10,
+            'sessions_10_30': (timespent >= 10) & (timespent <= 30),
+            'sessions_gt_30': timespent > 30,
+        }).groupby('campaign_id', sort=False).sum())
+        campaign_parts.append(chunk['campaign_id'].astype('category'))
+        timespent_parts.append(timespent.to_numpy())
+
+    if not counters:
+        return pd.DataFrame(columns=SESSIONS_STATS_COLUMNS)
+
+    stats = pd.concat(counters).groupby(level=0, sort=False).sum()
+    rows = stats['rows']
+    median = pd.Series(np.concatenate(timespent_parts)).groupby(
+        pd.Series(union_categoricals(campaign_parts)), observed=True, sort=False).median()
+    median.index = median.index.astype(object)
+
+    result = pd.DataFrame({
+        'sessions': stats['sessions'],
+        'mean_timespent': (stats['timespent'] / rows).round(2),
+        'median_timespent': median.round(0),
+        'sessions_lt_10': stats['sessions_lt_10'] / rows,
+        'sessions_10_30': stats['sessions_10_30'] / rows,
+        'sessions_gt_30': stats['sessions_gt_30'] / rows,
+    }).rename_axis('campaign_id').reset_index()
+
+    # в строке итогов - средние (медиана для медианного времени) значения по кампаниям
+    summary_row = result['campaign_id'] == TOTAL_LABEL
+    for column, agg in (('mean_timespent', 'mean'), ('median_timespent', 'median'), ('sessions_lt_10', 'mean'),
+                        ('sessions_10_30', 'mean'), ('sessions_gt_30', 'mean')):
+        result.loc[summary_row, column] = result.loc[~summary_row, column].agg(agg)
+
+    return result[SESSIONS_STATS_COLUMNS]
+
+
+def summarize_sessions_by_time(chunks: Iterable[pd.DataFrame],
+                               row_limit: int | None = None) -> tuple[pd.DataFrame, pd.DataFrame | None]:
+    """
+    Показатели сессий по кампаниям (см. summarize_sessions) и количество сессий по времени начала из того же
+    ответа API: время начала однозначно определяется сессией, поэтому группировка по нему не увеличивает
+    количество строк ответа, а отдельный запрос сессий по времени не требуется (см. QueryPlanner.offer)
+    :param chunks: части ответа с колонками (кампания, время начала сессии, количество сессий,
+    продолжительность сессии), каждый ответ (url-параметр) начинается со строки итогов
+    :param row_limit: ограничение количества строк ответа API: если его достиг ответ по какому-либо
+    url-параметру (данные могут быть неполными), сессии по времени не возвращаются
+    :return: показатели сессий и сессии по времени в формате ответа API с группировкой по времени
+    (по строке итогов на url-параметр) или None
+    """
+    time_parts, section_rows, columns = [], [], []
+
+    def session_chunks() -> Iterator[pd.DataFrame]:
+        for chunk in chunks:
+            columns[:] = chunk.columns[[1, 2]]
+            is_total = (chunk.iloc[:, 0] == TOTAL_LABEL).to_numpy()
+            # номер ответа (url-параметра) для каждой строки
+            sections = len(section_rows) - 1 + np.cumsum(is_total)
+            section_rows.extend([0] * int(is_total.sum()))
+
+            data = chunk.iloc[~is_total, [1, 2]]
+            keys = sections[~is_total]
+            time_parts.append(data.groupby([keys, data.iloc[:, 0]], sort=False)[data.columns[1]].sum())
+            for section, rows in zip(*np.unique(keys, return_counts=True)):
+                section_rows[section] += rows
+            yield chunk.iloc[:, [0, 2, 3]]
+
+    stats = summarize_sessions(session_chunks())
+    if not section_rows or (row_limit and max(section_rows) >= row_limit):
+        return stats, None
+
+    sessions_by_time = pd.concat(time_parts).groupby(level=[0, 1], sort=False).sum().reset_index()
+    sessions_by_time.columns = ['section', *columns]
+    sections = sessions_by_time.pop('section')
+    parts = [aggregate_with_totals(sessions_by_time[sections == section], 1) for section in range(len(section_rows))]
+    return stats, pd.concat(parts, ignore_index=True)
+
+
+def _sum_by_campaign(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    """
+    Сумма метрики по кампаниям из ответа API с группировкой только по кампании
+    :param df: ответ API с колонками (кампания, метрика), со строками итогов
+    :param name: имя колонки метрики в результате
+    :return: DataFrame с колонками (campaign_id, name)
+    """
+    if df.empty:
+        return pd.DataFrame(columns=['campaign_id', name])
+    df = drop_totals_rows(df)
+    return df.groupby(df.columns[0])[df.columns[1]].sum().rename_axis('campaign_id').reset_index(name=name)
+
+
+def build_events_stats(events_df: pd.DataFrame, active_users_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Количество событий и активных пользователей по кампаниям
+    :param events_df: ответ API с количеством событий по кампаниям
+    :param active_users_df: ответ API с количеством устройств, на которых было событие запуска приложения,
+    по кампаниям (пользователи, установившие приложение и вошедшие в него хотя бы 1 раз)
+    :return: DataFrame-ы с колонками (campaign_id, events_count) и (campaign_id, active_users),
+    со строкой итогов (сумма по кампаниям)
+    """
+    total_events_df = _sum_by_campaign(events_df, 'events_count')
+    total_events_df.loc[-1] = [TOTAL_LABEL, total_events_df['events_count'].sum()]
+    total_events_df = total_events_df.sort_values(by='events_count', ascending=False)
+    log_count_df = _sum_by_campaign(active_users_df, 'active_users')
+    log_count_df.loc[-1] = [TOTAL_LABEL, log_count_df['active_users'].sum()]
+
+    return total_events_df, log_count_df
+
+
+@fillna_decorator
+def build_all_campaigns(campaigns_data: pd.DataFrame, general_df: pd.DataFrame, sessions_stats_df: pd.DataFrame,
+                        total_events_df: pd.DataFrame, log_count_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Данные для листа "Все кампании"
+    :param campaigns_data: кампании (campaign_id, campaign_name, campaign_group)
+    :param general_df: ответ API с кликами, установками и конверсией кликов по кампаниям
+    :param sessions_stats_df: показатели сессий (см. summarize_sessions)
+    :param total_events_df: количество событий (см. build_events_stats)
+    :param log_count_df: количество активных пользователей (см. build_events_stats)
+    :return:
+    """
+    general_labels = ['campaign_id', 'clicks', 'installs', 'conversion_clicks']
+
+    # базовый датафрейм с ID и именами кампаний
+    base_df = pd.concat([
+        pd.DataFrame({'campaign_id': ['Итого и средние'], 'campaign_name': ['Итого и средние']}),
+        campaigns_data.drop(columns=['campaign_group'])])
+
+    # общие показатели кликов, установок, конверсии кликов
+    general_df = general_df.copy()
+    general_df.columns = general_labels
+    general_df = base_df.merge(general_df, on='campaign_id', how='left')
+    general_df.conversion_clicks = general_df.conversion_clicks.apply(lambda x: round(x, 2))
+
+    # добавление имён кампаний
+    general_labels.insert(1, 'campaign_name')
+    # восстановление порядка следования колонок
+    general_df = general_df[general_labels]
+
+    # Формирование результирующего датафрейма (со всеми параметрами)
+    # добавление столбца с количеством новых пользователей
+    general_df = general_df.merge(on='campaign_id', how='left', right=log_count_df)
+
+    # общие показатели количества сессий
+    general_df = general_df.merge(on='campaign_id', how='left', right=sessions_stats_df[['campaign_id', 'sessions']])
+    general_df['sessions'] = pd.to_numeric(general_df['sessions'], errors='coerce')
+    general_df['installs'] = pd.to_numeric(general_df['installs'])
+
+    # столбец с количеством сессий на 1 установку
+    general_df['session_per_install'] = np.where((general_df['sessions'] != 0) & (general_df['installs'] != 0),
+                                                 (general_df['sessions'] / general_df['installs']).round(2), 0)
+
+    # добавление столбца с количеством событий
+    general_df = general_df.merge(on='campaign_id', how='left', right=total_events_df).fillna(0)
+    # столбец с количеством событий на 1 сессию
+    general_df['events_per_session'] = general_df.apply(
+        lambda x: 0 if x['sessions'] == 0 else x['events_count'] / x['sessions'], axis=1)
+
+    # среднее и медианное время сессий в секундах, доли сессий продолжительностью
+    # меньше 10 секунд, от 10 до 30 секунд и больше 30 секунд
+    general_df = general_df.merge(on='campaign_id', how='left',
+                                  right=sessions_stats_df.drop(columns='sessions'))
+
+    return general_df.sort_values(by='clicks', ascending=False)
+
+
+@fillna_decorator
+def build_campaign_groups(campaigns_data: pd.DataFrame, general_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Данные для листа "Группы кампаний"
+    :param campaigns_data: кампании (campaign_id, campaign_name, campaign_group)
+    :param general_df: данные листа "Все кампании" (см. build_all_campaigns)
+    :return:
+    """
+    # ПОДТЯГИВАТЬ ИЗ БД ИЛИ ПРИНИМАТЬ НА ВХОД (ТОЖЕ ПОДТЯНУТОЕ ИЗ БД)
+    groups_campaigns = campaigns_data.drop(columns=['campaign_name'])
+    groups_campaigns = groups_campaigns.groupby('campaign_group')['campaign_id'].apply(list).to_dict()
+
+    # campaign_name заменяем на group_name
+    columns = list(general_df.columns)
+    del columns[1]
+    columns.insert(1, 'group_name')
+    dfs = []
+
+    for key in groups_campaigns:
+        df_group = general_df[general_df['campaign_id'].isin(map(str, groups_campaigns[key]))]
+        df_group.insert(2, column='group_name', value=key)
+        df_group = df_group.groupby(['group_name']).agg(
+            {
+                'campaign_id': lambda ids: ', '.join(ids),
+                'clicks': 'sum',
+                'installs': 'sum',
+                'conversion_clicks': 'mean',
+                'active_users': 'sum',
+                'sessions': 'sum',
+                'session_per_install': 'mean',
+                'events_count': 'sum',
+                'events_per_session': 'mean',
+                'mean_timespent': 'mean',
+                'median_timespent': 'mean',
+                'sessions_lt_10': 'mean',
+                'sessions_10_30': 'mean',
+                'sessions_gt_30': 'mean',
+            }
+        ).reset_index()
+        dfs.append(df_group)
+
+    result = pd.concat(dfs)
+    total_row = pd.DataFrame({
+        'campaign_id': ['Итого и средние'],
+        'group_name': ['Итого и средние'],
+        'clicks': [result['clicks'].sum()],
+        'installs': [result['installs'].sum()],
+        'conversion_clicks': [result['conversion_clicks'].mean()],
+        'active_users': [result['active_users'].sum()],
+        'sessions': [result['sessions'].sum()],
+        'session_per_install': [
+            0 if result['installs'].sum() == 0 else result['sessions'].sum() / result['installs'].sum()],
+        'events_count': [result['events_count'].sum()],
+        'events_per_session': [
+            0 if result['sessions'].sum() == 0 else result['events_count'].sum() / result['sessions'].sum()],
+        'mean_timespent': [result['mean_timespent'].mean()],
+        'median_timespent': [general_df['median_timespent'].mean()],
+        'sessions_lt_10': [result['sessions_lt_10'].mean()],
+        'sessions_10_30': [result['sessions_10_30'].mean()],
+        'sessions_gt_30': [result['sessions_gt_30'].mean()],
+    })
+    result = pd.concat([total_row, result]).sort_values(by='clicks', ascending=False)
+    return result
+
+
+@fillna_decorator
+def build_week_distribution(installs_df: pd.DataFrame, sessions_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Данные для листа "Распределение по неделям"
+    :param installs_df: ответ API с установками по дате и времени (ym:i:dateTime)
+    :param sessions_df: ответ API с сессиями по дате и времени (ym:s:dateTime)
+    :return:
+    """
+    try:
+        # DataFrame-ы с удаленной строкой итогов (index=0), т.к не требуется при отображении
+        installs_df = installs_df.drop(index=[0]).reset_index(drop=True)
+        sessions_df = sessions_df.drop(index=[0]).reset_index(drop=True)
+    except KeyError:
+        return pd.DataFrame()
+
+    # обработка и группировка данных по неделям
+    installs_df.columns = ['datetime', 'installs']
+    installs_df['datetime'] = pd.to_datetime(installs_df['datetime'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    installs_df['week_number'] = installs_df['datetime'].dt.isocalendar().week
+    installs_df = installs_df.drop(columns=['datetime']).groupby('week_number').sum()
+
+    sessions_df.columns = ['datetime', 'sessions']
+    sessions_df['datetime'] = pd.to_datetime(sessions_df['datetime'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    sessions_df['week_number'] = sessions_df['datetime'].dt.isocalendar().week
+    sessions_df = sessions_df.drop(columns=['datetime']).groupby('week_number').sum()
+
+    # объединение установок и сессий по номерам недели
+    result = installs_df.merge(on='week_number', how='left', right=sessions_df).reset_index()
+
+    return result
+
+
+@fillna_decorator
+def build_installs_breakdown(installs_df: pd.DataFrame, label: str, top_n: int) -> pd.DataFrame:
+    """
+    Установки, сгруппированные по одному измерению, с ограничением top-N и строкой "Прочие"
+    :param installs_df: ответ API с установками по измерению (по одной строке итогов на url-параметр)
+    :param label: имя колонки с группировкой в результирующем DataFrame
+    :param top_n: количество выводимых строк, 0 - без ограничения
+    :return: DataFrame с колонками (label, installs), отсортированный по убыванию установок
+    """
+    if installs_df.empty:
+        return installs_df
+
+    installs_df = installs_df.copy()
+    installs_df.columns = [label, 'installs']
+    # удаление строк итогов (по одной на каждый url-параметр)
+    installs_df = drop_totals_rows(installs_df)
+    installs_df = installs_df.groupby(label, sort=False).sum().reset_index()
+    installs_df = installs_df.sort_values(by='installs', ascending=False).reset_index(drop=True)
+
+    if top_n and len(installs_df) > top_n:
+        others_df = pd.DataFrame({label: ['Прочие'], 'installs': [installs_df['installs'].iloc[top_n:].sum()]})
+        installs_df = pd.concat([installs_df.iloc[:top_n], others_df]).reset_index(drop=True)
+
+    return installs_df
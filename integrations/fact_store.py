@@ -0,0 +1,171 @@
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from settings import FACT_STORE_DIR, FACT_STORE_FINAL_LAG_DAYS, URL_PARAMS_CACHE_TTL_HOURS
+
+# fcntl доступен только на Unix: на других системах сохранения кэша url-параметров не блокируются
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class FactStore:
+    """
+    Файловое (parquet) хранилище посуточных результатов запросов к AppMetrica.
+    Для каждого набора данных (приложение + параметры запроса без дат) хранится по одному файлу на день:
+    <base_dir>/<app_id>/<dataset_key>/<YYYY-MM-DD>.parquet
+    Сохраняются только "окончательные" дни - старше final_lag_days дней, более свежие данные ещё могут меняться.
+    Также хранит кэш параметров отслеживания кампаний ЯД: <base_dir>/url_params/<yd_login>.json
+    """
+
+    def __init__(self, base_dir: str, final_lag_days: int = FACT_STORE_FINAL_LAG_DAYS,
+                 url_params_ttl_hours: int = URL_PARAMS_CACHE_TTL_HOURS):
+        if importlib.util.find_spec('pyarrow') is None:
+            raise RuntimeError('Для работы хранилища фактов требуется пакет pyarrow')
+
+        self.base_dir = Path(base_dir)
+        self.final_lag_days = final_lag_days
+        self.url_params_ttl = url_params_ttl_hours * 3600
+
+    @staticmethod
+    def dataset_key(parameters: dict, url: str) -> str:
+        """
+        Ключ набора данных: хэш параметров запроса без дат
+        :param parameters: параметры запроса к API
+        :param url: api-адрес
+        :return:
+        """
+        key_parameters = {key: value for key, value in parameters.items() if key not in ('date1', 'date2')}
+        key_data = json.dumps([url, key_parameters], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(key_data.encode('utf-8')).hexdigest()
+
+    def is_final(self, day: date) -> bool:
+        return day <= date.today() - timedelta(days=self.final_lag_days)
+
+    def _day_path(self, app_id: str, dataset_key: str, day: date) -> Path:
+        return self.base_dir / str(app_id) / dataset_key / f'{day.isoformat()}.parquet'
+
+    def missing_days(self, app_id: str, dataset_key: str, days: list[date]) -> list[date]:
+        """
+        Дни, которые требуется запросить из API: отсутствующие в хранилище или ещё не окончательные
+        :param app_id:
+        :param dataset_key:
+        :param days:
+        :return:
+        """
+        return [day for day in days
+                if not self.is_final(day) or not self._day_path(app_id, dataset_key, day).exists()]
+
+    def load_days(self, app_id: str, dataset_key: str, days: list[date]) -> list[pd.DataFrame]:
+        return [pd.read_parquet(self._day_path(app_id, dataset_key, day)) for day in days]
+
+    def save_day(self, app_id: str, dataset_key: str, day: date, df: pd.DataFrame):
+        """
+        Сохранение данных за день (только для окончательных дней).
+        Запись через временный файл, чтобы параллельные воркеры не прочитали недописанный файл
+        :param app_id:
+        :param dataset_key:
+        :param day:
+        :param df:
+        :return:
+        """
+        if not self.is_final(day):
+            return
+
+        path = self._day_path(app_id, dataset_key, day)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix='.tmp', delete=False) as tmp_file:
+            df.to_parquet(tmp_file, index=False)
+        os.replace(tmp_file.name, path)
+
+    def _url_params_path(self, yd_login: str) -> Path:
+        return self.base_dir / 'url_params' / f'{yd_login}.json'
+
+    def _read_url_params(self, yd_login: str) -> dict:
+        path = self._url_params_path(yd_login)
+        if not path.exists():
+            return {}
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+
+    def load_url_params(self, yd_login: str, campaign_ids: list[str]) -> dict[str, str | None]:
+        """
+        Закэшированные параметры отслеживания кампаний ЯД (не старше url_params_ttl)
+        :param yd_login:
+        :param campaign_ids:
+        :return: словарь {campaign_id: параметры отслеживания} только для найденных в кэше кампаний
+        """
+        cached = self._read_url_params(yd_login)
+        expire_time = time.time() - self.url_params_ttl
+        return {campaign_id: cached[campaign_id]['params'] for campaign_id in campaign_ids
+                if campaign_id in cached and cached[campaign_id]['updated_at'] >= expire_time}
+
+    def save_url_params(self, yd_login: str, url_params: dict[str, str | None]):
+        """
+        Сохранение параметров отслеживания кампаний ЯД в кэш. Кэш логина общий для воркеров: чтение, объединение
+        и запись выполняются под эксклюзивной блокировкой flock отдельного файла (сам файл кэша заменяется
+        при записи), чтобы параллельные сохранения не теряли кампании друг друга
+        :param yd_login:
+        :param url_params: словарь {campaign_id: параметры отслеживания}
+        :return:
+        """
+        path = self._url_params_path(yd_login)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path.with_suffix('.lock'), os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+
+            cached = self._read_url_params(yd_login)
+            updated_at = time.time()
+            cached.update({campaign_id: {'params': params, 'updated_at': updated_at}
+                           for campaign_id, params in url_params.items()})
+
+            with tempfile.NamedTemporaryFile('w', dir=path.parent, suffix='.tmp', delete=False,
+                                             encoding='utf-8') as tmp_file:
+                json.dump(cached, tmp_file, ensure_ascii=False)
+            os.replace(tmp_file.name, path)
+        finally:
+            os.close(fd)
+
+
+def days_range(date1: date, date2: date) -> list[date]:
+    """
+    Список дней периода (включительно)
+    :param date1:
+    :param date2:
+    :return:
+    """
+    return [date1 + timedelta(days=i) for i in range((date2 - date1).days + 1)]
+
+
+def split_into_ranges(days: list[date], max_days: int = 0) -> list[tuple[date, date]]:
+    """
+    Разбиение отсортированного списка дней на непрерывные периоды
+    :param days:
+    :param max_days: максимальная длина периода в днях (0 - без ограничения)
+    :return: список кортежей (первый день, последний день)
+    """
+    ranges = []
+    for day in days:
+        if ranges and day - ranges[-1][1] == timedelta(days=1) and \
+                (not max_days or (day - ranges[-1][0]).days < max_days):
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+fact_store = FactStore(FACT_STORE_DIR) if FACT_STORE_DIR else None
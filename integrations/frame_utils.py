@@ -0,0 +1,54 @@
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+# значение первой группировки в строке итогов, которую AppMetrica добавляет в начало каждого csv-ответа
+TOTAL_LABEL = 'Итого и средние'
+
+
+def fillna_decorator(func):
+    """
+    Декоратор для заполнения nan-значений на 0 в результирующих объектах DataFrame
+    (Только для функций возвращающих объекты pd.DataFrame)
+    :param func:
+    :return:
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        result = result.fillna(0)
+        return result
+
+    return wrapper
+
+
+def drop_totals_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Удаление строк итогов (по одной на каждый запрос к API) из объединённого ответа AppMetrica
+    :param df:
+    :return:
+    """
+    if df.empty:
+        return df
+    return df[df.iloc[:, 0] != TOTAL_LABEL]
+
+
+def aggregate_with_totals(df: pd.DataFrame, dimensions_count: int) -> pd.DataFrame:
+    """
+    Суммирование аддитивных метрик по группировкам и добавление строки итогов в начало DataFrame,
+    т.е. восстановление формата ответа AppMetrica из нескольких частичных ответов (без строк итогов)
+    :param df: DataFrame, первые dimensions_count колонок которого - группировки, остальные - метрики
+    :param dimensions_count: количество колонок с группировками
+    :return:
+    """
+    dimension_cols = list(df.columns[:dimensions_count])
+    metric_cols = list(df.columns[dimensions_count:])
+
+    df = df.groupby(dimension_cols, dropna=False, sort=False)[metric_cols].sum().reset_index()
+    df = df.sort_values(by=metric_cols[0], ascending=False)
+
+    totals_row = pd.DataFrame(
+        [[TOTAL_LABEL] + [np.nan] * (dimensions_count - 1) + df[metric_cols].sum().tolist()], columns=df.columns)
+    return pd.concat([totals_row, df], ignore_index=True)
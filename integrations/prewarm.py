@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+import tempfile
+import time
+import traceback
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload, sessionmaker
+
+from database.models import Report, GlobalCampaign, CampaignGroup
+from integrations.fact_store import fact_store
+from integrations.yapp_async_api import RequestLimitExceeded
+from integrations.yapp_data_api import YandexAppAPI
+from settings import (
+    YAPP_TOKEN,
+    PREWARM_ENABLED,
+    PREWARM_HOURS,
+    PREWARM_MAX_REQUESTS_PER_HOUR,
+    PREWARM_INTERVAL_HOURS,
+)
+
+logger = logging.getLogger(__name__)
+
+# листы отчёта, данные которых прогреваются (методы YandexAppAPI), по одному за шаг прогрева. Прогреваются только
+# данные с группировкой по дню: остальные не сохраняются в хранилище фактов и только тратили бы бюджет запросов
+PREWARM_SHEETS = [
+    'prewarm_all_campaigns',
+    'get_week_distribution',
+    'get_installs_by_regions',
+    'get_installs_by_oc',
+    'get_installs_by_brand',
+]
+
+
+class Prewarmer:
+    """
+    Прогрев хранилища фактов в простое воркера: для активных глобальных кампаний заранее запрашиваются
+    посуточные данные AppMetrica и параметры отслеживания кампаний ЯД, чтобы отчёт по запросу
+    собирался в основном из хранилища.
+    Прогрев выполняется только в заданные часы и в пределах бюджета запросов к API в час: за шаг прогревается
+    один лист отчёта, количество запросов шага ограничено остатком бюджета.
+    Состояние (потраченный бюджет, время прогрева кампаний) сохраняется в файл state_path и переживает
+    перезапуск воркера
+    """
+
+    def __init__(self, session_maker: sessionmaker, hours: str = PREWARM_HOURS,
+                 max_requests_per_hour: int = PREWARM_MAX_REQUESTS_PER_HOUR,
+                 interval_hours: int = PREWARM_INTERVAL_HOURS, state_path: Path | None = None):
+        self.session_maker = session_maker
+        self.start_hour, self.end_hour = map(int, hours.split('-'))
+        self.max_requests_per_hour = max_requests_per_hour
+        self.interval = timedelta(hours=interval_hours)
+        self.state_path = state_path
+
+        # время последнего прогрева по id глобальной кампании
+        self.last_warmed: dict[int, datetime] = {}
+        # прогреваемая кампания (см. _get_next_task) и её ещё не прогретые листы
+        self.current_task: tuple | None = None
+        self.pending_sheets: list[str] = []
+        # начало текущего часа бюджета (unix-время) и количество потраченных в нём запросов
+        self.budget_started = time.time()
+        self.budget_spent = 0
+        self._load_state()
+
+    def _load_state(self):
+        if not self.state_path or not self.state_path.exists():
+            return
+        try:
+            with open(self.state_path, encoding='utf-8') as file:
+                state = json.load(file)
+            self.budget_started = state['budget_started']
+            self.budget_spent = state['budget_spent']
+            self.last_warmed = {int(global_campaign_id): datetime.fromisoformat(warmed_at)
+                                for global_campaign_id, warmed_at in state['last_warmed'].items()}
+        except (OSError, ValueError, KeyError):
+            logger.warning(f'Не удалось прочитать состояние прогрева {self.state_path}:\n{traceback.format_exc()}')
+
+    def _save_state(self):
+        """
+        Сохранение состояния через временный файл (см. FactStore.save_url_params)
+        :return:
+        """
+        if not self.state_path:
+            return
+        state = {
+            'budget_started': self.budget_started,
+            'budget_spent': self.budget_spent,
+            'last_warmed': {str(global_campaign_id): warmed_at.isoformat()
+                            for global_campaign_id, warmed_at in self.last_warmed.items()},
+        }
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=self.state_path.parent, suffix='.tmp', delete=False,
+                                         encoding='utf-8') as tmp_file:
+            json.dump(state, tmp_file)
+        os.replace(tmp_file.name, self.state_path)
+
+    def _is_off_peak(self) -> bool:
+        hour = datetime.now().hour
+        if self.start_hour <= self.end_hour:
+            return self.start_hour <= hour <= self.end_hour
+        # период через полночь, например 22-6
+        return hour >= self.start_hour or hour <= self.end_hour
+
+    def _has_budget(self) -> bool:
+        if time.time() - self.budget_started >= 3600:
+            self.budget_started = time.time()
+            self.budget_spent = 0
+        return self.budget_spent < self.max_requests_per_hour
+
+    def _get_next_task(self) -> tuple | None:
+        """
+        Поиск активной глобальной кампании, которая давно не прогревалась.
+        Приложение кампании определяется по последнему отчёту по ней
+        :return: кортеж (global_campaign_id, app_id, yd_login, date1, date2, campaigns_data) или None
+        """
+        # данные за последние дни неокончательные и в хранилище не сохраняются
+        last_final_day = date.today() - timedelta(days=fact_store.final_lag_days)
+
+        stmt = (
+            select(Report)
+            .join(Report.global_campaign)
+            .where(GlobalCampaign.start_date <= last_final_day,
+                   GlobalCampaign.end_date >= last_final_day - timedelta(days=1),
+                   Report.to_delete == False)
+            .order_by(Report.global_campaign_id, Report.created_at.desc())
+            .distinct(Report.global_campaign_id)
+            .options(
+                selectinload(Report.application),
+                selectinload(Report.global_campaign)
+                .selectinload(GlobalCampaign.groups)
+                .selectinload(CampaignGroup.yd_campaigns)
+            )
+        )
+
+        with self.session_maker() as session:
+            for report in session.execute(stmt).scalars():
+                last_warmed = self.last_warmed.get(report.global_campaign_id)
+                if last_warmed and datetime.now() - last_warmed < self.interval:
+                    continue
+
+                global_campaign = report.global_campaign
+                return (
+                    global_campaign.id,
+                    report.application.yandex_app_id,
+                    report.application.yd_login,
+                    global_campaign.start_date,
+                    min(global_campaign.end_date, last_final_day),
+                    global_campaign.get_campaigns_data(),
+                )
+        return None
+
+    def run_step(self) -> bool:
+        """
+        Прогрев одного листа отчёта по глобальной кампании (следующего не прогретого листа текущей кампании
+        или первого листа следующей кампании). Запросы сверх остатка бюджета не выполняются: лист, прерванный
+        исчерпанием бюджета, прогревается повторно в следующем часе (уже сохранённые дни не запрашиваются)
+        :return: True, если прогрев выполнялся
+        """
+        if not self._is_off_peak() or not self._has_budget():
+            return False
+
+        if not self.pending_sheets:
+            task = self._get_next_task()
+            if task is None:
+                return False
+
+            global_campaign_id, *_, campaigns_data = task
+            self.last_warmed[global_campaign_id] = datetime.now()
+            if not campaigns_data:
+                self._save_state()
+                return False
+            self.current_task = task
+            self.pending_sheets = PREWARM_SHEETS.copy()
+
+        global_campaign_id, app_id, yd_login, date1, date2, campaigns_data = self.current_task
+        sheet = self.pending_sheets[0]
+        logger.info(f'Прогрев данных глобальной кампании {global_campaign_id} ({date1} - {date2}): {sheet}...')
+        api_req = None
+        try:
+            # подготовка вызывается отдельно, чтобы её запросы учитывались в бюджете и при ошибке
+            api_req = YandexAppAPI(YAPP_TOKEN, app_id, str(date1), str(date2), campaigns_data, yd_login,
+                                   max_requests=self.max_requests_per_hour - self.budget_spent, prepare=False)
+            api_req.prepare()
+            getattr(api_req, sheet)()
+            self.pending_sheets.pop(0)
+            logger.info(f'Прогрев {sheet} завершён, запросов к API: {api_req.requests_count}.')
+        except RequestLimitExceeded:
+            logger.info(f'Прогрев {sheet} прерван: исчерпан бюджет запросов к API на час.')
+        except Exception:
+            self.pending_sheets.pop(0)
+            logger.warning(f'Ошибка прогрева глобальной кампании {global_campaign_id}:\n{traceback.format_exc()}')
+        finally:
+            if api_req:
+                self.budget_spent += api_req.requests_count
+                api_req.close()
+            self._save_state()
+
+        return True
+
+
+def get_prewarmer(session_maker: sessionmaker) -> Prewarmer | None:
+    """
+    Прогрев включается переменной PREWARM_ENABLED и требует подключенного хранилища фактов.
+    Состояние прогрева хранится в каталоге хранилища фактов
+    :param session_maker:
+    :return:
+    """
+    if not PREWARM_ENABLED:
+        return None
+    if fact_store is None:
+        logger.warning('Прогрев данных отключен: не задан каталог хранилища фактов (FACT_STORE_DIR).')
+        return None
+    return Prewarmer(session_maker, state_path=fact_store.base_dir / 'prewarm_state.json')
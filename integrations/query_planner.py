@@ -0,0 +1,192 @@
+"""
+Планировщик запросов к API AppMetrica. Наборы данных отчёта с одним источником (префикс ym:i, ym:s, ...),
+фильтрами, api-адресом и группировкой по дню объединяются в один запрос: группировки и метрики наборов
+объединяются, а каждый набор получается из общего ответа суммированием по своим группировкам.
+Регистрировать можно только наборы с аддитивными метриками (как и для хранилища фактов).
+Кроме того, набор данных может быть получен при обработке ответа на другой запрос отчёта (см. offer)
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+import pandas as pd
+
+from integrations.frame_utils import TOTAL_LABEL, aggregate_with_totals
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """
+    Набор данных - параметры запроса AsyncYandexAppAPI.get_data
+    """
+    metrics: str
+    dimensions: str
+    filter_label: str
+    url: str | None = None
+    date_dimension: str | None = None
+    extra_filters: str | None = None
+
+    @property
+    def source(self) -> str:
+        """
+        Источник данных AppMetrica (префикс метрик, например ym:i)
+        """
+        return self.metrics.rsplit(':', 1)[0]
+
+    @property
+    def merge_key(self) -> tuple:
+        return self.source, self.filter_label, self.url, self.date_dimension, self.extra_filters
+
+
+def _merge_values(values: list[str]) -> str:
+    """
+    Объединение списков через запятую без повторов (с сохранением порядка)
+    """
+    return ','.join(dict.fromkeys(item for value in values for item in value.split(',')))
+
+
+def merge_datasets(datasets: list[Dataset]) -> Dataset:
+    """
+    Общий запрос для совместимых наборов данных
+    :param datasets: наборы с одинаковым merge_key
+    :return:
+    """
+    first = datasets[0]
+    return Dataset(_merge_values([dataset.metrics for dataset in datasets]),
+                   _merge_values([dataset.dimensions for dataset in datasets]),
+                   first.filter_label, first.url, first.date_dimension, first.extra_filters)
+
+
+def split_sections(df: pd.DataFrame) -> list[pd.DataFrame]:
+    """
+    Разделение объединённого ответа на ответы отдельных запросов (каждый начинается со строки итогов)
+    :param df:
+    :return:
+    """
+    starts = [i for i, value in enumerate(df.iloc[:, 0]) if value == TOTAL_LABEL] or [0]
+    return [df.iloc[start:end] for start, end in zip(starts, starts[1:] + [len(df)])]
+
+
+def derive_dataset(merged_df: pd.DataFrame, merged: Dataset, dataset: Dataset) -> pd.DataFrame:
+    """
+    Набор данных из ответа на общий запрос: суммирование метрик набора по его группировкам
+    (отдельно для ответа каждого запроса, со строкой итогов в начале - как в ответе API)
+    :param merged_df: ответ на общий запрос (get_data)
+    :param merged: общий запрос
+    :param dataset: набор данных
+    :return:
+    """
+    merged_dimensions = merged.dimensions.split(',')
+    merged_metrics = merged.metrics.split(',')
+    dimensions = dataset.dimensions.split(',')
+    positions = [merged_dimensions.index(dimension) for dimension in dimensions] + \
+                [len(merged_dimensions) + merged_metrics.index(metric) for metric in dataset.metrics.split(',')]
+
+    if merged_df.empty:
+        return merged_df.iloc[:, positions]
+    parts = [aggregate_with_totals(section.iloc[1:, positions], len(dimensions))
+             for section in split_sections(merged_df)]
+    return pd.concat(parts, ignore_index=True)
+
+
+class QueryPlanner:
+    """
+    Объединение запросов отчёта: зарегистрированные совместимые наборы данных запрашиваются одним
+    общим запросом (один раз на отчёт), ответ хранится до получения из него всех наборов
+    """
+
+    def __init__(self, row_limit: int | None = None):
+        """
+        :param row_limit: ограничение количества строк ответа API (limit). Если ответ на общий запрос
+        его достиг (данные могут быть неполными), наборы запрашиваются по отдельности
+        """
+        self.row_limit = row_limit
+        # общий запрос по набору данных
+        self._merged: dict[Dataset, Dataset] = {}
+        # наборы, ещё не полученные из ответа на общий запрос
+        self._pending: dict[Dataset, set[Dataset]] = {}
+        self._tasks: dict[Dataset, asyncio.Task] = {}
+        # наборы, полученные из ответов на другие запросы
+        self._offered: dict[Dataset, pd.DataFrame] = {}
+
+    def add(self, *datasets: Dataset):
+        """
+        Регистрация наборов данных отчёта (только с аддитивными метриками)
+        :param datasets:
+        :return:
+        """
+        groups: dict[tuple, list[Dataset]] = {}
+        for dataset in [*self._merged, *datasets]:
+            groups.setdefault(dataset.merge_key, [])
+            if dataset not in groups[dataset.merge_key]:
+                groups[dataset.merge_key].append(dataset)
+
+        self._merged.clear()
+        self._pending.clear()
+        for group in groups.values():
+            if len(group) < 2:
+                continue
+            merged = merge_datasets(group)
+            for dataset in group:
+                self._merged[dataset] = merged
+            self._pending[merged] = set(group)
+            logger.info(f'Запросы {", ".join(dataset.dimensions for dataset in group)} '
+                        f'объединены в один: {merged.metrics} / {merged.dimensions}')
+
+    def offer(self, dataset: Dataset, df: pd.DataFrame):
+        """
+        Набор данных, полученный при обработке ответа на другой запрос (в формате ответа API),
+        хранится до первого запроса набора (см. take)
+        :param dataset:
+        :param df:
+        :return:
+        """
+        self._offered[dataset] = df
+
+    def take(self, dataset: Dataset) -> pd.DataFrame | None:
+        """
+        Полученный заранее набор данных (None - набор запрашивается)
+        """
+        return self._offered.pop(dataset, None)
+
+    def get_merged(self, dataset: Dataset) -> Dataset | None:
+        """
+        Общий запрос, в который входит набор данных (None - набор запрашивается отдельно)
+        """
+        return self._merged.get(dataset)
+
+    async def fetch(self, merged: Dataset, fetch: Callable[[Dataset], Awaitable[pd.DataFrame]]) -> pd.DataFrame | None:
+        """
+        Ответ на общий запрос (запрос выполняется один раз, параллельные вызовы ожидают его)
+        :param merged: общий запрос
+        :param fetch: функция запроса данных
+        :return: ответ или None, если ответ достиг ограничения количества строк
+        """
+        if merged not in self._tasks:
+            self._tasks[merged] = asyncio.ensure_future(self._fetch_checked(merged, fetch))
+        return await self._tasks[merged]
+
+    async def _fetch_checked(self, merged: Dataset, fetch: Callable[[Dataset], Awaitable[pd.DataFrame]]):
+        merged_df = await fetch(merged)
+        if self.row_limit and any(len(section) - 1 >= self.row_limit for section in split_sections(merged_df)):
+            logger.warning(f'Ответ на общий запрос {merged.dimensions} достиг ограничения в {self.row_limit} строк, '
+                           f'наборы данных будут запрошены по отдельности.')
+            return None
+        return merged_df
+
+    def release(self, dataset: Dataset):
+        """
+        Набор данных получен: ответ на общий запрос удаляется после получения всех входящих в него наборов
+        :param dataset:
+        :return:
+        """
+        merged = self._merged.get(dataset)
+        pending = self._pending.get(merged)
+        if pending is None:
+            return
+        pending.discard(dataset)
+        if not pending:
+            self._tasks.pop(merged, None)
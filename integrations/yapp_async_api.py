@@ -0,0 +1,750 @@
+"""
+Асинхронный клиент API отчётов AppMetrica. Запросы по url-параметрам и независимые запросы листа
+выполняются параллельно (не более APPMETRICA_CONCURRENCY одновременно на отчёт) через общую HTTP-сессию,
+разбор csv и обработка DataFrame-ов выполняются в executor, поэтому один процесс может формировать
+несколько отчётов в одном цикле событий. Синхронный интерфейс - YandexAppAPI (integrations/yapp_data_api.py)
+"""
+import asyncio
+import contextvars
+import functools
+import hashlib
+import io
+import itertools
+import json
+import logging
+import tempfile
+from concurrent.futures import Executor
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from time import perf_counter
+from typing import Any, AsyncIterator, BinaryIO, Callable, Iterator
+
+import aiohttp
+import pandas as pd
+
+from get_utm_tag.test_part2 import get_campaign_params
+from integrations.aggregations import (
+    LAUNCH_EVENT_LABEL,
+    summarize_sessions,
+    summarize_sessions_by_time,
+    build_events_stats,
+    build_all_campaigns,
+    build_campaign_groups,
+    build_week_distribution,
+    build_installs_breakdown,
+)
+from integrations.fact_store import FactStore, fact_store as default_fact_store, days_range, split_into_ranges
+from integrations.frame_utils import aggregate_with_totals, drop_totals_rows
+from integrations.query_planner import Dataset, QueryPlanner, derive_dataset
+from settings import (
+    APPMETRICA_API_URL,
+    APPMETRICA_CONCURRENCY,
+    APPMETRICA_HTTP_POOL_SIZE,
+    FACT_STORE_MAX_RANGE_DAYS,
+    INSTALLS_TOP_REGIONS,
+    INSTALLS_TOP_OC,
+    INSTALLS_TOP_BRANDS,
+    SPILL_THRESHOLD_BYTES,
+    SPILL_CHUNK_ROWS,
+)
+from utils.checkpoints import ReportCheckpoints
+from utils.metrics import API_REQUEST_DURATION, API_REQUESTS, CACHE_LOOKUPS
+from utils.profiling import run_profiled
+from utils.rate_limiter import get_rate_limiter
+from utils.report_stats import ReportStats
+
+logger = logging.getLogger(__name__)
+
+# установки по ОС и модели устройства (листы установок): запрашиваются одним запросом, см. QueryPlanner.
+# Модель устройства почти однозначно определяет ОС, поэтому в общем ответе примерно столько же строк,
+# сколько моделей. Время установки и город не объединяются: произведение с ними группировок даёт
+# порядка строки на установку и достигает ограничения количества строк ответа
+INSTALLS_METRIC = 'ym:i:advInstallDevices'
+INSTALLS_DATASETS = [Dataset(INSTALLS_METRIC, dimension, 'ym:ts:urlParameter', date_dimension='ym:i:date')
+                     for dimension in ('ym:i:operatingSystem', 'ym:i:mobileDeviceModel')]
+# сессии по времени начала (лист "Распределение по неделям"): получаются из ответа с сессиями листа
+# "Все кампании", см. summarize_sessions_by_time
+SESSIONS_BY_TIME_DATASET = Dataset('ym:s:sessions', 'ym:s:dateTime', 'ym:ts:urlParameter', date_dimension='ym:s:date')
+
+
+class RequestLimitExceeded(RuntimeError):
+    """
+    Исчерпано ограничение количества запросов к API клиента (max_requests)
+    """
+
+
+def quote_filter_value(value: str) -> str:
+    """
+    Строковое значение для условия фильтра AppMetrica (в кавычках, с экранированием)
+    :param value:
+    :return:
+    """
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def create_http_session(pool_size: int = APPMETRICA_HTTP_POOL_SIZE) -> aiohttp.ClientSession:
+    """
+    HTTP-сессия с пулом соединений, которую могут использовать несколько отчётов одного цикла событий.
+    Ответы AppMetrica формируются долго, поэтому общее ограничение времени запроса не устанавливается
+    :param pool_size: максимальное количество соединений
+    :return:
+    """
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size),
+                                 timeout=aiohttp.ClientTimeout(total=None))
+
+
+class AsyncYandexAppAPI:
+    def __init__(self, yapp_token, app_id, date1, date2, campaigns_data: list[tuple], yd_login: str,
+                 fact_store: FactStore | None = default_fact_store, checkpoints: ReportCheckpoints | None = None,
+                 accuracy: str = 'full', url_params: dict[str, str | None] | None = None,
+                 stats: ReportStats | None = None, http_session: aiohttp.ClientSession | None = None,
+                 executor: Executor | None = None, concurrency: int = APPMETRICA_CONCURRENCY,
+                 plan_queries: bool = True, launch_event_label: str | None = None, row_limit: int | None = None,
+                 max_requests: int | None = None):
+        """
+        Перед запросами данных требуется prepare() (или использование как async with)
+        :param http_session: общая HTTP-сессия (None - создаётся в prepare и закрывается в close)
+        :param executor: executor для разбора csv и обработки данных (None - executor цикла событий по умолчанию)
+        :param concurrency: максимальное количество одновременных запросов к API
+        :param plan_queries: объединять запросы наборов данных отчёта (см. QueryPlanner)
+        :param launch_event_label: метка события запуска приложения для подсчёта активных пользователей
+        (None - LAUNCH_EVENT_LABEL)
+        :param row_limit: ограничение количества строк ответа API (None - limit из params_config.json)
+        :param max_requests: максимальное количество запросов к API (None - без ограничения), при превышении
+        запрос не выполняется и вызывается RequestLimitExceeded
+        """
+        self.yapp_token = yapp_token
+        self.api_url = f'{APPMETRICA_API_URL}/stat/v1/data.csv'
+        self.header = {'Authorization': yapp_token}
+        self.app_id = app_id
+        self.yd_login = yd_login
+
+        self.date1_repr = date1
+        self.date2_repr = date2
+        # перевод строкового значения даты в python-объект date для вычислений
+        self.date1 = datetime.strptime(date1, '%Y-%m-%d').date()
+        self.date2 = datetime.strptime(date2, '%Y-%m-%d').date()
+
+        self.campaigns_data = pd.DataFrame(campaigns_data, columns=['campaign_id', 'campaign_name', 'campaign_group'])
+        self.campaign_ids = self.campaigns_data['campaign_id'].tolist()
+        # заполнитель для подстановки параметра содержащего campaign_id
+        self.url_param_placeholder = "{{URL_PARAM}}"
+        # точность (семплирование) данных AppMetrica: full, high, medium, low или доля от 0 до 1
+        self.accuracy = accuracy
+        self.launch_event_label = launch_event_label or LAUNCH_EVENT_LABEL
+        # хранилище посуточных данных (None - все данные запрашиваются из API),
+        # семплированные данные в хранилище не сохраняются
+        self.fact_store = fact_store if accuracy == 'full' else None
+        # контрольные точки отчёта (None - результаты запросов не сохраняются)
+        self.checkpoints = checkpoints
+        # количество выполненных запросов к API AppMetrica и ограничение на него
+        self.requests_count = 0
+        self.max_requests = max_requests
+        # показатели этапов формирования отчёта (время, объём данных, память);
+        # объём данных параллельных этапов учитывается во всех открытых этапах
+        self.stats = stats or ReportStats()
+        # заранее полученные параметры отслеживания кампаний ЯД (например, общие для пакета отчётов)
+        self.known_url_params = url_params or {}
+        # id кампаний по url-параметрам, содержащим campaign_id (заполняется в prepare)
+        self.ids_by_parameter: dict[str, list] = {}
+
+        self.http_session = http_session
+        self._own_http_session = http_session is None
+        self.executor = executor
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        # ограничение количества строк ответа API (limit из params_config.json)
+        self.row_limit = row_limit or self._get_row_limit()
+        # объединение запросов отчёта к одному источнику данных
+        self.planner = QueryPlanner(self.row_limit)
+        self.plan_queries = plan_queries
+        # с хранилищем фактов запросы не объединяются: общий ответ, достигший ограничения количества строк,
+        # делится по дням до отдельных запросов (см. _get_days_range), что дороже запросов наборов по отдельности,
+        # а при повторных отчётах наборы и так собираются из сохранённых дней
+        if plan_queries and not self.fact_store:
+            self.planner.add(*INSTALLS_DATASETS)
+
+    async def prepare(self):
+        """
+        Создание HTTP-сессии (если не передана) и получение url-параметров кампаний
+        :return:
+        """
+        if self.http_session is None:
+            self.http_session = create_http_session()
+        with self.stats.stage('url_params'):
+            # API Яндекс.Директ и хранилище фактов - синхронные, выполняются в executor
+            if self.checkpoints:
+                self.ids_by_parameter = await self._in_executor(
+                    self.checkpoints.run, 'url_params', self._get_campaign_url_param, self.yd_login)
+            else:
+                self.ids_by_parameter = await self._in_executor(self._get_campaign_url_param, self.yd_login)
+
+    async def close(self):
+        if self._own_http_session and self.http_session is not None:
+            await self.http_session.close()
+            self.http_session = None
+
+    async def __aenter__(self):
+        await self.prepare()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+        return False
+
+    async def _in_executor(self, func: Callable, *args, **kwargs) -> Any:
+        # функция выполняется в копии текущего контекста (открытые этапы ReportStats, профилировщик отчёта)
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(context.run, run_profiled, func, *args, **kwargs))
+
+    async def get_all_campaigns(self) -> pd.DataFrame:
+        """
+        Данные (сбор и обработка) для листа "Все кампании"
+        :return:
+        """
+        general_metrics = 'ym:ts:userClicks,ym:ts:advInstallDevices,ym:ts:clickToInstallConversion'
+        general_dimensions = f"ym:ts:urlParameter{{'{self.url_param_placeholder}'}}"
+
+        # запрос данных из API AppMetrica
+        logger.info('Запрос основных параметров, количества сессий и событий.')
+        general_df, sessions_stats_df, (total_events_df, log_count_df) = await asyncio.gather(
+            self.get_data(general_metrics, general_dimensions, 'ym:ts:urlParameter'),
+            self._run_stage('sessions_stats', self._get_sessions_stats),
+            self._run_stage('events_stats', self._get_events_stats),
+        )
+
+        return await self._in_executor(build_all_campaigns, self.campaigns_data, general_df, sessions_stats_df,
+                                       total_events_df, log_count_df)
+
+    async def _run_stage(self, stage: str, func: Callable) -> Any:
+        """
+        Выполнение этапа с сохранением результата в контрольной точке (если они используются)
+        :param stage: имя этапа
+        :param func: асинхронная функция этапа
+        :return: результат этапа
+        """
+        if self.checkpoints:
+            return await self.checkpoints.run_async(stage, func)
+        return await func()
+
+    async def _get_sessions_stats(self) -> pd.DataFrame:
+        """
+        Показатели сессий по кампаниям (ответ API обрабатывается частями, см. summarize_sessions)
+        :return: DataFrame с колонками campaign_id, sessions, mean_timespent, median_timespent,
+        sessions_lt_10, sessions_10_30, sessions_gt_30
+        """
+        metrics = 'ym:s:sessions,ym:s:totalSessionDurationPerUser'
+        dimensions = f"ym:s:profileUrlParameter{{'{self.url_param_placeholder}'}},ym:s:session"
+
+        if not self.plan_queries:
+            # колонка id сессии не читается
+            return await self.aggregate_chunks(summarize_sessions, metrics, dimensions, 'ym:ts:urlParameter',
+                                               usecols=[0, 2, 3], date_dimension='ym:s:date')
+
+        # сессии по времени начала считаются из того же ответа и используются вместо отдельного запроса
+        sessions_stats_df, sessions_by_time_df = await self.aggregate_chunks(
+            functools.partial(summarize_sessions_by_time, row_limit=self.row_limit), metrics,
+            f'{dimensions},ym:s:dateTime', 'ym:ts:urlParameter', usecols=[0, 2, 3, 4], date_dimension='ym:s:date')
+        if sessions_by_time_df is not None:
+            self.planner.offer(SESSIONS_BY_TIME_DATASET, sessions_by_time_df)
+        return sessions_stats_df
+
+    async def _get_events_stats(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Количество событий и активных пользователей по кампаниям. Событие запуска приложения отбирается
+        фильтром запроса, поэтому оба ответа содержат по строке на кампанию
+        :return: DataFrame-ы с колонками (campaign_id, events_count) и (campaign_id, active_users)
+        """
+        dimensions = f"ym:ce2:profileUrlParameter{{'{self.url_param_placeholder}'}}"
+        launch_filter = f'ym:ce2:eventLabel=={quote_filter_value(self.launch_event_label)}'
+
+        events_df, active_users_df = await asyncio.gather(
+            self._get_events_count(),
+            # количество устройств за период не складывается из количеств за дни - без хранилища фактов
+            self.get_data('ym:ce2:devicesWithEvent', dimensions, 'ym:ts:urlParameter', extra_filters=launch_filter),
+        )
+        return await self._in_executor(build_events_stats, events_df, active_users_df)
+
+    async def _get_events_count(self) -> pd.DataFrame:
+        """
+        Количество событий по кампаниям (ответ API)
+        """
+        dimensions = f"ym:ce2:profileUrlParameter{{'{self.url_param_placeholder}'}}"
+        return await self.get_data('ym:ce2:allEvents', dimensions, 'ym:ts:urlParameter', date_dimension='ym:ce2:date')
+
+    async def prewarm_all_campaigns(self):
+        """
+        Запрос данных листа "Все кампании", которые сохраняются в хранилище фактов (сессии и количество событий),
+        для прогрева хранилища (см. Prewarmer). Данные без группировки по дню не запрашиваются: они
+        не сохраняются и запрашиваются заново при каждом отчёте
+        :return:
+        """
+        await asyncio.gather(self._get_sessions_stats(), self._get_events_count())
+
+    async def get_campaign_groups(self, general_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Данные (обработка) для листа "Группы кампаний"
+        :param general_df:
+        :return: DataFrame
+        """
+        return await self._in_executor(build_campaign_groups, self.campaigns_data, general_df)
+
+    async def get_week_distribution(self) -> pd.DataFrame:
+        """
+        Получение и обработка данных для листа "Распределение по неделям"
+        :return:
+        """
+        logger.info('Запрос установок и сессий, сгруппированных по дате.')
+        installs_df, sessions_df = await asyncio.gather(
+            self.get_data(INSTALLS_METRIC, 'ym:i:dateTime', 'ym:ts:urlParameter', date_dimension='ym:i:date'),
+            self.get_data('ym:s:sessions', 'ym:s:dateTime', 'ym:ts:urlParameter', date_dimension='ym:s:date'),
+        )
+
+        return await self._in_executor(build_week_distribution, installs_df, sessions_df)
+
+    async def get_retention_by_weeks(self) -> pd.DataFrame:
+        """
+        Данные по retention за период
+        :return:
+        """
+        # целое количество недель в периоде
+        weeks_num = max(1, int((self.date2 - self.date1).days / 7))
+
+        # отдельный url api-запрос для получения retention
+        api_url = f'{APPMETRICA_API_URL}/v2/user/acquisition.csv'
+
+        # метрика retention
+        metric = r'retentionWeek{{week_num}}Percentage'
+        # метрики для запроса
+        metrics = f','.join([metric.replace('{{week_num}}', str(_)) for _ in range(1, weeks_num + 1)])
+
+        # группировка по кампаниям
+        dimension = fr"urlParameter{{'{self.url_param_placeholder}'}}"
+
+        filters = 'ym:ts:urlParameter'
+
+        logger.info(f'Запрашиваю retention-rate за {weeks_num} недель.')
+        # получение данных по отдельном api-адресу
+        retention_df = await self.get_data(metrics, dimension, filters, url=api_url)
+
+        # удаление строки итогов
+        try:
+            retention_df = retention_df.drop(index=[0]).reset_index(drop=True)
+        except KeyError:
+            logger.warning('За указанный период не удалось получить параметр retention')
+            return pd.DataFrame()
+
+        labels = retention_df.columns.tolist()
+        labels[0] = 'campaign_id'
+        retention_df.columns = labels
+
+        return retention_df.fillna(0)
+
+    async def get_events(self) -> pd.DataFrame:
+        """
+        Получение и обработка данных для листа "События"
+        :return:
+        """
+        # ДОБАВИТЬ ФИЛЬТРЫ ПО КАМПАНИЯМ (см. постман)
+        metrics = 'ym:ce2:allEvents,ym:ce2:devicesWithEvent,ym:ce2:eventsPerDevice,ym:ce2:devicesPercent'
+        dimensions = 'ym:ce2:eventLabel'
+        filters = 'ym:ts:urlParameter'
+
+        logger.info('Запрос суммарного количества событий.')
+        events_df = await self.get_data(metrics, dimensions, filters)
+
+        labels = ['event', 'count_event', 'users', 'event_per_user', 'perc_all_users']
+        events_df.columns = labels
+
+        return events_df.fillna(0)
+
+    async def get_installs_by_regions(self, top_n: int = INSTALLS_TOP_REGIONS) -> pd.DataFrame:
+        """
+        Данные для листа "Регионы (Установки)"
+        :param top_n: количество выводимых городов (остальные объединяются в строку "Прочие"), 0 - без ограничения
+        :return:
+        """
+        logger.info('Запрос данных по установкам (регион).')
+        return await self._get_installs_by('ym:i:regionCity', 'city', top_n)
+
+    async def get_installs_by_oc(self, top_n: int = INSTALLS_TOP_OC) -> pd.DataFrame:
+        """
+        Данные для листа "ОС (Установки)"
+        :param top_n: количество выводимых ОС (остальные объединяются в строку "Прочие"), 0 - без ограничения
+        :return:
+        """
+        logger.info('Запрос данных по установкам (ОС).')
+        return await self._get_installs_by('ym:i:operatingSystem', 'oc', top_n)
+
+    async def get_installs_by_brand(self, top_n: int = INSTALLS_TOP_BRANDS) -> pd.DataFrame:
+        """
+        Данные для листа "Марка (Установки)"
+        :param top_n: количество выводимых моделей (остальные объединяются в строку "Прочие"), 0 - без ограничения
+        :return:
+        """
+        logger.info('Запрос данных по установкам (марка).')
+        return await self._get_installs_by('ym:i:mobileDeviceModel', 'device_type', top_n)
+
+    async def _get_installs_by(self, dimension: str, label: str, top_n: int) -> pd.DataFrame:
+        """
+        Запрос установок, сгруппированных по одному измерению (обработка - см. build_installs_breakdown)
+        :param dimension: группировка из AppMetrica
+        :param label: имя колонки с группировкой в результирующем DataFrame
+        :param top_n: количество выводимых строк, 0 - без ограничения
+        :return: DataFrame с колонками (label, installs), отсортированный по убыванию установок
+        """
+        installs_df = await self.get_data(INSTALLS_METRIC, dimension, 'ym:ts:urlParameter', date_dimension='ym:i:date')
+        return await self._in_executor(build_installs_breakdown, installs_df, label, top_n)
+
+    async def get_data(self, metrics: str, dimensions: str, filter_label: str, url: str = None,
+                       date_dimension: str = None, extra_filters: str = None) -> pd.DataFrame:
+        """
+        Запрос данных из API AppMetrica по всем url-параметрам, содержащим campaign_id (параллельно)
+        :param metrics: метрики из AppMetrica
+        :param dimensions: группировки из AppMetrica
+        :param filter_label: параметр фильтрации из AppMetrica
+        :param url: альтернативный api-адрес
+        :param date_dimension: группировка по дню (например, ym:s:date). Если передана и подключено хранилище
+        фактов, из API запрашиваются только отсутствующие в хранилище дни. Только для аддитивных метрик
+        :param extra_filters: дополнительное условие фильтрации (объединяется с фильтром по кампаниям через AND)
+        :return: DataFrame с nan-значениями, заполненными 0
+        """
+        with self.stats.stage('get_data', f'{metrics} / {dimensions}'):
+            if self.checkpoints:
+                request_key = json.dumps([metrics, dimensions, filter_label, url, date_dimension, extra_filters])
+                stage = 'data_' + hashlib.sha1(request_key.encode('utf-8')).hexdigest()[:16]
+                data = await self.checkpoints.run_async(stage, self._fetch_planned, metrics, dimensions,
+                                                        filter_label, url, date_dimension, extra_filters)
+            else:
+                data = await self._fetch_planned(metrics, dimensions, filter_label, url, date_dimension, extra_filters)
+            self.stats.add_rows(len(data))
+        return data.fillna(0)
+
+    async def _fetch_planned(self, metrics: str, dimensions: str, filter_label: str, url: str = None,
+                             date_dimension: str = None, extra_filters: str = None) -> pd.DataFrame:
+        """
+        Набор данных, полученный из ответа на другой запрос, или из ответа на общий запрос (если набор объединён
+        с другими, см. QueryPlanner), иначе - отдельный запрос (см. get_data)
+        :return:
+        """
+        dataset = Dataset(metrics, dimensions, filter_label, url, date_dimension, extra_filters)
+        offered_df = self.planner.take(dataset)
+        if offered_df is not None:
+            return offered_df
+
+        merged = self.planner.get_merged(dataset)
+        if merged:
+            merged_df = await self.planner.fetch(merged, self._fetch_dataset)
+            self.planner.release(dataset)
+            if merged_df is not None:
+                return await self._in_executor(derive_dataset, merged_df, merged, dataset)
+
+        return await self._fetch_dataset(dataset)
+
+    async def _fetch_dataset(self, dataset: Dataset) -> pd.DataFrame:
+        return await self._fetch_data(dataset.metrics, dataset.dimensions, dataset.filter_label, dataset.url,
+                                      dataset.date_dimension, dataset.extra_filters)
+
+    async def _fetch_data(self, metrics: str, dimensions: str, filter_label: str, url: str = None,
+                          date_dimension: str = None, extra_filters: str = None) -> pd.DataFrame:
+        """
+        Запрос данных из API AppMetrica (или хранилища фактов) по всем url-параметрам (см. get_data)
+        :return:
+        """
+        parts = await asyncio.gather(*(
+            self._fetch_parameter_data(parameters, url, date_dimension)
+            for parameters in self._iter_parameters(metrics, dimensions, filter_label, extra_filters)
+        ))
+
+        data = pd.DataFrame()
+        for parameter_data in parts:
+            data = pd.concat([data, parameter_data]).reset_index(drop=True)
+        return data
+
+    async def _fetch_parameter_data(self, parameters: dict, url: str = None,
+                                    date_dimension: str = None) -> pd.DataFrame:
+        if self.fact_store and date_dimension:
+            return await self._get_data_by_days(parameters, date_dimension, url)
+
+        with await self._download_csv(parameters, url) as csv_file:
+            return await self._in_executor(pd.read_csv, csv_file)
+
+    async def aggregate_chunks(self, aggregate: Callable[[Iterator[pd.DataFrame]], Any], metrics: str,
+                               dimensions: str, filter_label: str, usecols: list[int], url: str = None,
+                               date_dimension: str = None) -> Any:
+        """
+        Запрос данных из API AppMetrica по всем url-параметрам и обработка ответов частями по SPILL_CHUNK_ROWS
+        строк. Ответы не держатся в памяти целиком: они записываются во временные файлы (на диск - при превышении
+        SPILL_THRESHOLD_BYTES) и читаются частями, только колонки usecols. Группировки читаются как строки.
+        Части содержат строки итогов (по одной на url-параметр), nan-значения заполнены 0
+        :param aggregate: функция обработки итератора частей (выполняется в executor)
+        :param metrics: метрики из AppMetrica
+        :param dimensions: группировки из AppMetrica
+        :param filter_label: параметр фильтрации из AppMetrica
+        :param usecols: номера колонок ответа, которые требуются для обработки
+        :param url: альтернативный api-адрес
+        :param date_dimension: группировка по дню для хранилища фактов (см. get_data)
+        :return: результат aggregate
+        """
+        dimensions_count = len(dimensions.split(','))
+        with self.stats.stage('iter_data', f'{metrics} / {dimensions}'):
+            # ошибки собираются, чтобы закрыть уже загруженные файлы
+            sources = await asyncio.gather(*(
+                self._fetch_chunks_source(parameters, usecols, url, date_dimension)
+                for parameters in self._iter_parameters(metrics, dimensions, filter_label)
+            ), return_exceptions=True)
+            try:
+                for source in sources:
+                    if isinstance(source, BaseException):
+                        raise source
+                return await self._in_executor(aggregate, self._iter_chunks(sources, usecols, dimensions_count))
+            finally:
+                for source in sources:
+                    if not isinstance(source, (pd.DataFrame, BaseException)):
+                        source.close()
+
+    async def _fetch_chunks_source(self, parameters: dict, usecols: list[int], url: str = None,
+                                   date_dimension: str = None) -> pd.DataFrame | BinaryIO:
+        """
+        Ответ для обработки частями: DataFrame из хранилища фактов или временный файл с csv-ответом API
+        """
+        if self.fact_store and date_dimension:
+            data = await self._get_data_by_days(parameters, date_dimension, url)
+            return data.iloc[:, usecols].fillna(0)
+        return await self._download_csv(parameters, url)
+
+    def _iter_chunks(self, sources: list[pd.DataFrame | BinaryIO], usecols: list[int],
+                     dimensions_count: int) -> Iterator[pd.DataFrame]:
+        for source in sources:
+            if isinstance(source, pd.DataFrame):
+                self.stats.add_rows(len(source))
+                yield source
+                continue
+
+            chunks = pd.read_csv(source, usecols=usecols, chunksize=SPILL_CHUNK_ROWS,
+                                 dtype={i: str for i in range(dimensions_count)})
+            for chunk in chunks:
+                self.stats.add_rows(len(chunk))
+                yield chunk.fillna(0)
+
+    def _iter_parameters(self, metrics: str, dimensions: str, filter_label: str,
+                         extra_filters: str = None) -> Iterator[dict]:
+        """
+        Параметры запросов к API для каждого url-параметра, содержащего campaign_id
+        :param metrics: метрики из AppMetrica
+        :param dimensions: группировки из AppMetrica (с заполнителем url-параметра)
+        :param filter_label: параметр фильтрации из AppMetrica
+        :param extra_filters: дополнительное условие фильтрации
+        :return:
+        """
+        for url_parameter in self.ids_by_parameter:
+            parameter_dimensions = dimensions.replace(self.url_param_placeholder, url_parameter)
+            parameters = self._get_parameters(self.ids_by_parameter[url_parameter], metrics, parameter_dimensions,
+                                              filter_label, url_parameter, extra_filters)
+            logger.debug(f'Параметры запроса: {parameters}')
+            yield parameters
+
+    async def _download_csv(self, parameters: dict, url: str = None) -> BinaryIO:
+        """
+        Потоковая загрузка csv-ответа API во временный файл
+        (в памяти до SPILL_THRESHOLD_BYTES, далее - на диске)
+        :param parameters: параметры запроса к API
+        :param url: альтернативный api-адрес
+        :return: файл, установленный на начало
+        """
+        csv_file = tempfile.SpooledTemporaryFile(max_size=SPILL_THRESHOLD_BYTES)
+        try:
+            async with self._request(parameters, url) as response:
+                async for block in response.content.iter_chunked(1024 * 1024):
+                    csv_file.write(block)
+                    self.stats.add_bytes(len(block))
+        except BaseException:
+            csv_file.close()
+            raise
+        csv_file.seek(0)
+        return csv_file
+
+    async def _get_data_by_days(self, parameters: dict, date_dimension: str, url: str = None) -> pd.DataFrame:
+        """
+        Сборка данных за период из хранилища фактов: из API запрашиваются только отсутствующие
+        или ещё не окончательные дни (непрерывными периодами не длиннее FACT_STORE_MAX_RANGE_DAYS дней,
+        с дополнительной группировкой по дню). Дни сохраняются по мере получения ответов (запрос, прерванный
+        ошибкой, не теряет уже полученные периоды), неполные ответы (см. _get_days_range) не сохраняются
+        :param parameters: параметры запроса к API
+        :param date_dimension: группировка по дню
+        :param url: альтернативный api-адрес
+        :return: DataFrame в формате ответа AppMetrica (со строкой итогов)
+        """
+        dataset_key = self.fact_store.dataset_key(parameters, url)
+        dimensions_count = len(parameters['dimensions'].split(','))
+
+        days = days_range(self.date1, self.date2)
+        missing_days = await self._in_executor(self.fact_store.missing_days, self.app_id, dataset_key, days)
+        cached_days = [day for day in days if day not in missing_days]
+        logger.info(f'Хранилище фактов: дней в хранилище - {len(cached_days)}, к запросу - {len(missing_days)}.')
+        CACHE_LOOKUPS.inc(len(cached_days), cache='fact_store', result='hit')
+        CACHE_LOOKUPS.inc(len(missing_days), cache='fact_store', result='miss')
+
+        parts = await self._in_executor(self.fact_store.load_days, self.app_id, dataset_key, cached_days)
+        range_results = await asyncio.gather(*(
+            self._get_days_range(parameters, date_dimension, date1, date2, dataset_key, url)
+            for date1, date2 in split_into_ranges(missing_days, FACT_STORE_MAX_RANGE_DAYS)
+        ))
+        parts.extend(itertools.chain.from_iterable(range_results))
+
+        return await self._in_executor(aggregate_with_totals, pd.concat(parts, ignore_index=True), dimensions_count)
+
+    async def _get_days_range(self, parameters: dict, date_dimension: str, date1: date, date2: date,
+                              dataset_key: str, url: str = None) -> list[pd.DataFrame]:
+        """
+        Запрос данных за период с дополнительной группировкой по дню (без строки итогов), полные данные
+        сохраняются в хранилище фактов по дням. Ответ, достигший ограничения количества строк, может быть
+        неполным: период делится пополам и запрашивается по частям, неполный ответ за один день не сохраняется
+        :return: данные по дням периода (без группировки по дню)
+        """
+        dimensions_count = len(parameters['dimensions'].split(','))
+        range_parameters = dict(parameters, date1=str(date1), date2=str(date2),
+                                dimensions=f"{parameters['dimensions']},{date_dimension}")
+        async with self._request(range_parameters, url) as response:
+            content = await response.read()
+        self.stats.add_bytes(len(content))
+        # группировки читаются как строки, чтобы типы не зависели от состава дня
+        range_df = await self._in_executor(pd.read_csv, io.BytesIO(content),
+                                           dtype={i: str for i in range(dimensions_count + 1)})
+        range_df = drop_totals_rows(range_df)
+        complete = not self.row_limit or len(range_df) < self.row_limit
+        if complete or date1 == date2:
+            if not complete:
+                logger.warning(f'Ответ за {date1} достиг ограничения в {self.row_limit} строк, данные неполные '
+                               f'и не сохраняются в хранилище фактов.')
+            date_col = range_df.columns[dimensions_count]
+            day_parts = []
+            for day in days_range(date1, date2):
+                day_df = range_df[range_df[date_col] == day.isoformat()].drop(columns=date_col)
+                if complete:
+                    await self._in_executor(self.fact_store.save_day, self.app_id, dataset_key, day, day_df)
+                day_parts.append(day_df)
+            return day_parts
+
+        middle = date1 + timedelta(days=(date2 - date1).days // 2)
+        logger.info(f'Ответ за {date1} - {date2} достиг ограничения в {self.row_limit} строк, '
+                    f'период запрашивается по частям.')
+        first, second = await asyncio.gather(
+            self._get_days_range(parameters, date_dimension, date1, middle, dataset_key, url),
+            self._get_days_range(parameters, date_dimension, middle + timedelta(days=1), date2, dataset_key, url),
+        )
+        return first + second
+
+    @asynccontextmanager
+    async def _request(self, parameters: dict, url: str | None = None) -> AsyncIterator[aiohttp.ClientResponse]:
+        """
+        Запрос к App Metrica: ответ читается внутри контекста, после выхода соединение возвращается в пул.
+        Запрос выполняется после получения места в ограничении параллельных запросов отчёта
+        и токена в общем для всех воркеров бюджете запросов
+        :param parameters: параметры запроса
+        :param url: альтернативный api-адрес
+        :return:
+        """
+        rate_limiter = get_rate_limiter('appmetrica', self.yapp_token)
+
+        async with self._semaphore:
+            # запрос учитывается при фактической отправке: ожидающие места запросы, отменённые после
+            # ошибки параллельного запроса, не расходуют ограничение
+            if self.max_requests is not None and self.requests_count >= self.max_requests:
+                raise RequestLimitExceeded(f'Исчерпано ограничение запросов к API: {self.max_requests}')
+            self.requests_count += 1
+            if rate_limiter:
+                await rate_limiter.acquire_async()
+
+            # в случае если передан альтернативный api-адрес
+            url = url or self.api_url
+            start_time = perf_counter()
+            with API_REQUEST_DURATION.time(endpoint=url.rsplit('/', 1)[-1]):
+                try:
+                    response = await self.http_session.get(url, headers=self.header, params=parameters)
+                except aiohttp.ClientError:
+                    API_REQUESTS.inc(status_code='error')
+                    raise
+            API_REQUESTS.inc(status_code=str(response.status))
+            if response.status == 200:
+                logger.info(f'Запрос успешен! ({round(perf_counter() - start_time, 3)} cек)')
+            else:
+                logger.error('Ошибка запроса!')
+
+            try:
+                yield response
+            finally:
+                response.release()
+
+    def _get_campaign_url_param(self, yd_login) -> dict:
+        logger.info('Получаю параметры, содержащие campaign_id...')
+        result = []
+        url_params = {campaign_id: self.known_url_params[campaign_id] for campaign_id in self.campaign_ids
+                      if campaign_id in self.known_url_params}
+        missing_campaign_ids = [campaign_id for campaign_id in self.campaign_ids if campaign_id not in url_params]
+        if self.fact_store and missing_campaign_ids:
+            url_params.update(self.fact_store.load_url_params(yd_login, missing_campaign_ids))
+            missing_campaign_ids = [campaign_id for campaign_id in missing_campaign_ids
+                                    if campaign_id not in url_params]
+        CACHE_LOOKUPS.inc(len(url_params), cache='url_params', result='hit')
+        CACHE_LOOKUPS.inc(len(missing_campaign_ids), cache='url_params', result='miss')
+        if missing_campaign_ids:
+            missing_url_params = get_campaign_params(missing_campaign_ids, yd_login)
+            if self.fact_store:
+                self.fact_store.save_url_params(yd_login, missing_url_params)
+            url_params.update(missing_url_params)
+
+        for campaign_id in url_params:
+            if url_params[campaign_id]:
+                param = next(filter(lambda param: '{campaign_id}' in param, url_params[campaign_id].split('&')))
+                result.append((campaign_id, param))
+            else:
+                result.append((campaign_id, 'utm_campaign={campaign_id}'))
+
+        result = map(lambda t: (t[0], t[1].split('=')[0]), result)
+        result = pd.DataFrame(result, columns=['campaign_id', 'param'])
+        result = result.groupby('param')['campaign_id'].apply(list).to_dict()
+
+        return result
+
+    @staticmethod
+    def _get_row_limit() -> int | None:
+        """
+        Ограничение количества строк ответа API из шаблона параметров запроса
+        """
+        with open('params_config.json', encoding='utf-8') as file:
+            return json.load(file).get('limit')
+
+    def _get_parameters(self, campaign_ids: list, metrics: str, dimensions: str, filter_label: str,
+                        url_parameter: str, extra_filters: str = None) -> dict:
+        """
+        Извлекает шаблон и заполняет параметры запроса в соответствии с переданными параметрами
+        :param metrics: метрики из AppMetrica
+        :param dimensions: группировки из AppMetrica
+        :param filter_label: параметр фильтрации из AppMetrica
+        :param extra_filters: дополнительное условие фильтрации (объединяется с фильтром по кампаниям через AND)
+        :return: словарь dict с параметрами запроса
+        """
+        with open('params_config.json', encoding='utf-8') as file:
+            data = json.load(file)
+            data = json.dumps(data)
+
+        filters = map(str, campaign_ids)
+        filters = map(lambda item: f"{filter_label}{{'{url_parameter}'}}==" + item, filters)
+        filters = ' OR '.join(filters)
+        if extra_filters:
+            filters = f'({filters}) AND {extra_filters}'
+
+        data = data.replace('{{app_id}}', self.app_id)
+        data = data.replace('{{metrics}}', metrics)
+        data = data.replace('{{dimensions}}', dimensions)
+        # фильтр может содержать кавычки и обратную косую черту (значения меток событий)
+        data = data.replace('{{filters}}', json.dumps(filters)[1:-1])
+        data = data.replace('{{date1}}', self.date1_repr)
+        data = data.replace('{{date2}}', self.date2_repr)
+        data = data.replace('{{accuracy}}', self.accuracy)
+        data = json.loads(data)
+        if self.row_limit:
+            data['limit'] = self.row_limit
+        return data
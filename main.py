@@ -1,21 +1,36 @@
 import string
 import time
 import traceback
+import uuid
 from datetime import datetime, date
-import io
 import logging
+import tempfile
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import BinaryIO
+
+import pandas as pd
 import xlsxwriter
 
+from utils.data_export import DEFAULT_OUTPUT_FORMATS, create_data_archive, parse_output_formats, OUTPUT_EXTENSIONS
 from utils.xlsx_formatter import CreateXlsx
+from integrations.fact_store import FactStore, fact_store as default_fact_store
 from integrations.yapp_data_api import YandexAppAPI
-from utils.s3_storage import storage
+from utils.checkpoints import ReportCheckpoints, prune_checkpoints
+from utils.metrics import (QUEUE_DEPTH, REPORTS_IN_PROGRESS, REPORTS_TOTAL, REPORT_DURATION, WORKER_ERRORS,
+                           start_metrics_server)
+from utils.profiling import ReportProfiler
+from utils.report_stats import ReportStats
+from utils.s3_storage import get_storage
 from database.models import Report, GlobalCampaign, CampaignGroup
-from sqlalchemy import select
+from sqlalchemy import select, func, update
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import selectinload, Session
 
 from database.db import session_maker
-from settings import YAPP_TOKEN
+from integrations.prewarm import get_prewarmer
+from settings import (YAPP_TOKEN, REPORT_SPOOL_MAX_SIZE, XLSX_CONSTANT_MEMORY_ROWS, PREVIEW_ACCURACY, PROFILE_REPORTS,
+                      METRICS_PORT)
 
 logging.basicConfig(level=logging.INFO, format='[{asctime}] #{levelname:4} {name}:{lineno} - {message}', style='{')
 logger = logging.getLogger('main.py')
@@ -23,50 +38,163 @@ logger = logging.getLogger('main.py')
 S3_PATH = 'yandexapp_report_generator'
 
 
-def create_report(app_id, date1, date2, campaigns_data, yd_login: str, doc_header: str) -> bytes:
+@dataclass(frozen=True)
+class ReportTask:
     """
-    Функция для управления созданием отчёта
-    :param app_id:
-    :param date1:
-    :param date2:
-    :param campaigns_data:
-    :param yd_login:
+    Данные отчёта, необходимые для формирования, скопированные из БД при выборе отчёта из очереди.
+    Формирование и загрузка отчёта выполняются без открытой сессии БД
+    """
+    id: int
+    created_at: datetime
+    # данные приложения Yandex App
+    app_id: str
+    app_name: str
+    yd_login: str
+    launch_event_label: str | None
+    start_date: date
+    end_date: date
+    # данные кампаний ЯД глобальной кампании: (campaign_id, campaign_name, campaign_group), ...
+    campaigns_data: list[tuple]
+    output_formats: str | None
+    preview: bool
+    profile: bool
+
+    @classmethod
+    def from_report(cls, report: Report) -> 'ReportTask':
+        """
+        Копирование данных отчёта (связанные приложение и глобальная кампания должны быть загружены)
+        :param report:
+        :return:
+        """
+        return cls(
+            id=report.id,
+            created_at=report.created_at,
+            app_id=report.application.yandex_app_id,
+            app_name=report.application.name,
+            yd_login=report.application.yd_login,
+            launch_event_label=report.application.launch_event_label,
+            start_date=report.start_date,
+            end_date=report.end_date,
+            campaigns_data=report.global_campaign.get_campaigns_data(),
+            output_formats=report.output_formats,
+            preview=bool(report.preview),
+            profile=bool(report.profile),
+        )
+
+
+def create_xlsx_file(report_data: dict[str, pd.DataFrame], doc_header: str,
+                     stats: ReportStats = None) -> BinaryIO:
+    """
+    Функция для формирования xlsx-файла отчёта
+    :param report_data: таблицы отчёта
     :param doc_header:
-    :return:
+    :param stats: сборщик показателей этапов (время записи каждого листа и сохранения документа)
+    :return: временный файл с отчётом (позиция чтения в начале файла), закрытие файла - на вызывающей стороне
     """
-    api_req = YandexAppAPI(YAPP_TOKEN, app_id, date1, date2, campaigns_data, yd_login)
-    general = api_req.get_all_campaigns()
-    general_groups = api_req.get_campaign_groups(general)
-    week_distribution = api_req.get_week_distribution()
-    retention = api_req.get_retention_by_weeks()
-    events = api_req.get_events()
-    installs_info = api_req.get_installs_info()
+    stats = stats or ReportStats()
 
-    # создание файла в оперативной памяти
-    with io.BytesIO() as xlsx_file:
-        workbook = xlsxwriter.Workbook(xlsx_file, options={'in_memory': True})
-        # раскоментировать, если нужно сохрание в файловой системе
-        # workbook.filename = 'yapp_report.xlsx'
+    # для больших отчётов листы пишутся в режиме constant_memory: строки сбрасываются на диск по мере записи,
+    # поэтому память не растёт с количеством строк
+    max_rows = max(len(df) for df in report_data.values())
+    constant_memory = max_rows >= XLSX_CONSTANT_MEMORY_ROWS
+    if constant_memory:
+        logger.info(f'Отчёт содержит {max_rows} строк, формирование в режиме constant_memory.')
+
+    # создание временного файла: до REPORT_SPOOL_MAX_SIZE байт хранится в оперативной памяти, затем на диске
+    xlsx_file = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_SIZE)
+    try:
+        workbook = xlsxwriter.Workbook(xlsx_file, options={'constant_memory': constant_memory})
 
         # формирование листов
         xlsx_form = CreateXlsx(workbook, doc_header)
-        xlsx_form.write_general(general, sheet_name='Все кампании')
-        xlsx_form.write_general(general_groups, sheet_name='Группы кампаний')
-        xlsx_form.write_week_distribution(week_distribution)
-        xlsx_form.write_retention_by_weeks(retention, general)
-        xlsx_form.write_events(events)
-        xlsx_form.write_installs_by_regions(installs_info)
-        xlsx_form.write_installs_by_oc(installs_info)
-        xlsx_form.write_installs_by_brand(installs_info)
+        sheets = [
+            (xlsx_form.write_general, (report_data['general'], 'Все кампании')),
+            (xlsx_form.write_general, (report_data['general_groups'], 'Группы кампаний')),
+            (xlsx_form.write_week_distribution, (report_data['week_distribution'],)),
+            (xlsx_form.write_retention_by_weeks, (report_data['retention'], report_data['general'])),
+            (xlsx_form.write_events, (report_data['events'],)),
+            (xlsx_form.write_installs_by_regions, (report_data['installs_by_regions'],)),
+            (xlsx_form.write_installs_by_oc, (report_data['installs_by_oc'],)),
+            (xlsx_form.write_installs_by_brand, (report_data['installs_by_brand'],)),
+        ]
+        for write_sheet, args in sheets:
+            with stats.stage(write_sheet.__name__) as record:
+                write_sheet(*args)
+                record['rows'] = len(args[0])
 
         # закрытие и сохранение документа
-        workbook.close()
+        with stats.stage('workbook_close'):
+            workbook.close()
+    except Exception:
+        xlsx_file.close()
+        raise
 
-        xlsx_file.seek(0)
-        xlsx_file = xlsx_file.getvalue()
+    xlsx_file.seek(0)
     return xlsx_file
 
 
+def create_report(app_id, date1, date2, campaigns_data, yd_login: str, doc_header: str,
+                  output_formats: list[str] = None, checkpoints: ReportCheckpoints = None,
+                  accuracy: str = 'full', fact_store: FactStore | None = default_fact_store,
+                  url_params: dict[str, str | None] = None, stats: ReportStats = None,
+                  launch_event_label: str = None) -> dict[str, BinaryIO]:
+    """
+    Функция для управления созданием отчёта.
+    Возвращает временные файлы отчёта по форматам (позиция чтения в начале файла), закрытие файлов - на вызывающей
+    стороне
+    :param app_id:
+    :param date1:
+    :param date2:
+    :param campaigns_data:
+    :param yd_login:
+    :param doc_header:
+    :param output_formats: форматы выгрузки (xlsx, parquet, arrow, csv), по-умолчанию только xlsx
+    :param checkpoints: контрольные точки этапов для продолжения прерванной обработки
+    :param accuracy: точность данных AppMetrica (full - точные данные)
+    :param fact_store: хранилище посуточных данных AppMetrica (None - все данные запрашиваются из API)
+    :param url_params: заранее полученные параметры отслеживания кампаний ЯД {campaign_id: параметры}
+    :param stats: сборщик показателей этапов формирования отчёта
+    :param launch_event_label: метка события запуска приложения (None - LAUNCH_EVENT_LABEL)
+    :return: словарь {формат: файл}
+    """
+    output_formats = output_formats or DEFAULT_OUTPUT_FORMATS
+    stats = stats or ReportStats()
+
+    def run_stage(stage: str, func, *args):
+        # этап выполняется или загружается из контрольной точки
+        with stats.stage(stage):
+            return checkpoints.run(stage, func, *args) if checkpoints else func(*args)
+
+    report_data = {}
+    with YandexAppAPI(YAPP_TOKEN, app_id, date1, date2, campaigns_data, yd_login, fact_store=fact_store,
+                      checkpoints=checkpoints, accuracy=accuracy, url_params=url_params, stats=stats,
+                      launch_event_label=launch_event_label) as api_req:
+        report_data['general'] = run_stage('general', api_req.get_all_campaigns)
+        report_data['general_groups'] = run_stage('general_groups', api_req.get_campaign_groups,
+                                                  report_data['general'])
+        report_data['week_distribution'] = run_stage('week_distribution', api_req.get_week_distribution)
+        report_data['retention'] = run_stage('retention', api_req.get_retention_by_weeks)
+        report_data['events'] = run_stage('events', api_req.get_events)
+        report_data['installs_by_regions'] = run_stage('installs_by_regions', api_req.get_installs_by_regions)
+        report_data['installs_by_oc'] = run_stage('installs_by_oc', api_req.get_installs_by_oc)
+        report_data['installs_by_brand'] = run_stage('installs_by_brand', api_req.get_installs_by_brand)
+
+    report_files = {}
+    try:
+        for output_format in output_formats:
+            if output_format == 'xlsx':
+                report_files[output_format] = create_xlsx_file(report_data, doc_header, stats)
+            else:
+                with stats.stage(f'export_{output_format}'):
+                    report_files[output_format] = create_data_archive(report_data, output_format)
+    except Exception:
+        for file in report_files.values():
+            file.close()
+        raise
+
+    return report_files
+
+
 def get_request(session: Session) -> Report | None:
     """
     Функция для поиска нового запроса в БД
@@ -93,112 +221,300 @@ def get_request(session: Session) -> Report | None:
     return new_report_obj
 
 
-def initial_report_generation(session: Session, request: Report) -> tuple[bytes, str]:
+def get_report_header(app_name: str, start_date: date, end_date: date) -> str:
     """
-    Функция для сбора, обработки и передачи параметров, необходимых для создания отчёта в функцию создания отчёта
+    Заголовок листов отчёта (также используется как имя файла отчёта)
+    :param app_name:
+    :param start_date:
+    :param end_date:
+    :return:
+    """
+    # ru-формат записи даты
+    date_format = '%d.%m.%Y'
+    return f'Отчёт по приложению "{app_name}" {start_date.strftime(date_format)}-{end_date.strftime(date_format)}'
+
+
+def get_queue_depth(session: Session) -> int:
+    """
+    Количество отчётов, ожидающих обработки
     :param session:
-    :param request:
     :return:
     """
-    logger.info(f'Начинаю обработку запроса от {request.created_at}...')
+    stmt = select(func.count()).select_from(Report).where(Report.status_id == 1, Report.to_delete == False)
+    return session.execute(stmt).scalar()
 
-    request.status_id = 2
-    session.commit()
 
-    # данные приложения Yandex App
-    app_id = request.application.yandex_app_id
-    app_name: str = request.application.name
-    yd_login: str = request.application.yd_login
+def claim_report() -> ReportTask | None:
+    """
+    Выбор нового отчёта из очереди в короткой транзакции: отчёт переводится в статус 2 (в обработке),
+    его данные копируются, транзакция завершается до начала формирования отчёта
+    :return: данные отчёта или None, если очередь пуста
+    """
+    with session_maker() as session:
+        request = get_request(session)
+        QUEUE_DEPTH.set(get_queue_depth(session))
+        if request is None:
+            return None
 
-    start_date: date = request.start_date
-    end_date: date = request.end_date
+        task = ReportTask.from_report(request)
+        request.status_id = 2
+        session.commit()
+    return task
 
-    # ru-формат записи даты
-    date_format = '%d-%m-%Y'
-    start_date_ru = start_date.strftime(date_format)
-    end_date_ru = end_date.strftime(date_format)
 
-    # данные кампаний ЯД для полученой глобальной кампании
-    # список кортежей: (campaign_id, campaign_name, campaign_group), ...
-    campaigns_data = [(yd_camp.yd_campaign_id, yd_camp.name, yd_camp.group.name) for campaign_group in
-                      request.global_campaign.groups for yd_camp in campaign_group.yd_campaigns]
+def update_report(report_id: int, **values):
+    """
+    Обновление полей отчёта в короткой транзакции
+    :param report_id:
+    :param values: новые значения полей Report
+    :return:
+    """
+    with session_maker() as session:
+        session.execute(update(Report).where(Report.id == report_id).values(**values))
+        session.commit()
+
+
+def initial_report_generation(task: ReportTask,
+                              stats: ReportStats = None) -> tuple[dict[str, BinaryIO], str, str | None]:
+    """
+    Функция для сбора, обработки и передачи параметров, необходимых для создания отчёта в функцию создания отчёта
+    :param task: данные отчёта (см. claim_report)
+    :param stats: сборщик показателей этапов формирования отчёта
+    :return: файлы отчёта, заголовок отчёта и путь к загруженному предварительному отчёту (None - не загружался)
+    """
+    stats = stats or ReportStats()
+    logger.info(f'Начинаю обработку запроса от {task.created_at}...')
+
+    app_id = task.app_id
+    start_date: date = task.start_date
+    end_date: date = task.end_date
+    campaigns_data = task.campaigns_data
 
     # заголовок для листов в отчёте
-    header = (f'Отчёт по приложению "{app_name}" {start_date_ru.replace("-", ".")}-'
-              f'{end_date_ru.replace("-", ".")}')
+    header = get_report_header(task.app_name, start_date, end_date)
+
+    # форматы выгрузки отчёта
+    output_formats = parse_output_formats(task.output_formats)
+
+    # предварительный отчёт по семплированным данным: загружается сразу и затем заменяется точным
+    # (удаляется из хранилища после загрузки точного отчёта или при ошибке его формирования, см. run_worker)
+    preview_filepath = None
+    if task.preview:
+        logger.info(f'Формирую предварительный отчёт (точность {PREVIEW_ACCURACY})...')
+        preview_header = f'{header} (предварительный)'
+        preview_checkpoints = ReportCheckpoints(
+            task.id, (app_id, str(start_date), str(end_date), campaigns_data, PREVIEW_ACCURACY))
+        try:
+            with stats.stage('preview'):
+                preview_files = create_report(app_id, str(start_date), str(end_date), campaigns_data,
+                                              task.yd_login, preview_header, output_formats, preview_checkpoints,
+                                              PREVIEW_ACCURACY, stats=stats,
+                                              launch_event_label=task.launch_event_label)
+                try:
+                    preview_filepath = upload_report_to_s3(preview_files, preview_header, report_id=task.id)
+                finally:
+                    for file in preview_files.values():
+                        file.close()
+            update_report(task.id, s3_filepath=preview_filepath)
+            logger.info('Предварительный отчёт загружен, формирую точный отчёт...')
+        except Exception:
+            # ошибка предварительного отчёта не прерывает формирование точного
+            logger.warning(f'Ошибка формирования предварительного отчёта:\n{traceback.format_exc()}')
+
+    # контрольные точки этапов: повторная обработка отчёта продолжается с последнего успешного этапа
+    checkpoints = ReportCheckpoints(task.id, (app_id, str(start_date), str(end_date), campaigns_data))
 
     # инициализация формирования отчёта
-    new_report_file: bytes = create_report(
-        app_id, str(start_date), str(end_date), campaigns_data, yd_login, header)
+    try:
+        new_report_files: dict[str, BinaryIO] = create_report(
+            app_id, str(start_date), str(end_date), campaigns_data, task.yd_login, header, output_formats,
+            checkpoints, stats=stats, launch_event_label=task.launch_event_label)
+    except Exception:
+        if preview_filepath:
+            discard_preview(task.id, preview_filepath, output_formats)
+        raise
 
     logger.info('Обработка завершена.')
 
-    return new_report_file, header
+    return new_report_files, header, preview_filepath
 
 
-def upload_report_to_s3(file: bytes, report_name: str) -> str:
+def get_report_filename(report_name: str, report_id: int | str | None = None) -> str:
     """
-    Загрузка файла в хранилище S3
-    :param file:
+    Имя файла отчёта (без расширения) с отметкой времени и идентификатором отчёта: одноимённые отчёты,
+    сформированные параллельно (несколько воркеров, пакетное формирование), не перезаписывают друг друга
     :param report_name:
+    :param report_id: идентификатор отчёта (None - случайный)
     :return:
     """
-    logger.info('Загрузка отчёта в S3-хранилище...')
-
-    suffix = str(int(datetime.today().timestamp()))
+    suffix = f'{int(datetime.today().timestamp())}_{report_id or uuid.uuid4().hex[:8]}'
 
     filename = report_name.replace(string.punctuation, '')
     filename = filename.replace(' ', '_').replace('.', '-').replace('"', '')
-    filename = filename + '_' + suffix + '.xlsx'
+    return filename + '_' + suffix
 
-    filepath = '/'.join((S3_PATH, filename))
-    storage.upload_memory_file(filepath, io.BytesIO(file), len(file))
+
+def upload_report_to_s3(files: dict[str, BinaryIO], report_name: str, s3_path: str = S3_PATH,
+                        report_id: int | str | None = None) -> str:
+    """
+    Потоковая загрузка файлов отчёта в хранилище S3 (multipart, частями по S3_PART_SIZE байт).
+    Файлы разных форматов загружаются рядом, с общим именем и разными расширениями
+    :param files: словарь {формат: файл}, первый формат - основной
+    :param report_name:
+    :param s3_path: каталог в хранилище
+    :param report_id: идентификатор отчёта для имени файла (None - случайный)
+    :return: путь к файлу основного формата
+    """
+    logger.info('Загрузка отчёта в S3-хранилище...')
+
+    filename = get_report_filename(report_name, report_id)
+
+    filepaths = []
+    for output_format, file in files.items():
+        filepath = '/'.join((s3_path, filename + OUTPUT_EXTENSIONS[output_format]))
+        get_storage().upload_stream(filepath, file)
+        filepaths.append(filepath)
 
     logger.info('Успешно.')
-    return filepath
+    return filepaths[0]
+
+
+def delete_report_from_s3(filepath: str, output_formats: list[str]):
+    """
+    Удаление файлов отчёта всех форматов (загруженных upload_report_to_s3) из хранилища S3.
+    Ошибка удаления не прерывает обработку отчёта
+    :param filepath: путь к файлу основного формата
+    :param output_formats: форматы отчёта, первый формат - основной
+    :return:
+    """
+    base_path = filepath[:-len(OUTPUT_EXTENSIONS[output_formats[0]])]
+    for output_format in output_formats:
+        try:
+            get_storage().remove_file(base_path + OUTPUT_EXTENSIONS[output_format])
+        except Exception:
+            logger.warning(f'Не удалось удалить файл {base_path + OUTPUT_EXTENSIONS[output_format]}:\n'
+                           f'{traceback.format_exc()}')
+
+
+def discard_preview(report_id: int, preview_filepath: str, output_formats: list[str]):
+    """
+    Удаление предварительного отчёта при ошибке формирования точного: сначала очищается путь к файлу
+    отчёта (отчёт не ссылается на удаляемые файлы), затем файлы удаляются из хранилища
+    :param report_id:
+    :param preview_filepath: путь к файлу основного формата предварительного отчёта
+    :param output_formats: форматы отчёта, первый формат - основной
+    :return:
+    """
+    update_report(report_id, s3_filepath=None)
+    delete_report_from_s3(preview_filepath, output_formats)
 
 
 # ДОБАВИТЬ СКРИПТ СТЁПЫ НА ОПРЕДЕЛЕНИЕ URL-ПАРАМЕТРА с campaign_id
 
-# бесконечный цикл ожидания нового отчёта
-while True:
-    to_sleep = True
-    try:
-        with session_maker() as session:
-            new_request = get_request(session)
+def run_worker(max_reports: int = None, exit_when_idle: bool = False, metrics_port: int = METRICS_PORT,
+               prewarm: bool = True):
+    """
+    Бесконечный цикл обработки очереди отчётов из БД
+    :param max_reports: завершить работу после обработки указанного количества отчётов (None - без ограничения)
+    :param exit_when_idle: завершить работу, когда в очереди не осталось доступных отчётов (вместо ожидания)
+    :param metrics_port: порт эндпоинта /metrics, 0 - эндпоинт отключен
+    :param prewarm: прогрев данных в простое (если включен PREWARM_ENABLED); в пуле воркеров - только в одном
+    :return:
+    """
+    # эндпоинт /metrics
+    start_metrics_server(metrics_port)
 
-            if new_request:
+    # удаление контрольных точек давно не обрабатывавшихся отчётов
+    prune_checkpoints()
+
+    # прогрев данных активных глобальных кампаний в простое (None - отключен)
+    prewarmer = get_prewarmer(session_maker) if prewarm else None
+
+    # количество обработанных отчётов (успешно или с ошибкой)
+    processed = 0
+
+    # бесконечный цикл ожидания нового отчёта
+    while not max_reports or processed < max_reports:
+        to_sleep = True
+        try:
+            # показатели этапов обработки отчёта, сохраняются в поле Report.stats
+            stats = ReportStats()
+            # сессия БД открыта только на время выбора отчёта и обновления статуса
+            with stats.stage('get_request'):
+                task = claim_report()
+
+            if task:
                 to_sleep = False
+                REPORTS_IN_PROGRESS.inc()
+                # профилирование формирования отчёта (None - отключено)
+                profiler = ReportProfiler() if PROFILE_REPORTS or task.profile else None
+                preview_filepath = None
                 try:
                     # формирование файла
-                    new_report_file, report_name = initial_report_generation(session, new_request)
+                    with profiler or nullcontext():
+                        new_report_files, report_name, preview_filepath = initial_report_generation(task, stats)
+
+                    # загрузка файлов в хранилище
+                    try:
+                        with stats.stage('upload_report_to_s3'):
+                            path_to_file = upload_report_to_s3(new_report_files, report_name, report_id=task.id)
+                    finally:
+                        for file in new_report_files.values():
+                            file.close()
+
+                    # профиль загружается рядом с файлом основного формата, с тем же именем
+                    if profiler:
+                        main_extension = OUTPUT_EXTENSIONS[next(iter(new_report_files))]
+                        profiler.upload(path_to_file[:-len(main_extension)])
+
+                    # контрольные точки успешно обработанного отчёта больше не нужны
+                    ReportCheckpoints(task.id, None).clear()
+
+                    update_report(task.id, status_id=3, s3_filepath=path_to_file, stats=stats.to_dict(),
+                                  error_msg=None)
+                    # предварительный отчёт заменён точным (удаляется после обновления пути к файлу отчёта)
+                    if preview_filepath:
+                        delete_report_from_s3(preview_filepath, list(new_report_files))
+                    REPORTS_TOTAL.inc(status='done')
+
+                except Exception as err:
+                    update_report(task.id, status_id=4, error_msg=traceback.format_exc(), stats=stats.to_dict())
+                    # отчёт с ошибкой не ссылается на предварительный отчёт, его файлы удаляются
+                    if preview_filepath:
+                        discard_preview(task.id, preview_filepath, list(new_report_files))
+                    REPORTS_TOTAL.inc(status='error')
+                    if profiler:
+                        profiler.upload('/'.join((S3_PATH, get_report_filename('report', task.id))))
+                    raise err
 
-                    # загрузка файла в хранилище
-                    path_to_file = upload_report_to_s3(new_report_file, report_name)
+                finally:
+                    processed += 1
+                    REPORTS_IN_PROGRESS.dec()
+                    REPORT_DURATION.observe(time.perf_counter() - stats.started)
 
-                    new_request.status_id = 3
-                    new_request.s3_filepath = path_to_file
+            # в простое вместо сна прогреваем данные, пока это разрешено расписанием и бюджетом
+            if to_sleep and prewarmer and prewarmer.run_step():
+                to_sleep = False
 
-                    if new_request.error_msg:
-                        new_request.error_msg = None
+            if to_sleep and exit_when_idle:
+                logger.info('Очередь пуста, завершение работы')
+                break
 
-                    session.commit()
+            if to_sleep:
+                logger.info('Сплю')
+                time.sleep(30)
 
-                except Exception as err:
-                    new_request.status_id = 4
-                    new_request.error_msg = traceback.format_exc()
-                    session.commit()
-                    raise err
+        except OperationalError as err:
+            WORKER_ERRORS.inc(type='db')
+            logger.error('Ошибка БД, переподключение через 10 секунд...')
+            time.sleep(10)
 
-        if to_sleep:
-            logger.info('Сплю')
+        except Exception as err:
+            WORKER_ERRORS.inc(type='other')
+            traceback.print_exc()
+            logger.info('Произошла ошибка! Повторная попытка через 30 секунд...')
             time.sleep(30)
 
-    except OperationalError as err:
-        logger.error('Ошибка БД, переподключение через 10 секунд...')
-        time.sleep(10)
 
-    except Exception as err:
-        traceback.print_exc()
-        logger.info('Произошла ошибка! Повторная попытка через 30 секунд...')
-        time.sleep(30)
+if __name__ == '__main__':
+    run_worker()
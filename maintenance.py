@@ -0,0 +1,186 @@
+"""
+Обслуживание очереди отчётов: перенос сформированных и завершившихся ошибкой отчётов (вместе с текстом
+ошибок) из таблицы report в report_archive. В таблице report остаются только новые и недавние отчёты,
+поэтому выбор отчёта из очереди и подсчёт очереди не замедляются с ростом истории.
+
+Запуск (по расписанию, например cron раз в сутки, или постоянно с --interval):
+    python maintenance.py --create-schema       # первый запуск и обновления: новые колонки, архив, индекс очереди
+    python maintenance.py --dry-run             # количество отчётов к переносу
+    python maintenance.py --vacuum              # перенос и VACUUM ANALYZE таблицы report
+    python maintenance.py --interval 24         # перенос каждые 24 часа
+"""
+import argparse
+import logging
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Engine, and_, delete, func, insert, or_, select, text, true
+from sqlalchemy.sql.elements import ColumnElement
+
+from database.db import engine as default_engine, session_maker, scheme_name
+from database.models import FINISHED_STATUSES, Application, Report, ReportArchive
+from settings import REPORT_ARCHIVE_AFTER_DAYS, REPORT_ARCHIVE_BATCH_SIZE
+
+logging.basicConfig(level=logging.INFO, format='[{asctime}] #{levelname:4} {name}:{lineno} - {message}', style='{')
+logger = logging.getLogger('maintenance.py')
+
+# колонки, переносимые из report в report_archive
+ARCHIVE_COLUMNS = [column.name for column in Report.__table__.columns]
+
+# колонки, добавленные в существующие таблицы после их создания: (модель, колонка)
+ADDED_COLUMNS = [
+    (Report, 'output_formats'),
+    (Report, 'preview'),
+    (Report, 'stats'),
+    (Report, 'profile'),
+    (Application, 'launch_event_label'),
+]
+
+
+def get_add_column_statements(dialect) -> list[str]:
+    """
+    DDL добавления новых колонок в существующие таблицы (типы - из моделей)
+    :param dialect: диалект БД для компиляции типов колонок
+    :return: список выражений ALTER TABLE ... ADD COLUMN IF NOT EXISTS
+    """
+    statements = []
+    for model, column_name in ADDED_COLUMNS:
+        column = model.__table__.columns[column_name]
+        statements.append(f'ALTER TABLE {scheme_name}.{model.__tablename__} '
+                          f'ADD COLUMN IF NOT EXISTS {column_name} {column.type.compile(dialect=dialect)}')
+    return statements
+
+
+def ensure_queue_schema(engine: Engine = default_engine):
+    """
+    Добавление новых колонок в таблицы report и application, создание таблицы архива и частичного индекса
+    очереди (существующие не изменяются). Индекс создаётся обычным CREATE INDEX (с блокировкой записи в report
+    на время построения), поэтому первый запуск лучше выполнять вне часов нагрузки
+    :param engine:
+    :return:
+    """
+    with engine.begin() as connection:
+        for statement in get_add_column_statements(engine.dialect):
+            logger.info(statement)
+            connection.execute(text(statement))
+    ReportArchive.__table__.create(engine, checkfirst=True)
+    for index in Report.__table__.indexes:
+        logger.info(f'Создание индекса {index.name} (если отсутствует)...')
+        index.create(engine, checkfirst=True)
+
+
+def get_archive_condition(cutoff: datetime) -> ColumnElement[bool]:
+    """
+    Условие переноса в архив: отчёт создан раньше cutoff и обработан (сформирован или завершился ошибкой)
+    либо удалён пользователем и не находится в обработке
+    :param cutoff:
+    :return:
+    """
+    return and_(
+        Report.created_at < cutoff,
+        or_(Report.status_id.in_(FINISHED_STATUSES), and_(Report.to_delete == true(), Report.status_id != 2)),
+    )
+
+
+def count_archivable(cutoff: datetime) -> int:
+    """
+    Количество отчётов, подлежащих переносу в архив
+    :param cutoff:
+    :return:
+    """
+    with session_maker() as session:
+        stmt = select(func.count()).select_from(Report).where(get_archive_condition(cutoff))
+        return session.execute(stmt).scalar()
+
+
+def archive_reports(cutoff: datetime, batch_size: int = REPORT_ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Перенос отчётов в архив частями по batch_size строк, каждая часть - в отдельной короткой транзакции
+    (DELETE ... RETURNING и INSERT в одном запросе). Строки, заблокированные воркерами, пропускаются
+    :param cutoff: переносятся отчёты, созданные раньше этого времени
+    :param batch_size:
+    :return: количество перенесённых отчётов
+    """
+    total = 0
+    while True:
+        with session_maker() as session:
+            batch_ids = (
+                select(Report.id)
+                .where(get_archive_condition(cutoff))
+                .order_by(Report.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            moved = (
+                delete(Report)
+                .where(Report.id.in_(batch_ids.scalar_subquery()))
+                .returning(*(Report.__table__.c[name] for name in ARCHIVE_COLUMNS))
+                .cte('moved')
+            )
+            stmt = insert(ReportArchive).from_select(ARCHIVE_COLUMNS,
+                                                     select(*(moved.c[name] for name in ARCHIVE_COLUMNS)))
+            result = session.execute(stmt)
+            session.commit()
+
+        total += result.rowcount
+        logger.info(f'Перенесено в архив: {total}')
+        if result.rowcount < batch_size:
+            return total
+
+
+def vacuum_reports(engine: Engine = default_engine):
+    """
+    VACUUM ANALYZE таблицы report после переноса (освобождение места удалённых строк, обновление статистики)
+    :param engine:
+    :return:
+    """
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text(f'VACUUM (ANALYZE) {scheme_name}.{Report.__tablename__}'))
+
+
+def run_maintenance(older_than_days: int, batch_size: int, vacuum: bool, dry_run: bool) -> int:
+    """
+    Один проход обслуживания
+    :return: количество перенесённых (для dry_run - подлежащих переносу) отчётов
+    """
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    if dry_run:
+        count = count_archivable(cutoff)
+        logger.info(f'Отчётов к переносу в архив (созданы до {cutoff:%Y-%m-%d %H:%M}): {count}')
+        return count
+
+    logger.info(f'Перенос в архив отчётов, созданных до {cutoff:%Y-%m-%d %H:%M}...')
+    count = archive_reports(cutoff, batch_size)
+    if vacuum and count:
+        logger.info('VACUUM ANALYZE таблицы report...')
+        vacuum_reports()
+    return count
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Перенос обработанных отчётов в архив')
+    parser.add_argument('--older-than-days', type=int, default=REPORT_ARCHIVE_AFTER_DAYS,
+                        help='возраст отчётов для переноса, дней (по-умолчанию REPORT_ARCHIVE_AFTER_DAYS)')
+    parser.add_argument('--batch-size', type=int, default=REPORT_ARCHIVE_BATCH_SIZE,
+                        help='количество отчётов в одной транзакции')
+    parser.add_argument('--create-schema', action='store_true',
+                        help='добавить новые колонки, создать таблицу архива и индекс очереди, если они отсутствуют')
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM ANALYZE таблицы report после переноса')
+    parser.add_argument('--dry-run', action='store_true', help='только подсчитать отчёты к переносу')
+    parser.add_argument('--interval', type=float, default=0,
+                        help='повторять каждые N часов (0 - однократный запуск)')
+    args = parser.parse_args(argv)
+
+    if args.create_schema:
+        ensure_queue_schema()
+
+    while True:
+        run_maintenance(args.older_than_days, args.batch_size, args.vacuum, args.dry_run)
+        if not args.interval:
+            return 0
+        time.sleep(args.interval * 3600)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 import dotenv
 
@@ -8,9 +9,13 @@ dotenv.load_dotenv()
 
 # Yandex App API
 YAPP_TOKEN = os.getenv('YAPP_TOKEN')
+# базовый адрес API AppMetrica (переопределяется, например, для бенчмарков с локальными серверами)
+APPMETRICA_API_URL = os.getenv('APPMETRICA_API_URL', 'https://api.appmetrica.yandex.ru')
 
 # Yandex direct API
 YANDEX_DIRECT_TOKEN = os.getenv('YANDEX_DIRECT_TOKEN')
+YANDEX_DIRECT_API_URL = os.getenv('YANDEX_DIRECT_API_URL', 'https://api.direct.yandex.com/json/v5')
+YANDEX_DIRECT_WEBAPI_URL = os.getenv('YANDEX_DIRECT_WEBAPI_URL', 'https://direct.yandex.ru/wizard/web-api/aggregate')
 
 # База данных
 DB_USER = os.getenv('DB_USER')
@@ -26,4 +31,89 @@ SECRET_KEY = os.getenv('S3_SECRET_KEY')
 BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
 ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
 MINIO_SECURE = os.getenv('S3_MINIO_SECURE')
-OUTER_ENDPOINT_URL = os.getenv('S3_OUTER_ENDPOINT_URL')
\ No newline at end of file
+OUTER_ENDPOINT_URL = os.getenv('S3_OUTER_ENDPOINT_URL')
+
+# Формирование и выгрузка отчёта
+# размер (в байтах), до которого файл отчёта хранится в оперативной памяти, после - сбрасывается на диск
+REPORT_SPOOL_MAX_SIZE = int(os.getenv('REPORT_SPOOL_MAX_SIZE', 10 * 1024 * 1024))
+# размер части (в байтах) при потоковой multipart-загрузке в S3 (не менее 5 МБ)
+S3_PART_SIZE = int(os.getenv('S3_PART_SIZE', 10 * 1024 * 1024))
+# количество строк на листе, начиная с которого xlsx-файл формируется в режиме constant_memory
+XLSX_CONSTANT_MEMORY_ROWS = int(os.getenv('XLSX_CONSTANT_MEMORY_ROWS', 50000))
+# количество строк на листах с установками по регионам, ОС и маркам (остальные - в строке "Прочие"), 0 - без ограничения
+INSTALLS_TOP_REGIONS = int(os.getenv('INSTALLS_TOP_REGIONS', 100))
+INSTALLS_TOP_OC = int(os.getenv('INSTALLS_TOP_OC', 0))
+INSTALLS_TOP_BRANDS = int(os.getenv('INSTALLS_TOP_BRANDS', 100))
+
+# Хранилище фактов (посуточные данные AppMetrica в parquet-файлах)
+# каталог хранилища, пустое значение - хранилище отключено
+FACT_STORE_DIR = os.getenv('FACT_STORE_DIR', '')
+# количество последних дней, данные за которые считаются неокончательными и всегда запрашиваются из API
+FACT_STORE_FINAL_LAG_DAYS = int(os.getenv('FACT_STORE_FINAL_LAG_DAYS', 2))
+# максимальная длина (в днях) периода, запрашиваемого из API с группировкой по дню
+FACT_STORE_MAX_RANGE_DAYS = int(os.getenv('FACT_STORE_MAX_RANGE_DAYS', 14))
+# время жизни (в часах) кэша параметров отслеживания кампаний ЯД
+URL_PARAMS_CACHE_TTL_HOURS = int(os.getenv('URL_PARAMS_CACHE_TTL_HOURS', 24))
+
+# Прогрев данных активных глобальных кампаний в простое (требуется хранилище фактов)
+PREWARM_ENABLED = os.getenv('PREWARM_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+# часы (локальное время) начала и окончания периода прогрева, например 0-7
+PREWARM_HOURS = os.getenv('PREWARM_HOURS', '0-7')
+# максимальное количество запросов к API AppMetrica на прогрев в час
+PREWARM_MAX_REQUESTS_PER_HOUR = int(os.getenv('PREWARM_MAX_REQUESTS_PER_HOUR', 200))
+# минимальный интервал (в часах) между прогревами одной глобальной кампании
+PREWARM_INTERVAL_HOURS = int(os.getenv('PREWARM_INTERVAL_HOURS', 12))
+
+# Контрольные точки этапов формирования отчёта
+# каталог для хранения контрольных точек
+CHECKPOINT_DIR = os.getenv('CHECKPOINT_DIR', os.path.join(tempfile.gettempdir(), 'yandexapp_checkpoints'))
+# время хранения (в часах) контрольных точек необработанных отчётов
+CHECKPOINT_TTL_HOURS = int(os.getenv('CHECKPOINT_TTL_HOURS', 72))
+
+# Архивация обработанных отчётов (maintenance.py)
+# возраст (в днях) сформированных и завершившихся ошибкой отчётов, после которого они переносятся в архив
+REPORT_ARCHIVE_AFTER_DAYS = int(os.getenv('REPORT_ARCHIVE_AFTER_DAYS', 30))
+# количество отчётов, переносимых в одной транзакции
+REPORT_ARCHIVE_BATCH_SIZE = int(os.getenv('REPORT_ARCHIVE_BATCH_SIZE', 1000))
+
+# точность данных AppMetrica для предварительного отчёта (high, medium, low или доля от 0 до 1)
+PREVIEW_ACCURACY = os.getenv('PREVIEW_ACCURACY', 'low')
+
+# Ограничение частоты запросов к API (общее для всех воркеров хоста)
+# каталог с файлами состояния ограничителей (для ограничения между контейнерами - общий том)
+RATE_LIMIT_DIR = os.getenv('RATE_LIMIT_DIR', os.path.join(tempfile.gettempdir(), 'yandexapp_rate_limits'))
+# допустимое количество запросов в секунду на один токен, 0 - без ограничения
+APPMETRICA_RATE_LIMIT = float(os.getenv('APPMETRICA_RATE_LIMIT', 3))
+DIRECT_RATE_LIMIT = float(os.getenv('DIRECT_RATE_LIMIT', 2))
+# допустимый всплеск запросов (в секундах работы на полной скорости)
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', 2))
+
+# Обработка больших ответов AppMetrica (сессии, события)
+# размер (в байтах) ответа, после которого он сбрасывается из памяти во временный файл на диске
+SPILL_THRESHOLD_BYTES = int(os.getenv('SPILL_THRESHOLD_BYTES', 64 * 1024 * 1024))
+# количество строк ответа, обрабатываемых за один раз
+SPILL_CHUNK_ROWS = int(os.getenv('SPILL_CHUNK_ROWS', 500000))
+
+# Параллельные запросы к API AppMetrica (асинхронный клиент)
+# максимальное количество одновременных запросов одного отчёта
+APPMETRICA_CONCURRENCY = int(os.getenv('APPMETRICA_CONCURRENCY', 4))
+# размер пула соединений HTTP-сессии (общей для отчётов, формируемых в одном цикле событий)
+APPMETRICA_HTTP_POOL_SIZE = int(os.getenv('APPMETRICA_HTTP_POOL_SIZE', 32))
+
+# Пул воркеров (supervisor.py)
+# количество процессов-воркеров
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', 1))
+# количество отчётов, после обработки которых процесс-воркер перезапускается, 0 - без перезапуска
+WORKER_MAX_REPORTS_PER_CHILD = int(os.getenv('WORKER_MAX_REPORTS_PER_CHILD', 50))
+
+# порт HTTP-эндпоинта /metrics с метриками Prometheus, 0 - эндпоинт отключен
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+
+# Профилирование формирования отчётов (cProfile + tracemalloc), результаты загружаются в S3 рядом с отчётом
+# профилировать все отчёты (иначе - только отчёты с установленным полем profile)
+PROFILE_REPORTS = os.getenv('PROFILE_REPORTS', 'false').lower() in ('1', 'true', 'yes')
+# количество функций и мест выделения памяти в текстовой сводке
+PROFILE_TOP_FUNCTIONS = int(os.getenv('PROFILE_TOP_FUNCTIONS', 50))
+PROFILE_TOP_ALLOCATIONS = int(os.getenv('PROFILE_TOP_ALLOCATIONS', 30))
+# глубина стека, сохраняемая tracemalloc для каждого выделения памяти
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv('PROFILE_TRACEMALLOC_FRAMES', 1))
@@ -0,0 +1,144 @@
+"""
+Пул процессов-воркеров (prefork). Тяжёлые модули (pandas, numpy, xlsxwriter, SQLAlchemy, minio, aiohttp)
+и клиенты S3 импортируются и создаются один раз в процессе-супервизоре, после чего воркеры запускаются
+через fork и получают их готовыми. Воркер перезапускается после обработки WORKER_MAX_REPORTS_PER_CHILD
+отчётов (ограничение роста памяти) и при аварийном завершении.
+
+Запуск (из корня проекта):
+    python supervisor.py                          # WORKER_PROCESSES воркеров
+    python supervisor.py --processes 4 --max-reports-per-child 20
+
+Эндпоинт /metrics каждого воркера - на порту METRICS_PORT + номер воркера (0, 1, ...).
+Без os.fork (Windows) цикл обработки очереди выполняется в текущем процессе
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+import traceback
+
+from database.db import engine
+from main import run_worker
+from settings import METRICS_PORT, WORKER_PROCESSES, WORKER_MAX_REPORTS_PER_CHILD
+
+logger = logging.getLogger('supervisor.py')
+
+# воркер, завершившийся с ошибкой быстрее этого времени (в секундах), перезапускается с задержкой
+MIN_CHILD_UPTIME = 10
+RESTART_DELAY = 10
+
+
+class Supervisor:
+    """
+    Запуск воркеров через fork и их перезапуск после завершения
+    """
+
+    def __init__(self, processes: int = WORKER_PROCESSES, max_reports_per_child: int = WORKER_MAX_REPORTS_PER_CHILD,
+                 metrics_port: int = METRICS_PORT):
+        self.processes = processes
+        self.max_reports_per_child = max_reports_per_child or None
+        self.metrics_port = metrics_port
+
+        # номер воркера и время запуска по pid процесса
+        self.children: dict[int, tuple[int, float]] = {}
+        self.stopping = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        # объекты, созданные при импорте, переносятся в постоянное поколение сборщика мусора:
+        # он не обходит их в воркерах, и страницы памяти остаются общими с супервизором (copy-on-write)
+        gc.collect()
+        gc.freeze()
+
+        logger.info(f'Запуск воркеров: {self.processes}, '
+                    f'отчётов до перезапуска: {self.max_reports_per_child or "без ограничения"}')
+        for slot in range(self.processes):
+            self._spawn(slot)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+
+            slot, started = self.children.pop(pid)
+            exit_code = os.waitstatus_to_exitcode(status)
+            if self.stopping:
+                continue
+
+            uptime = time.monotonic() - started
+            logger.info(f'Воркер {slot} (pid {pid}) завершён с кодом {exit_code} через {round(uptime)} с, перезапуск')
+            if exit_code != 0 and uptime < MIN_CHILD_UPTIME:
+                time.sleep(RESTART_DELAY)
+                if self.stopping:
+                    continue
+            self._spawn(slot)
+
+        logger.info('Все воркеры завершены.')
+
+    def _spawn(self, slot: int):
+        pid = os.fork()
+        if pid == 0:
+            self._run_child(slot)
+        self.children[pid] = (slot, time.monotonic())
+
+    def _run_child(self, slot: int):
+        """
+        Процесс-воркер: цикл обработки очереди до max_reports_per_child отчётов. Не возвращает управление
+        :param slot: номер воркера
+        :return:
+        """
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+        exit_code = 0
+        try:
+            # пул соединений БД, унаследованный от супервизора, заменяется новым (соединения супервизора
+            # не закрываются и не используются воркером)
+            engine.dispose(close=False)
+            metrics_port = self.metrics_port + slot if self.metrics_port else 0
+            # прогрев данных выполняет только воркер 0: бюджет запросов PREWARM_MAX_REQUESTS_PER_HOUR общий для пула
+            run_worker(max_reports=self.max_reports_per_child, metrics_port=metrics_port, prewarm=slot == 0)
+        except BaseException:
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    def _stop(self, signum, frame):
+        logger.info('Остановка воркеров...')
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Пул процессов-воркеров обработки очереди отчётов')
+    parser.add_argument('-p', '--processes', type=int, default=WORKER_PROCESSES,
+                        help='количество воркеров (по-умолчанию WORKER_PROCESSES)')
+    parser.add_argument('--max-reports-per-child', type=int, default=WORKER_MAX_REPORTS_PER_CHILD,
+                        help='отчётов до перезапуска воркера, 0 - без перезапуска '
+                             '(по-умолчанию WORKER_MAX_REPORTS_PER_CHILD)')
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, 'fork'):
+        logger.warning('os.fork недоступен, очередь обрабатывается в текущем процессе.')
+        run_worker()
+        return 0
+
+    Supervisor(args.processes, args.max_reports_per_child).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
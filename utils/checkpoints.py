@@ -0,0 +1,120 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from settings import CHECKPOINT_DIR, CHECKPOINT_TTL_HOURS
+
+logger = logging.getLogger(__name__)
+
+
+class ReportCheckpoints:
+    """
+    Контрольные точки этапов формирования отчёта: результаты этапов (параметры url, запрошенные и
+    рассчитанные DataFrame) сохраняются в каталоге отчёта, и повторная обработка того же отчёта
+    продолжается с последнего успешного этапа без повторных запросов к API.
+    Структура: <base_dir>/<report_id>/<fingerprint>/<stage>.pkl.gz, где fingerprint - хэш входных
+    параметров отчёта (при их изменении старые контрольные точки не используются)
+    """
+
+    def __init__(self, report_id: int, fingerprint_data: Any, base_dir: str = CHECKPOINT_DIR):
+        fingerprint = json.dumps(fingerprint_data, sort_keys=True, ensure_ascii=False, default=str)
+        fingerprint = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:16]
+
+        self.report_dir = Path(base_dir) / str(report_id)
+        self.checkpoint_dir = self.report_dir / fingerprint
+
+    def _path(self, stage: str) -> Path:
+        return self.checkpoint_dir / f'{stage}.pkl.gz'
+
+    def save(self, stage: str, data: Any):
+        """
+        Сохранение результата этапа (через временный файл, чтобы не оставить недописанную контрольную точку)
+        :param stage: имя этапа
+        :param data: результат этапа
+        :return:
+        """
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.checkpoint_dir, suffix='.tmp', delete=False) as tmp_file:
+            with gzip.GzipFile(fileobj=tmp_file, mode='wb', compresslevel=3) as gzip_file:
+                pickle.dump(data, gzip_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file.name, self._path(stage))
+        # время изменения каталога отчёта используется при удалении устаревших контрольных точек
+        os.utime(self.report_dir)
+
+    def run(self, stage: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        Выполнение этапа: при наличии контрольной точки результат загружается из неё,
+        иначе этап выполняется и его результат сохраняется
+        :param stage: имя этапа
+        :param func: функция этапа
+        :return: результат этапа
+        """
+        found, result = self._load(stage)
+        if found:
+            return result
+
+        result = func(*args, **kwargs)
+        self.save(stage, result)
+        return result
+
+    async def run_async(self, stage: str, func: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """
+        Выполнение асинхронного этапа (см. run)
+        :param stage: имя этапа
+        :param func: асинхронная функция этапа
+        :return: результат этапа
+        """
+        found, result = self._load(stage)
+        if found:
+            return result
+
+        result = await func(*args, **kwargs)
+        self.save(stage, result)
+        return result
+
+    def _load(self, stage: str) -> tuple[bool, Any]:
+        """
+        Загрузка результата этапа из контрольной точки
+        :param stage: имя этапа
+        :return: (найдена ли контрольная точка, результат этапа)
+        """
+        path = self._path(stage)
+        if not path.exists():
+            return False, None
+
+        logger.info(f'Этап "{stage}" загружен из контрольной точки.')
+        with gzip.open(path, 'rb') as file:
+            return True, pickle.load(file)
+
+    def clear(self):
+        """
+        Удаление всех контрольных точек отчёта (после успешной обработки)
+        :return:
+        """
+        shutil.rmtree(self.report_dir, ignore_errors=True)
+
+
+def prune_checkpoints(base_dir: str = CHECKPOINT_DIR, ttl_hours: int = CHECKPOINT_TTL_HOURS):
+    """
+    Удаление контрольных точек отчётов, которые не обновлялись дольше ttl_hours часов
+    :param base_dir:
+    :param ttl_hours:
+    :return:
+    """
+    base_dir = Path(base_dir)
+    if not base_dir.exists():
+        return
+
+    expire_time = time.time() - ttl_hours * 3600
+    for report_dir in base_dir.iterdir():
+        if report_dir.is_dir() and report_dir.stat().st_mtime < expire_time:
+            shutil.rmtree(report_dir, ignore_errors=True)
+            logger.info(f'Удалены устаревшие контрольные точки отчёта {report_dir.name}.')
@@ -0,0 +1,124 @@
+import gzip
+import logging
+import tempfile
+import zipfile
+from typing import BinaryIO
+
+import pandas as pd
+
+from settings import REPORT_SPOOL_MAX_SIZE
+
+# pyarrow - необязательная зависимость, требуется только для форматов parquet и arrow
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# форматы выгрузки отчёта и расширения файлов в хранилище
+OUTPUT_EXTENSIONS = {
+    'xlsx': '.xlsx',
+    'parquet': '.parquet.zip',
+    'arrow': '.arrow.zip',
+    'csv': '.csv.zip',
+}
+# расширения файлов с таблицами внутри архива
+ARCHIVE_MEMBER_EXTENSIONS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+    'csv': '.csv.gz',
+}
+# форматы, для которых требуется pyarrow
+ARROW_OUTPUT_FORMATS = {'parquet', 'arrow'}
+DEFAULT_OUTPUT_FORMATS = ['xlsx']
+
+
+def parse_output_formats(output_formats: str | None) -> list[str]:
+    """
+    Разбор поля output_formats отчёта: список форматов через запятую, первый формат - основной
+    :param output_formats: например "xlsx,parquet"; пустое значение - только xlsx
+    :return: список форматов без повторов
+    """
+    if not output_formats:
+        return DEFAULT_OUTPUT_FORMATS.copy()
+
+    result = []
+    for output_format in output_formats.split(','):
+        output_format = output_format.strip().lower()
+        if output_format not in OUTPUT_EXTENSIONS:
+            raise ValueError(f'Неизвестный формат выгрузки отчёта: "{output_format}"')
+        # проверяется до формирования отчёта, а не при выгрузке готовых таблиц
+        if output_format in ARROW_OUTPUT_FORMATS and pa is None:
+            raise ValueError(f'Для формата выгрузки отчёта "{output_format}" требуется пакет pyarrow')
+        if output_format not in result:
+            result.append(output_format)
+    return result
+
+
+def _to_arrow_table(df: pd.DataFrame) -> 'pa.Table':
+    """
+    Перевод DataFrame в таблицу Arrow. Колонки типа object могут содержать смешанные типы
+    (например, 0 вместо незаполненного названия), поэтому приводятся к строкам
+    :param df:
+    :return:
+    """
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].astype(str)
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _write_frame(df: pd.DataFrame, output_format: str, file: BinaryIO):
+    """
+    Запись одной таблицы в файловый объект в указанном формате
+    :param df:
+    :param output_format: parquet, arrow или csv
+    :param file: файловый объект, открытый на запись в бинарном режиме
+    :return:
+    """
+    if output_format == 'csv':
+        with gzip.GzipFile(fileobj=file, mode='wb') as gzip_file:
+            df.to_csv(gzip_file, index=False, encoding='utf-8', mode='wb')
+        return
+
+    table = _to_arrow_table(df)
+    if output_format == 'parquet':
+        pq.write_table(table, file, compression='zstd')
+    else:
+        write_options = pa_ipc.IpcWriteOptions(compression='zstd')
+        with pa_ipc.new_file(file, table.schema, options=write_options) as writer:
+            writer.write_table(table)
+
+
+def create_data_archive(frames: dict[str, pd.DataFrame], output_format: str) -> BinaryIO:
+    """
+    Формирует zip-архив с таблицами отчёта в машиночитаемом формате (parquet, arrow или csv.gz).
+    Каждая таблица пишется в архив потоково, без промежуточной копии в памяти
+    :param frames: словарь {имя таблицы: DataFrame}
+    :param output_format: parquet, arrow или csv
+    :return: временный файл с архивом (позиция чтения в начале файла), закрытие файла - на вызывающей стороне
+    """
+    if output_format in ('parquet', 'arrow') and pa is None:
+        raise RuntimeError(f'Для выгрузки отчёта в формате {output_format} требуется пакет pyarrow')
+
+    logger.info(f'Формирую архив с данными отчёта ({output_format}).')
+    member_extension = ARCHIVE_MEMBER_EXTENSIONS[output_format]
+
+    archive_file = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_SIZE)
+    try:
+        # таблицы уже сжаты (zstd/gzip), поэтому архив без дополнительного сжатия
+        with zipfile.ZipFile(archive_file, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for name, df in frames.items():
+                with archive.open(name + member_extension, 'w', force_zip64=True) as member:
+                    _write_frame(df, output_format, member)
+    except Exception:
+        archive_file.close()
+        raise
+
+    archive_file.seek(0)
+    logger.info('Успех.')
+    return archive_file
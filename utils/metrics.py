@@ -0,0 +1,225 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator
+
+from settings import METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# границы корзин гистограмм времени (в секундах) по-умолчанию
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    values = ','.join('{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                      for name, value in labels)
+    return '{' + values + '}'
+
+
+class Metric:
+    """
+    Базовая метрика в формате Prometheus: значения хранятся по наборам меток
+    """
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def _samples(self) -> Iterator[tuple[str, tuple, float]]:
+        for key, value in self._values.items():
+            yield self.name, key, value
+
+    def expose(self) -> str:
+        """
+        Текстовое представление метрики (формат exposition Prometheus)
+        :return:
+        """
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            lines.extend(f'{name}{_format_labels(labels)} {value}' for name, labels, value in self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # значения по метке: [счётчики корзин..., сумма, количество]
+            values = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Замер времени выполнения блока
+        :param labels:
+        :return:
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def _samples(self) -> Iterator[tuple[str, tuple, float]]:
+        for key, values in self._values.items():
+            for bound, count in zip(self.buckets, values):
+                yield f'{self.name}_bucket', key + (('le', bound),), count
+            yield f'{self.name}_bucket', key + (('le', '+Inf'),), values[-1]
+            yield f'{self.name}_sum', key, values[-2]
+            yield f'{self.name}_count', key, values[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        return '\n'.join(metric.expose() for metric in self.metrics) + '\n'
+
+
+registry = Registry()
+
+# очередь и обработка отчётов
+QUEUE_DEPTH = registry.register(Gauge(
+    'yandexapp_report_queue_depth', 'Количество отчётов, ожидающих обработки'))
+REPORTS_IN_PROGRESS = registry.register(Gauge(
+    'yandexapp_reports_in_progress', 'Количество отчётов в обработке'))
+REPORTS_TOTAL = registry.register(Counter(
+    'yandexapp_reports_total', 'Количество обработанных отчётов по итоговому статусу'))
+REPORT_DURATION = registry.register(Histogram(
+    'yandexapp_report_duration_seconds', 'Время формирования и загрузки отчёта'))
+WORKER_ERRORS = registry.register(Counter(
+    'yandexapp_worker_errors_total', 'Ошибки цикла обработки очереди по типу'))
+
+# API AppMetrica
+API_REQUEST_DURATION = registry.register(Histogram(
+    'yandexapp_appmetrica_request_duration_seconds', 'Время запроса к API AppMetrica'))
+API_REQUESTS = registry.register(Counter(
+    'yandexapp_appmetrica_requests_total', 'Количество запросов к API AppMetrica по коду ответа'))
+
+# кэши: хранилище фактов (дни) и параметры отслеживания кампаний ЯД
+CACHE_LOOKUPS = registry.register(Counter(
+    'yandexapp_cache_lookups_total', 'Обращения к кэшам по результату (hit/miss)'))
+
+# параметры отслеживания кампаний ЯД
+TRACKING_PARAMS_DURATION = registry.register(Histogram(
+    'yandexapp_tracking_params_duration_seconds', 'Время получения параметров отслеживания кампаний ЯД'))
+TRACKING_PARAMS_ERRORS = registry.register(Counter(
+    'yandexapp_tracking_params_errors_total', 'Ошибки получения параметров отслеживания кампаний ЯД'))
+
+# S3-хранилище
+S3_UPLOAD_DURATION = registry.register(Histogram(
+    'yandexapp_s3_upload_duration_seconds', 'Время загрузки файла в S3-хранилище'))
+S3_UPLOAD_ERRORS = registry.register(Counter(
+    'yandexapp_s3_upload_errors_total', 'Ошибки загрузки файлов в S3-хранилище'))
+
+
+def observe(histogram: Histogram, errors: Counter, **labels) -> Callable:
+    """
+    Декоратор для замера времени выполнения функции и подсчёта её ошибок
+    :param histogram: гистограмма времени выполнения
+    :param errors: счётчик ошибок
+    :param labels: метки
+    :return:
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    errors.inc(**labels)
+                    raise
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = registry.expose().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # запросы сборщика метрик не логируются
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> ThreadingHTTPServer | None:
+    """
+    Запуск HTTP-сервера с эндпоинтом /metrics в фоновом потоке
+    :param port: порт сервера, 0 - сервер не запускается
+    :return:
+    """
+    if not port:
+        return None
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logger.info(f'Метрики доступны на порту {port} (/metrics).')
+    return server
@@ -0,0 +1,180 @@
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import threading
+import traceback
+import tracemalloc
+from contextvars import ContextVar
+from typing import Any, Callable
+
+from settings import PROFILE_TOP_FUNCTIONS, PROFILE_TOP_ALLOCATIONS, PROFILE_TRACEMALLOC_FRAMES
+from utils.s3_storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# профилировщик отчёта, формируемого в текущем контексте (в executor передаётся вместе с контекстом)
+_active_profiler: ContextVar['ReportProfiler | None'] = ContextVar('active_report_profiler', default=None)
+
+# интервал проверки занятой памяти (секунд) и её рост относительно предыдущего снимка tracemalloc,
+# при котором делается новый снимок (снимок с большим количеством выделений - дорогой)
+PEAK_CHECK_INTERVAL = 0.1
+PEAK_SNAPSHOT_GROWTH = 1.2
+
+
+def run_profiled(func: Callable, *args, **kwargs) -> Any:
+    """
+    Выполнение функции (в потоке executor) с профилированием, если в текущем контексте формируется
+    профилируемый отчёт: cProfile профилирует только поток, в котором он включён
+    :param func:
+    :return: результат функции
+    """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        return func(*args, **kwargs)
+    return profiler.run_in_thread(func, *args, **kwargs)
+
+
+class ReportProfiler:
+    """
+    Профилирование формирования отчёта: детерминированный профилировщик cProfile (время по функциям,
+    включая агрегацию pandas и запись ячеек xlsx) и tracemalloc (места наибольшего выделения памяти
+    на пике: снимок делается фоновым потоком, когда занятая память превышает предыдущий снимок
+    в PEAK_SNAPSHOT_GROWTH раз).
+    Используется как контекстный менеджер вокруг формирования отчёта, результаты загружаются в S3.
+    Работа, выполняемая в потоках executor через run_profiled, профилируется отдельно в каждом потоке
+    и объединяется с профилем основного потока
+    """
+
+    def __init__(self, top_functions: int = PROFILE_TOP_FUNCTIONS, top_allocations: int = PROFILE_TOP_ALLOCATIONS,
+                 tracemalloc_frames: int = PROFILE_TRACEMALLOC_FRAMES):
+        self.top_functions = top_functions
+        self.top_allocations = top_allocations
+        self.tracemalloc_frames = tracemalloc_frames
+        self.profile = cProfile.Profile()
+        # снимок tracemalloc на пике занятой памяти и объём памяти на момент снимка
+        self.snapshot: tracemalloc.Snapshot | None = None
+        self.snapshot_traced = 0
+        self.peak_traced = 0
+        self._stopped = threading.Event()
+        self._peak_watcher: threading.Thread | None = None
+        # профили потоков executor
+        self.thread_profiles: list[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._thread_id = None
+        self._token = None
+
+    def __enter__(self):
+        tracemalloc.start(self.tracemalloc_frames)
+        self._thread_id = threading.get_ident()
+        self._token = _active_profiler.set(self)
+        self._stopped.clear()
+        self._peak_watcher = threading.Thread(target=self._watch_peak, name='profiler-peak-watcher', daemon=True)
+        self._peak_watcher.start()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profile.disable()
+        _active_profiler.reset(self._token)
+        self._stopped.set()
+        self._peak_watcher.join()
+        # профилирование короче интервала проверки
+        if self.snapshot is None:
+            self._snapshot_on_peak()
+        self.peak_traced = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return False
+
+    def _watch_peak(self):
+        while not self._stopped.wait(PEAK_CHECK_INTERVAL):
+            self._snapshot_on_peak()
+
+    def _snapshot_on_peak(self):
+        """
+        Снимок tracemalloc, если занятая память выросла относительно предыдущего снимка
+        :return:
+        """
+        traced = tracemalloc.get_traced_memory()[0]
+        if self.snapshot is None or traced > self.snapshot_traced * PEAK_SNAPSHOT_GROWTH:
+            # предыдущий снимок освобождается до нового
+            self.snapshot = None
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_traced = traced
+
+    def run_in_thread(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Выполнение функции с профилированием текущего потока (см. run_profiled)
+        :param func:
+        :return: результат функции
+        """
+        if threading.get_ident() == self._thread_id:
+            # основной поток профилируется self.profile
+            return func(*args, **kwargs)
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # профилировщик уже активен для всех потоков (Python 3.12+, sys.monitoring)
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self._lock:
+                self.thread_profiles.append(profile)
+
+    def get_stats(self, stream: io.StringIO = None) -> pstats.Stats:
+        """
+        Объединённая статистика основного потока и потоков executor
+        :param stream:
+        :return:
+        """
+        stats = pstats.Stats(self.profile, stream=stream)
+        with self._lock:
+            for profile in self.thread_profiles:
+                stats.add(profile)
+        return stats
+
+    def get_summary(self) -> str:
+        """
+        Текстовая сводка: функции с наибольшим общим и собственным временем, места выделения памяти
+        :return:
+        """
+        output = io.StringIO()
+        stats = self.get_stats(output)
+
+        output.write(f'=== Функции по общему времени (top {self.top_functions}) ===\n')
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_functions)
+        output.write(f'\n=== Функции по собственному времени (top {self.top_functions}) ===\n')
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top_functions)
+
+        # места выделения памяти, занятой на пике (снимок может быть сделан до пика, см. PEAK_SNAPSHOT_GROWTH)
+        output.write(f'\n=== Выделение памяти (пик {round(self.peak_traced / 1024 / 1024, 1)} МБ, '
+                     f'снимок при {round(self.snapshot_traced / 1024 / 1024, 1)} МБ - '
+                     f'top {self.top_allocations} мест) ===\n')
+        if self.snapshot:
+            for statistic in self.snapshot.statistics('lineno')[:self.top_allocations]:
+                output.write(f'{statistic}\n')
+
+        return output.getvalue()
+
+    def upload(self, base_path: str):
+        """
+        Загрузка результатов в S3: <base_path>.prof (формат pstats, открывается snakeviz, pstats и т.п.)
+        и <base_path>.profile.txt (текстовая сводка). Ошибки загрузки не прерывают обработку отчёта
+        :param base_path: путь в хранилище без расширения (рядом с файлом отчёта)
+        :return:
+        """
+        try:
+            files = {
+                f'{base_path}.prof': marshal.dumps(self.get_stats().stats),
+                f'{base_path}.profile.txt': self.get_summary().encode('utf-8'),
+            }
+            for file_name, data in files.items():
+                get_storage().upload_memory_file(file_name, io.BytesIO(data), len(data))
+            logger.info(f'Профиль отчёта загружен: {base_path}.prof')
+        except Exception:
+            logger.warning(f'Не удалось загрузить профиль отчёта:\n{traceback.format_exc()}')
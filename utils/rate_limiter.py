@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import logging
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+from settings import RATE_LIMIT_DIR, APPMETRICA_RATE_LIMIT, DIRECT_RATE_LIMIT, RATE_LIMIT_BURST
+
+# fcntl доступен только на Unix: на других системах ограничение действует в пределах одного процесса
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# состояние бакета в файле: (количество токенов, время последнего пополнения)
+STATE_FORMAT = 'dd'
+STATE_SIZE = struct.calcsize(STATE_FORMAT)
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов (token bucket), общий для всех воркеров хоста.
+    Состояние бакета хранится в файле, доступ к нему - под эксклюзивной блокировкой flock,
+    поэтому все процессы, использующие один каталог состояния, расходуют общий бюджет
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float, state_dir: str = RATE_LIMIT_DIR):
+        """
+        :param name: имя бакета (API и токен)
+        :param rate: скорость пополнения, запросов в секунду
+        :param capacity: максимальное количество токенов (допустимый всплеск запросов)
+        :param state_dir: каталог с файлами состояния бакетов
+        """
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.path = Path(state_dir) / f'{name}.bucket'
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread_lock = threading.Lock()
+
+    def _take(self, tokens: float) -> float:
+        """
+        Попытка списать токены
+        :param tokens:
+        :return: 0, если токены списаны, иначе время ожидания (в секундах) до их появления
+        """
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+
+            now = time.time()
+            data = os.pread(fd, STATE_SIZE, 0)
+            available, updated_at = struct.unpack(STATE_FORMAT, data) if len(data) == STATE_SIZE else (
+                self.capacity, now)
+            available = min(self.capacity, available + (now - updated_at) * self.rate)
+
+            wait = 0.0
+            if available >= tokens:
+                available -= tokens
+            else:
+                wait = (tokens - available) / self.rate
+
+            os.pwrite(fd, struct.pack(STATE_FORMAT, available, now), 0)
+            return wait
+        finally:
+            os.close(fd)
+
+    def acquire(self, tokens: float = 1.0):
+        """
+        Ожидание и списание токенов перед запросом
+        :param tokens:
+        :return:
+        """
+        start_time = time.monotonic()
+        with self._thread_lock:
+            while wait := self._take(tokens):
+                time.sleep(wait)
+
+        waited = time.monotonic() - start_time
+        if waited >= 1:
+            logger.info(f'Ограничение частоты запросов "{self.name}": ожидание {round(waited, 2)} cек')
+
+    async def acquire_async(self, tokens: float = 1.0):
+        """
+        Ожидание и списание токенов перед запросом без блокировки цикла событий
+        :param tokens:
+        :return:
+        """
+        start_time = time.monotonic()
+        while wait := self._take(tokens):
+            await asyncio.sleep(wait)
+
+        waited = time.monotonic() - start_time
+        if waited >= 1:
+            logger.info(f'Ограничение частоты запросов "{self.name}": ожидание {round(waited, 2)} cек')
+
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+# скорость пополнения бакетов по API, запросов в секунду
+API_RATE_LIMITS = {
+    'appmetrica': APPMETRICA_RATE_LIMIT,
+    'direct': DIRECT_RATE_LIMIT,
+}
+
+
+def get_rate_limiter(api: str, token: str | None) -> RateLimiter | None:
+    """
+    Ограничитель частоты запросов к API для токена (у каждой пары API + токен отдельный бюджет)
+    :param api: appmetrica или direct
+    :param token: токен авторизации (в имени бакета используется только его хэш)
+    :return: None, если ограничение для API отключено
+    """
+    rate = API_RATE_LIMITS.get(api, 0)
+    if rate <= 0:
+        return None
+
+    token_hash = hashlib.sha1((token or '').encode('utf-8')).hexdigest()[:12]
+    name = f'{api}_{token_hash}'
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = RateLimiter(name, rate, max(1.0, rate * RATE_LIMIT_BURST))
+        return _limiters[name]
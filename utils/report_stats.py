@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+# resource доступен только на Unix: на других системах пиковое потребление памяти не записывается
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# открытые этапы текущего контекста: (сборщик, запись этапа), ...; у каждой задачи asyncio своя копия контекста,
+# поэтому этапы параллельных задач не учитывают данные друг друга
+_open_stages: ContextVar[tuple] = ContextVar('report_stats_open_stages', default=())
+
+# интервал замеров потребления памяти для пика этапа, секунд
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+def get_rss_mb() -> float | None:
+    """
+    Текущее потребление оперативной памяти процессом (RSS), МБ. Читается из /proc/self/statm (Linux),
+    на других системах не записывается
+    :return:
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            resident_pages = int(file.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024, 1)
+
+
+def get_peak_rss_mb() -> float | None:
+    """
+    Пиковое потребление оперативной памяти процессом (RSS) с момента запуска, МБ.
+    Не уменьшается, поэтому для этапов отчёта в долгоживущем воркере используется get_rss_mb
+    :return:
+    """
+    if resource is None:
+        return None
+    # ru_maxrss в Linux - в килобайтах
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class _RssSampler:
+    """
+    Фоновый поток, обновляющий пиковое потребление памяти (peak_rss_mb) всех открытых этапов.
+    Пик процесса (VmHWM) не используется: его сброс общий для процесса и стёр бы пик вложенных
+    и параллельных этапов. Поток работает, пока открыт хотя бы один этап
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._records: dict[int, dict] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def add(self, record: dict):
+        with self._lock:
+            self._records[id(record)] = record
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+                self._thread.start()
+
+    def remove(self, record: dict):
+        with self._lock:
+            self._records.pop(id(record), None)
+
+    def _run(self):
+        while True:
+            rss = get_rss_mb()
+            with self._lock:
+                if not self._records:
+                    self._thread = None
+                    return
+                if rss is not None:
+                    for record in self._records.values():
+                        record['peak_rss_mb'] = max(record.get('peak_rss_mb') or rss, rss)
+            time.sleep(self.interval)
+
+
+_rss_sampler = _RssSampler(RSS_SAMPLE_INTERVAL)
+
+
+class ReportStats:
+    """
+    Сбор показателей этапов формирования отчёта: время выполнения, объём загруженных из API данных,
+    количество прочитанных строк, пиковое потребление памяти процессом во время этапа (peak_rss_mb,
+    замеры каждые RSS_SAMPLE_INTERVAL секунд), потребление на момент окончания этапа (rss_mb)
+    и его изменение за этап (rss_delta_mb).
+    Этапы могут быть вложенными: загруженные байты и строки учитываются во всех открытых этапах текущего
+    контекста (задачи asyncio или потока; для работы в executor контекст передаётся через contextvars.copy_context)
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: list[dict] = []
+
+    @contextmanager
+    def stage(self, name: str, detail: str = None) -> Iterator[dict]:
+        """
+        Замер этапа
+        :param name: имя этапа
+        :param detail: уточнение (например, метрики запроса к API)
+        :return: запись этапа
+        """
+        record = {'stage': name, 'bytes': 0, 'rows': 0}
+        if detail:
+            record['detail'] = detail
+        self.stages.append(record)
+        token = _open_stages.set(_open_stages.get() + ((self, record),))
+
+        start_rss = get_rss_mb()
+        record['peak_rss_mb'] = start_rss
+        _rss_sampler.add(record)
+        start_time = time.perf_counter()
+        try:
+            yield record
+        except Exception:
+            record['error'] = True
+            raise
+        finally:
+            record['seconds'] = round(time.perf_counter() - start_time, 3)
+            _rss_sampler.remove(record)
+            record['rss_mb'] = get_rss_mb()
+            if start_rss is not None and record['rss_mb'] is not None:
+                record['rss_delta_mb'] = round(record['rss_mb'] - start_rss, 1)
+                record['peak_rss_mb'] = max(record['peak_rss_mb'] or start_rss, record['rss_mb'])
+            _open_stages.reset(token)
+
+    def _current_records(self) -> Iterator[dict]:
+        return (record for owner, record in _open_stages.get() if owner is self)
+
+    def add_bytes(self, count: int):
+        for record in self._current_records():
+            record['bytes'] += count
+
+    def add_rows(self, count: int):
+        for record in self._current_records():
+            record['rows'] += count
+
+    def to_dict(self) -> dict:
+        """
+        Показатели для сохранения в отчёте (поле Report.stats)
+        :return:
+        """
+        return {
+            'total_seconds': round(time.perf_counter() - self.started, 3),
+            'rss_mb': get_rss_mb(),
+            'stages': self.stages,
+        }
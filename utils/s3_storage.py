@@ -1,5 +1,7 @@
 from datetime import timedelta
+from functools import lru_cache
 from io import BytesIO
+from typing import BinaryIO
 
 from settings import (
     ACCESS_KEY,
@@ -8,9 +10,12 @@ from settings import (
     MINIO_SECURE,
     OUTER_ENDPOINT_URL,
     SECRET_KEY,
+    S3_PART_SIZE,
 )
 from minio import Minio
 
+from utils.metrics import S3_UPLOAD_DURATION, S3_UPLOAD_ERRORS, observe
+
 
 class MyStorage:
     def __init__(
@@ -41,11 +46,36 @@ class MyStorage:
         """
         self.client.fput_object(bucket_name, file_name, file_path)
 
+    @observe(S3_UPLOAD_DURATION, S3_UPLOAD_ERRORS, method='upload_memory_file')
     def upload_memory_file(
             self, file_name: str, data: BytesIO, length: int, bucket_name: str = BUCKET_NAME
     ):
         self.client.put_object(bucket_name, file_name, data, length)
 
+    @observe(S3_UPLOAD_DURATION, S3_UPLOAD_ERRORS, method='upload_stream')
+    def upload_stream(
+            self, file_name: str, data: BinaryIO, part_size: int = S3_PART_SIZE, bucket_name: str = BUCKET_NAME
+    ):
+        """
+        Потоковая multipart-загрузка файлового объекта неизвестной длины в S3-хранилище.
+        В памяти одновременно находится не более одной части размером part_size
+        :param file_name:
+        :param data: файловый объект, открытый на чтение в бинарном режиме
+        :param part_size: размер части в байтах (не менее 5 МБ)
+        :param bucket_name:
+        :return: None
+        """
+        self.client.put_object(bucket_name, file_name, data, length=-1, part_size=part_size)
+
+    def remove_file(self, file_name: str, bucket_name: str = BUCKET_NAME):
+        """
+        Удаление файла из S3-хранилища
+        :param file_name:
+        :param bucket_name:
+        :return: None
+        """
+        self.client.remove_object(bucket_name, file_name)
+
     def share_file_from_bucket(
             self, file_name, expire=timedelta(seconds=60), bucket_name=BUCKET_NAME
     ):
@@ -60,4 +90,9 @@ class MyStorage:
         return f"http{'s' if MINIO_SECURE else ''}://{OUTER_ENDPOINT_URL}/minio/{bucket_name}/{file_name}"
 
 
-storage = MyStorage(ENDPOINT_URL, ACCESS_KEY, SECRET_KEY, BUCKET_NAME)
+@lru_cache(maxsize=None)
+def get_storage() -> MyStorage:
+    """
+    Хранилище отчётов (создаётся при первом обращении, чтобы импорт модуля не требовал настроек S3)
+    """
+    return MyStorage(ENDPOINT_URL, ACCESS_KEY, SECRET_KEY, BUCKET_NAME)
@@ -5,6 +5,7 @@ import string
 import numpy as np
 import pandas as pd
 import xlsxwriter
+from xlsxwriter.format import Format
 from xlsxwriter.worksheet import Worksheet
 
 logger = logging.getLogger(__name__)
@@ -14,6 +15,8 @@ class CreateXlsx:
     def __init__(self, workbook: xlsxwriter.Workbook, header: str):
         self.workbook = workbook
         self.header = header
+        # режим constant_memory: строки сбрасываются на диск по мере записи, запись допускается строго по порядку
+        self.constant_memory = workbook.constant_memory
 
         self.header_format = workbook.add_format(
             {'bold': True, 'align': 'center', 'text_wrap': True, 'valign': 'vcenter', 'font_size': 11, 'border': 2,
@@ -33,6 +36,39 @@ class CreateXlsx:
         self.total_percent_format = workbook.add_format({'num_format': '0.00%', 'align': 'center', 'valign': 'vcenter',
                                                          'border': 2})
 
+        # карта форматов колонок листов "Все кампании" и "Группы кампаний":
+        # номер колонки -> (формат строки итогов, формат строк кампаний)
+        text_formats = (self.text_format, self.text_format)
+        number_formats = (self.total_number_format, self.number_format)
+        percent_formats = (self.total_percent_format, self.percent_format)
+        self.campaigns_columns_formats = {
+            0: text_formats, 1: text_formats,
+            2: number_formats, 3: number_formats, 5: number_formats, 6: number_formats, 8: number_formats,
+            4: percent_formats, 12: percent_formats, 13: percent_formats, 14: percent_formats,
+        }
+        # формат для остальных колонок
+        self.campaigns_default_formats = (self.total_float_format, self.float_format)
+
+    def _write_columns(self, sheet: Worksheet, first_row: int, columns: list[np.ndarray], formats: list[Format]):
+        """
+        Метод записывает данные на лист поколоночно (write_column), начиная с колонки A.
+        В режиме constant_memory запись ведётся построчно, т.к. уже сброшенные на диск строки изменить нельзя
+        :param sheet: xlsx-лист
+        :param first_row: номер строки, с которой начинается запись
+        :param columns: значения колонок (массивы numpy)
+        :param formats: форматы колонок (по одному на колонку)
+        :return:
+        """
+        if self.constant_memory:
+            formats = list(formats)
+            for row, values in enumerate(zip(*(values.tolist() for values in columns)), start=first_row):
+                for col, (data, cell_format) in enumerate(zip(values, formats)):
+                    sheet.write(row, col, data, cell_format)
+            return
+
+        for col, (values, cell_format) in enumerate(zip(columns, formats)):
+            sheet.write_column(first_row, col, values.tolist(), cell_format)
+
     def _write_campaigns_header(self, sheet: Worksheet):
         """
         Метод формирует заголовки для первых двух листов отчёта
@@ -71,29 +107,15 @@ class CreateXlsx:
         self._write_campaigns_header(general_sheet)
         general_params = general_params.fillna(0)
 
-        for row, i in enumerate(range(len(general_params)), start=2):
-            item = general_params.iloc[i]
-            for col, data in enumerate(item):
-                # определение формата ячейки
-                if row == 2:
-                    if col in (0, 1):
-                        cur_format = self.text_format
-                    elif col in (2, 3, 5, 6, 8):
-                        cur_format = self.total_number_format
-                    elif col in (4, 12, 13, 14):
-                        cur_format = self.total_percent_format
-                    else:
-                        cur_format = self.total_float_format
-                else:
-                    if col in (0, 1):
-                        cur_format = self.text_format
-                    elif col in (2, 3, 5, 6, 8):
-                        cur_format = self.number_format
-                    elif col in (4, 12, 13, 14):
-                        cur_format = self.percent_format
-                    else:
-                        cur_format = self.float_format
-                general_sheet.write(row, col, data, cur_format)
+        columns = [general_params[col].to_numpy() for col in general_params.columns]
+        formats = [self.campaigns_columns_formats.get(col, self.campaigns_default_formats)
+                   for col in range(len(columns))]
+
+        # первая строка (итого и средние) и строки кампаний
+        self._write_columns(general_sheet, 2, [values[:1] for values in columns],
+                            [total_format for total_format, _ in formats])
+        self._write_columns(general_sheet, 3, [values[1:] for values in columns],
+                            [row_format for _, row_format in formats])
 
         # условное форматирование
         # строка итого и средние
@@ -121,10 +143,8 @@ class CreateXlsx:
             return
 
         # запись данных
-        for row, i in enumerate(range(len(installs_sessions_by_week)), start=1):
-            item = installs_sessions_by_week.iloc[i]
-            for col, data in enumerate(item):
-                distribution_sheet.write(row, col, data, self.number_format)
+        columns = [installs_sessions_by_week[col].to_numpy() for col in installs_sessions_by_week.columns]
+        self._write_columns(distribution_sheet, 1, columns, [self.number_format] * len(columns))
 
         # добавление графика
         chart = self.workbook.add_chart({"type": "scatter", "subtype": "smooth_with_markers"})
@@ -204,16 +224,11 @@ class CreateXlsx:
             retention_sheet.write(0, i, header, self.header_format)
 
         # запись данных
-        for row, i in enumerate(range(len(retention_df)), start=1):
-            item = retention_df.iloc[i]
-            for col, data in enumerate(item):
-                if col in range(2, cols_count):
-                    # переводим в процентное соотношение, форматируем
-                    retention_sheet.write(row, col, data / 100, self.percent_format)
-                elif col == 0:
-                    retention_sheet.write(row, col, data, self.text_format)
-                else:
-                    retention_sheet.write(row, col, data, self.number_format)
+        columns = [retention_df[col].to_numpy() for col in retention_df.columns]
+        # колонки retention переводим в процентное соотношение
+        columns[2:] = [values / 100 for values in columns[2:]]
+        formats = [self.text_format, self.number_format] + [self.percent_format] * (cols_count - 2)
+        self._write_columns(retention_sheet, 1, columns, formats)
 
         # добавление графика
         chart = self.workbook.add_chart({"type": "line"})
@@ -255,13 +270,13 @@ class CreateXlsx:
         events_sheet.write(0, 3, 'Событий на пользователя', self.header_format)
         events_sheet.write(0, 4, 'Доля от всех пользователей', self.header_format)
 
-        events.sort_values('count_event', inplace=True, ascending=False)
-        for i in range(1, len(events)):
-            events_sheet.write(i, 0, events.iloc[i].event, self.text_format)
-            events_sheet.write(i, 1, events.iloc[i].count_event, self.number_format)
-            events_sheet.write(i, 2, events.iloc[i].users, self.number_format)
-            events_sheet.write(i, 3, events.iloc[i].event_per_user, self.float_format)
-            events_sheet.write(i, 4, events.iloc[i].perc_all_users, self.percent_format)
+        # первая строка после сортировки (строка итогов) не выводится
+        events = events.sort_values('count_event', ascending=False).iloc[1:]
+        columns = [events[col].to_numpy() for col in ('event', 'count_event', 'users', 'event_per_user',
+                                                       'perc_all_users')]
+        formats = [self.text_format, self.number_format, self.number_format, self.float_format,
+                   self.percent_format]
+        self._write_columns(events_sheet, 1, columns, formats)
 
         # условное форматирование
         for col in string.ascii_uppercase[1:5]:
@@ -270,113 +285,45 @@ class CreateXlsx:
         # events_sheet.autofit(400)
         logger.info('Успех.')
 
-    def write_installs_by_regions(self, installs_info: pd.DataFrame = None):
-        logger.info('Записываю лист "Регионы (Установки)"')
-        installs_by_regions_sheet = self.workbook.add_worksheet('Регионы (Установки)')
-
-        if installs_info.empty:
-            installs_by_regions_sheet.merge_range('A2:C2', 'Недостаточно данных для вывода', self.text_format)
-            logger.warning('Недостаточно данных для вывода')
-            return
-
-        installs_by_regions_sheet.set_column(f'A:A', 25)
-        installs_by_regions_sheet.set_column(f'B:B', 20)
-        installs_by_regions_sheet.set_row(0, 60)
-
-        # группируем данные по региону
-        regions = installs_info.drop(columns=['oc', 'device_type'])
-        regions = regions.groupby('city').sum().reset_index()
-        regions = regions.sort_values(by='installs', ascending=False).reset_index(drop=True)
-        regions = regions.drop(index=[0], errors='ignore')
-
-        # запись заголовка
-        installs_by_regions_sheet.write(0, 0, 'Город', self.header_format)
-        installs_by_regions_sheet.write(0, 1, 'Количество установок', self.header_format)
-
-        # запись данных
-        for row, i in enumerate(range(len(regions)), start=1):
-            item = regions.iloc[i]
-            for col, data in enumerate(item):
-                if col == 0:
-                    installs_by_regions_sheet.write(row, col, data, self.text_format)
-                else:
-                    installs_by_regions_sheet.write(row, col, data, self.number_format)
-
-        # условное форматирование
-        installs_by_regions_sheet.conditional_format(f'B2:B{len(regions) + 1}', {'type': '3_color_scale'})
-
-        logger.info('Успех.')
-
-    def write_installs_by_oc(self, installs_info: pd.DataFrame):
-        logger.info('Записываю лист "ОС (Установки)"')
-        installs_by_oc_sheet = self.workbook.add_worksheet('ОС (Установки)')
+    def _write_installs_breakdown(self, sheet_name: str, label_header: str, installs_df: pd.DataFrame):
+        """
+        Метод формирует лист с распределением установок по одному измерению (регион, ОС, марка)
+        :param sheet_name: имя листа
+        :param label_header: заголовок колонки с измерением
+        :param installs_df: DataFrame из двух колонок (значение измерения, количество установок),
+        отсортированный по убыванию установок
+        :return:
+        """
+        logger.info(f'Записываю лист "{sheet_name}"')
+        installs_sheet = self.workbook.add_worksheet(sheet_name)
 
-        if installs_info.empty:
-            installs_by_oc_sheet.merge_range('A2:C2', 'Недостаточно данных для вывода', self.text_format)
+        if installs_df.empty:
+            installs_sheet.merge_range('A2:C2', 'Недостаточно данных для вывода', self.text_format)
             logger.warning('Недостаточно данных для вывода')
             return
 
-        installs_by_oc_sheet.set_column(f'A:A', 25)
-        installs_by_oc_sheet.set_column(f'B:B', 20)
-        installs_by_oc_sheet.set_row(0, 60)
-
-        # группируем данные по операционной системе
-        oc_df = installs_info.drop(columns=['city', 'device_type'])
-        oc_df = oc_df.groupby('oc').sum().reset_index()
-        oc_df = oc_df.sort_values(by='installs', ascending=False).reset_index(drop=True)
-        oc_df = oc_df.drop(index=[0])
+        installs_sheet.set_column(f'A:A', 25)
+        installs_sheet.set_column(f'B:B', 20)
+        installs_sheet.set_row(0, 60)
 
         # запись заголовка
-        installs_by_oc_sheet.write(0, 0, 'Операционная система', self.header_format)
-        installs_by_oc_sheet.write(0, 1, 'Количество установок', self.header_format)
+        installs_sheet.write(0, 0, label_header, self.header_format)
+        installs_sheet.write(0, 1, 'Количество установок', self.header_format)
 
         # запись данных
-        for row, i in enumerate(range(len(oc_df)), start=1):
-            item = oc_df.iloc[i]
-            for col, data in enumerate(item):
-                if col == 0:
-                    installs_by_oc_sheet.write(row, col, data, self.text_format)
-                else:
-                    installs_by_oc_sheet.write(row, col, data, self.number_format)
+        columns = [installs_df[col].to_numpy() for col in installs_df.columns]
+        self._write_columns(installs_sheet, 1, columns, [self.text_format, self.number_format])
 
         # условное форматирование
-        installs_by_oc_sheet.conditional_format(f'B2:B{len(oc_df) + 1}', {'type': '3_color_scale'})
+        installs_sheet.conditional_format(f'B2:B{len(installs_df) + 1}', {'type': '3_color_scale'})
 
         logger.info('Успех.')
 
-    def write_installs_by_brand(self, installs_info: pd.DataFrame):
-        logger.info('Записываю лист "Марка (Установки)"')
-        installs_by_brand_sheet = self.workbook.add_worksheet('Марка (Установки)')
-
-        if installs_info.empty:
-            installs_by_brand_sheet.merge_range('A2:C2', 'Недостаточно данных для вывода', self.text_format)
-            logger.warning('Недостаточно данных для вывода')
-            return
-
-        installs_by_brand_sheet.set_column(f'A:A', 25)
-        installs_by_brand_sheet.set_column(f'B:B', 20)
-        installs_by_brand_sheet.set_row(0, 60)
+    def write_installs_by_regions(self, installs_by_regions: pd.DataFrame):
+        self._write_installs_breakdown('Регионы (Установки)', 'Город', installs_by_regions)
 
-        # группируем данные по операционной системе
-        brand_df = installs_info.drop(columns=['city', 'oc'])
-        brand_df = brand_df.groupby('device_type').sum().reset_index()
-        brand_df = brand_df.sort_values(by='installs', ascending=False).reset_index(drop=True)
-        brand_df = brand_df.drop(index=[0])
+    def write_installs_by_oc(self, installs_by_oc: pd.DataFrame):
+        self._write_installs_breakdown('ОС (Установки)', 'Операционная система', installs_by_oc)
 
-        # запись заголовка
-        installs_by_brand_sheet.write(0, 0, 'Бренд устройства', self.header_format)
-        installs_by_brand_sheet.write(0, 1, 'Количество установок', self.header_format)
-
-        # запись данных
-        for row, i in enumerate(range(len(brand_df)), start=1):
-            item = brand_df.iloc[i]
-            for col, data in enumerate(item):
-                if col == 0:
-                    installs_by_brand_sheet.write(row, col, data, self.text_format)
-                else:
-                    installs_by_brand_sheet.write(row, col, data, self.number_format)
-
-        # условное форматирование
-        installs_by_brand_sheet.conditional_format(f'B2:B{len(brand_df) + 1}', {'type': '3_color_scale'})
-
-        logger.info('Успех.')
+    def write_installs_by_brand(self, installs_by_brand: pd.DataFrame):
+        self._write_installs_breakdown('Марка (Установки)', 'Бренд устройства', installs_by_brand)